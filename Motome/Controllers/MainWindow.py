@@ -7,6 +7,7 @@ from __future__ import absolute_import
 import logging
 import os
 import shutil
+import sqlite3
 import sys
 import time
 import cPickle as pickle
@@ -25,16 +26,20 @@ from Motome.Views.MainWindow import Ui_MainWindow
 
 # Import configuration values
 from Motome.config import NOTE_EXTENSION, MEDIA_FOLDER, APP_DIR, WINDOW_TITLE, VERSION, \
-    NOTE_DATA_DIR, HTML_FOLDER, HTML_EXTENSION, MOTOME_BLUE, DEFAULT_NOTES_DIR
+    NOTE_DATA_DIR, HTML_FOLDER, HTML_EXTENSION, MOTOME_BLUE, DEFAULT_NOTES_DIR, SEARCH_RANK_RESULTS, \
+    SEARCH_RESULTS_LIMIT, SEARCH_ENGINE
 
 # Import additional modules
 from Motome.Models.NoteModel import NoteModel
+from Motome.Models.NoteIndex import NoteIndex
+from Motome.Models.NoteCatalog import NoteCatalog
+from Motome.Models.FullTextIndex import FullTextIndex
 from Motome.Models.NoteListWidget import NoteListWidget
 from Motome.Models.MotomeTextBrowser import MotomeTextBrowser
 from Motome.Models.AutoCompleterModel import AutoCompleteEdit
 from Motome.Models.Search import SearchModel
 from Motome.Models.Utils import build_preview_footer_html, build_preview_header_html, \
-    diff_to_html, human_date, pickle_find_NoteModel, history_timestring_to_datetime, clean_filename
+    diff_to_html, human_date, pickle_find_NoteModel, history_timestring_to_datetime, clean_filename, count_stat_calls
 
 # Set up the logger
 logger = logging.getLogger(__name__)
@@ -85,6 +90,12 @@ class MainWindow(QtGui.QMainWindow):
         # session notes dict
         self.session_notes_dict = {}
 
+        # session notes word index
+        self.session_note_index = NoteIndex()
+
+        # session notes full text index, only used with the full text search engine
+        self.session_fulltext_index = None
+
         # revision note content
         self.old_data = None
 
@@ -113,6 +124,7 @@ class MainWindow(QtGui.QMainWindow):
         self.notesList = None
         self.noteEditor = None
         self.tagEditor = None
+        self.tag_completer_list = []
         self.notesLocationsList = None
 
         # setup GUI elements
@@ -125,6 +137,7 @@ class MainWindow(QtGui.QMainWindow):
         self.setup_diff()
         self.setup_history()
         self.insert_ui_noteslist()
+        self.insert_ui_indexprogress()
         self.insert_ui_noteeditor()
         self.insert_ui_tageditor()
         self.insert_ui_notesLocationsList()
@@ -139,7 +152,11 @@ class MainWindow(QtGui.QMainWindow):
         else:
             self.load_session_data()
             self.noteEditor.session_notemodel_dict = self.session_notes_dict
+            self.notesList.session_notemodel_dict = self.session_notes_dict
+            self.notesList.session_note_index = self.session_note_index
+            self.notesList.session_fulltext_index = self.session_fulltext_index
             self.notesList.notes_dir = self.notes_dir
+            self.insert_ui_tagcompleter()
 
         # set the focus to the window frame
         self.setFocus(QtCore.Qt.ActiveWindowFocusReason)
@@ -147,11 +164,14 @@ class MainWindow(QtGui.QMainWindow):
     @property
     def current_note(self):
         try:
-            return self.notesList.currentItem().notemodel
+            return self.notesList.current_note
         except AttributeError:
             return None
 
     def stop(self):
+        # the notes not read yet are read again next time
+        self.notesList.bulk_indexer.stop()
+
         if self.noteEditor.save_timer.isActive():
             self.noteEditor.save_note()
 
@@ -162,11 +182,18 @@ class MainWindow(QtGui.QMainWindow):
         self.save_timer.stop()
 
         if self.record_on_exit:
-            unrecorded = (nw.notemodel for nw in self.notesList.all_items if not nw.notemodel.recorded)
-            for note in unrecorded:
-                note.record()
+            # the records still queued change which notes are recorded
+            self.notesList.file_worker.wait()
+            unrecorded = self.notesList.unrecorded_notes()
+            NoteModel.record_notes(unrecorded, worker=self.notesList.file_worker)
 
         self.save_session_data()
+        try:
+            self.session_notes_dict.close()
+        except AttributeError:
+            pass
+        if self.session_fulltext_index is not None:
+            self.session_fulltext_index.close()
 
         # set the current notes directory to be the default next time
         self.conf['conf_notesLocation'] = self.notes_dir
@@ -273,7 +300,17 @@ class MainWindow(QtGui.QMainWindow):
         if self.notes_dir != '':
             self.notesList.notes_dir = self.notes_dir
         self.ui.verticalLayout_3.insertWidget(0, self.notesList)
-        self.notesList.itemSelectionChanged.connect(self.update_ui_views)
+        self.notesList.current_note_changed.connect(self.update_ui_views)
+        # re-apply any search to notes changed outside of Motome
+        self.notesList.notes_changed.connect(self.search_notes)
+
+    def insert_ui_indexprogress(self):
+        self.indexProgress = QtGui.QProgressBar()
+        self.indexProgress.setFormat('Reading notes %v/%m')
+        self.indexProgress.setVisible(False)
+        self.ui.verticalLayout_3.insertWidget(1, self.indexProgress)
+        self.notesList.bulk_indexer.progress.connect(self.update_ui_indexprogress)
+        self.notesList.bulk_indexer.finished.connect(self.indexProgress.hide)
 
     def insert_ui_noteeditor(self):
         # insert the custom text editor
@@ -299,15 +336,15 @@ class MainWindow(QtGui.QMainWindow):
         self.tagEditor.textEdited.connect(self.start_meta_save)
 
     def insert_ui_tagcompleter(self):
-        # build the completer list
-        completer_list = set()
+        # build the completer list from the tag index
         try:
-            for note in self.session_notes_dict.values():
-                if 'tags' in note.metadata.keys():
-                    for t in note.metadata['tags'].split():
-                        completer_list.add(t)
+            completer_list = self.notesList.session_note_index.tags
+            if completer_list == self.tag_completer_list:
+                # no new or removed tags
+                return
+            self.tag_completer_list = completer_list
             # attach a completer to the tag editor
-            qlist = QtGui.QStringListModel(list(completer_list))
+            qlist = QtGui.QStringListModel(completer_list)
             self.tagEditor.setCompleterModel(qlist)
         except AttributeError:
             pass
@@ -331,26 +368,95 @@ class MainWindow(QtGui.QMainWindow):
             pass
 
     def load_session_data(self):
+        if self.notes_data_dir == '':
+            # no notes directory yet
+            self.session_notes_dict = dict()
+            self.session_note_index = NoteIndex()
+            self.load_fulltext_index()
+            return
+
+        catalog_path = os.path.join(self.notes_data_dir, 'Motome_catalog.db')
+        if isinstance(self.session_notes_dict, NoteCatalog):
+            if self.session_notes_dict.filepath == catalog_path:
+                # already open
+                self.load_fulltext_index()
+                return
+            self.session_notes_dict.close()
+
+        new_catalog = not os.path.exists(catalog_path)
+        try:
+            self.session_notes_dict = NoteCatalog(catalog_path, self.notes_dir)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning('[load_session_data] %r' % e)
+            self.session_notes_dict = dict()
+        else:
+            if new_catalog:
+                self.import_session_pickle()
+        if isinstance(self.session_notes_dict, NoteCatalog):
+            # the word index is kept in the catalog database and committed with it
+            self.session_note_index = self.session_notes_dict.index
+        else:
+            self.session_note_index = NoteIndex()
+        self.load_fulltext_index()
+
+    def load_fulltext_index(self):
+        """ Open the full text index of the notes directory when that search engine is chosen, close it otherwise
+        """
+        fulltext_path = os.path.join(self.notes_data_dir, 'Motome_fulltext.db')
+        if self.session_fulltext_index is not None:
+            if self.search_engine == 'fulltext' and self.session_fulltext_index.filepath == fulltext_path:
+                # already open
+                return
+            self.session_fulltext_index.close()
+            self.session_fulltext_index = None
+
+        if self.search_engine != 'fulltext' or self.notes_data_dir == '':
+            return
+        if not FullTextIndex.is_available():
+            logger.warning('[load_fulltext_index] sqlite3 was built without FTS5, using the word index')
+            return
         try:
-            with open(os.path.join(self.notes_data_dir, 'Motome_data.fs'), 'rb') as data_file:
+            self.session_fulltext_index = FullTextIndex(fulltext_path)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning('[load_fulltext_index] %r' % e)
+
+    def import_session_pickle(self):
+        """ Move the notes from the pickled session data of older versions into the catalog
+        """
+        pickle_path = os.path.join(self.notes_data_dir, 'Motome_data.fs')
+        try:
+            with open(pickle_path, 'rb') as data_file:
                 # Practice safer unpickling by making sure the UnPickler only loads NoteModel objects
                 unp = pickle.Unpickler(data_file)
                 unp.find_global = pickle_find_NoteModel
-                self.session_notes_dict = unp.load()
+                old_notes_dict = unp.load()
         except IOError:
-            self.session_notes_dict = dict()
+            return
         except pickle.UnpicklingError as e:
-            logger.warning('[load_session_data] %r' % e)
+            logger.warning('[import_session_pickle] %r' % e)
+            return
+
+        for filename, note in old_notes_dict.iteritems():
+            self.session_notes_dict[filename] = note
+        self.session_notes_dict.commit()
+        if self.session_notes_dict.is_saved:
+            try:
+                os.remove(pickle_path)
+            except OSError as e:
+                logger.warning('[import_session_pickle] %r' % e)
 
     def save_session_data(self):
+        # the queued saves and records update the notes' catalog rows and index entries when they're done
+        self.notesList.file_worker.wait()
+        self.session_notes_dict = self.notesList.session_notemodel_dict
         try:
-            self.session_notes_dict = self.notesList.session_notemodel_dict
-            with open(os.path.join(self.notes_data_dir, 'Motome_data.fs'), 'wb') as data_file:
-                pickle.dump(self.session_notes_dict, data_file, -1)
-        except IOError:
-            os.makedirs(self.notes_data_dir)
-            with open(os.path.join(self.notes_data_dir, 'Motome_data.fs'), 'wb') as data_file:
-                pickle.dump(self.session_notes_dict, data_file, -1)
+            self.session_notes_dict.commit()
+        except AttributeError:
+            # not a catalog, no notes directory yet
+            pass
+        self.session_note_index = self.notesList.session_note_index
+        if self.session_fulltext_index is not None:
+            self.session_fulltext_index.commit()
 
     def load_conf(self):
         filepath = os.path.join(self.app_data_dir, 'conf.yml')
@@ -403,6 +509,11 @@ class MainWindow(QtGui.QMainWindow):
         else:
             self.first_line_title = False
 
+        if 'conf_search_engine' in self.conf.keys():
+            self.search_engine = self.conf['conf_search_engine']
+        else:
+            self.search_engine = SEARCH_ENGINE
+
         # Set the window location and size
         if 'window_x' in self.conf.keys() and not self.portable_mode:
             rect = QtCore.QRect(int(self.conf['window_x']),
@@ -476,9 +587,13 @@ class MainWindow(QtGui.QMainWindow):
                             self.conf[name] = 0
                         else:
                             self.conf[name] = 1
+                    elif name == 'conf_search_engine':
+                        self.conf[name] = c.itemData(c.currentIndex())
                     else:
                         pass
             self.save_conf()
+            # the notes directory open now keeps its session data before another one may be opened
+            self.save_session_data()
             self.set_config_vars()
             # set the notes directories
             try:
@@ -508,7 +623,10 @@ class MainWindow(QtGui.QMainWindow):
             self.load_session_data()
             # update the notes list
             self.notesList.session_notemodel_dict = self.session_notes_dict
+            self.notesList.session_note_index = self.session_note_index
+            self.notesList.session_fulltext_index = self.session_fulltext_index
             self.notesList.notes_dir = self.notes_dir
+            self.insert_ui_tagcompleter()
             # clear the note editor
             self.noteEditor.blockSignals(True)
             self.noteEditor.setHtml('')
@@ -586,40 +704,32 @@ class MainWindow(QtGui.QMainWindow):
 
         :param direction: which direction to move 'up' or 'down'
         """
-        what_rownums = [self.notesList.row(i) for i in self.notesList.all_visible_items]
-        if len(what_rownums) <= 0:
-            return
-
-        current_row = self.notesList.currentRow()
-        row_count = self.notesList.count()
-        next_row = current_row
-        while True:
-            if direction == 'down' and next_row > 0:
-                next_row -= 1
-            elif direction == 'down' and next_row == 0:
-                next_row = row_count - 1
-            elif direction == 'up' and next_row < row_count - 1:
-                next_row += 1
-            elif direction == 'up' and next_row == row_count - 1:
-                next_row = 0
-
-            if next_row in what_rownums:
-                break
-        self.notesList.setCurrentRow(next_row)
+        if direction == 'down':
+            self.notesList.select_next(-1)
+        elif direction == 'up':
+            self.notesList.select_next(1)
 
     def update_notesdir(self, location_val):
         try:
             location_key = [k for k, v in self.conf['conf_notesLocations'].iteritems() if v == location_val][0]
+            # each notes directory has its own session data
+            self.save_session_data()
             self.notes_dir = location_key
+            self.notes_data_dir = os.path.join(self.notes_dir, NOTE_DATA_DIR)
+            self.load_session_data()
+            self.notesList.session_notemodel_dict = self.session_notes_dict
+            self.notesList.session_note_index = self.session_note_index
+            self.notesList.session_fulltext_index = self.session_fulltext_index
             self.notesList.notes_dir = location_key
+            self.insert_ui_tagcompleter()
         except IndexError:
             pass
 
     def update_ui_views(self):
         if self.record_on_switch:
             try:
-                if not self.notesList.previous_item.notemodel.recorded:
-                    self.notesList.previous_item.notemodel.record()
+                if not self.notesList.previous_note.recorded:
+                    self.notesList.previous_note.record(worker=self.notesList.file_worker)
             except AttributeError:
                 pass
 
@@ -648,7 +758,6 @@ class MainWindow(QtGui.QMainWindow):
         # update the preview and diff panes
         self.update_ui_preview()
         self.update_ui_diff()
-        self.update_ui_historyLabel()
 
         # update history information
         self.load_history_data()
@@ -723,7 +832,7 @@ class MainWindow(QtGui.QMainWindow):
     def update_ui_historyLabel(self):
         color = 'rgb({0}, {1}, {2}, {3})'.format(*MOTOME_BLUE.getRgb())
         try:
-            l = len(self.current_note.history)
+            l = self.current_note.history_count
         except AttributeError:
             l = 0
 
@@ -732,6 +841,11 @@ class MainWindow(QtGui.QMainWindow):
             num=l,
             version='versions' if l != 1 else 'version'))
 
+    def update_ui_indexprogress(self, done, total):
+        self.indexProgress.setMaximum(total)
+        self.indexProgress.setValue(done)
+        self.indexProgress.setVisible(True)
+
     def update_notesLocationsList(self):
         self.notesLocationsList.clear()
         self.notesLocationsList.addItems(sorted(self.conf['conf_notesLocations'].values()))
@@ -818,20 +932,37 @@ class MainWindow(QtGui.QMainWindow):
         if rename:
             self.notesList.rename_current_item()
 
+        # pick up any new tags for the completer
+        self.insert_ui_tagcompleter()
+
         # update settings button icon
         self.ui.btnSettings.setIcon(self.setting_button_icons['unsaved'])
 
     def save_the_unsaved(self):
-        heathens = (nw.notemodel for nw in self.notesList.all_items if not nw.notemodel.is_saved)
+        heathens = NoteModel.unsaved_notes()
         for unsaved in heathens:
-            unsaved.save_to_file()
+            # saving changes the note's date, the row moves once the file is written
+            unsaved.save_to_file(worker=self.notesList.file_worker, callback=self.notesList.update_note)
+        self.notesList.suppress_changes(unsaved.filename for unsaved in heathens)
+
+        # write the changed catalog rows, the rows of the notes being saved now are written next time
+        try:
+            self.notesList.session_notemodel_dict.commit()
+        except AttributeError:
+            pass
+        if self.session_fulltext_index is not None:
+            self.session_fulltext_index.commit()
 
         # update settings button icon
         self.ui.btnSettings.setIcon(self.setting_button_icons['default'])
 
     def record_current_note(self):
         if not self.current_note.recorded:
-            self.current_note.record()
+            self.current_note.record(worker=self.notesList.file_worker, callback=self.update_ui_recorded)
+
+    def update_ui_recorded(self, note):
+        # the note may not be the current one any more by the time it's recorded
+        if note is self.current_note:
             self.load_history_data()
             self.update_ui_historyLabel()
 
@@ -840,7 +971,7 @@ class MainWindow(QtGui.QMainWindow):
             self.current_note.pinned = False
         else:
             self.current_note.pinned = True
-        self.notesList.update_list()
+        self.notesList.update_note(self.current_note)
 
     def print_current_pane(self):
         pane_num = self.ui.toolBox.currentIndex()
@@ -859,7 +990,7 @@ class MainWindow(QtGui.QMainWindow):
         tagged_title = self.ui.omniBar.text()
         if tagged_title == '':
             return
-        if len(self.notesList.findItems(tagged_title, QtCore.Qt.MatchWildcard)) > 0:
+        if self.notesList.find_title(tagged_title) is not None:
             return
 
         # build new note name
@@ -887,13 +1018,7 @@ class MainWindow(QtGui.QMainWindow):
 
         self.ui.omniBar.setText('')
         self.query = ''
-        try:
-            item = self.notesList.findItems(tagged_title, QtCore.Qt.MatchWildcard)[0]
-            self.notesList.setCurrentItem(item)
-        except IndexError:
-            for item in self.notesList.all_items[::-1]:
-                if not item.notemodel.pinned:
-                    self.notesList.setCurrentItem(item)
+        self.notesList.select_note(new_note.filename)
 
         # set the focus on the editor and move the cursor to the end
         self.noteEditor.setFocus()
@@ -905,12 +1030,10 @@ class MainWindow(QtGui.QMainWindow):
         url_path = url.path()
 
         # intranote link?
-        f = self.notesList.findItems(url_path, QtCore.Qt.MatchWildcard)
-        try:
-            self.notesList.setCurrentItem(f[0])
+        filename = self.notesList.find_title(url_path)
+        if filename is not None:
+            self.notesList.select_note(filename)
             return
-        except IndexError:
-            pass
 
         media_path = os.path.join(self.notes_dir, MEDIA_FOLDER, url_path.split('/')[-1])
         if os.path.isfile(media_path):
@@ -933,7 +1056,7 @@ class MainWindow(QtGui.QMainWindow):
         """
         self.ui.historySlider.blockSignals(True)
         try:
-            hlen = len(self.current_note.history)
+            hlen = self.current_note.history_count
         except AttributeError:
             hlen = 0
         self.ui.historySlider.setMaximum(hlen)
@@ -965,7 +1088,7 @@ class MainWindow(QtGui.QMainWindow):
     def start_search(self, query):
         self.query = query
 
-        if len(query) > 2 and query[:-1] == ' ':
+        if len(query) > 2 and query[-1] == ' ':
             self.search_notes()
 
         if self.search_timer.isActive():
@@ -979,7 +1102,8 @@ class MainWindow(QtGui.QMainWindow):
             self.notesList.show_all()
         else:
             self.search.query = self.query.lower()
-            self.notesList.search_noteitems(self.search)
+            with count_stat_calls('search notes'):
+                self.notesList.search_noteitems(self.search, ranked=SEARCH_RANK_RESULTS, limit=SEARCH_RESULTS_LIMIT)
 
     def delete_current_note(self):
         self.notesList.delete_current_item()
@@ -12,6 +12,12 @@ from PySide import QtGui
 # Import application window view
 from Motome.Views.SettingsDialog import Ui_SettingsDialog
 
+# Import additional modules
+from Motome.Models.FullTextIndex import FullTextIndex
+
+# Import configuration values
+from Motome.config import SEARCH_ENGINE
+
 
 class SettingsDialog(QtGui.QDialog):
 
@@ -43,6 +49,16 @@ class SettingsDialog(QtGui.QDialog):
         except KeyError:
             pass
 
+        self.ui.conf_search_engine.addItem('Word index', 'index')
+        if FullTextIndex.is_available():
+            self.ui.conf_search_engine.addItem('Full text (SQLite)', 'fulltext')
+        try:
+            idx = self.ui.conf_search_engine.findData(self.conf['conf_search_engine'])
+        except KeyError:
+            idx = self.ui.conf_search_engine.findData(SEARCH_ENGINE)
+        if idx >= 0:
+            self.ui.conf_search_engine.setCurrentIndex(idx)
+
         if 'conf_checkbox_recordonsave' in self.conf.keys():
             if int(self.conf['conf_checkbox_recordonsave']) == 0:
                 self.ui.conf_checkbox_recordonsave.setChecked(False)
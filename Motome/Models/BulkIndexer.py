@@ -0,0 +1,161 @@
+# Import the future
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import logging
+import multiprocessing
+import os
+import time
+
+# Import Qt modules
+from PySide import QtCore
+
+from Motome.Models.NoteModel import NoteModel
+from Motome.Models.Vocabulary import split_words
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+
+def read_note_file(filepath):
+    """ Read, decode and parse a note file and split its words, this runs in the worker processes
+
+    :param filepath: the path to the note file
+    :return: a tuple of (filepath, modification time, content, metadata, words from split_words), all but the filepath
+             are None if the file couldn't be read
+    """
+    try:
+        # the time from before the read, a change while reading gets the note read again
+        mtime = os.stat(filepath).st_mtime
+        data = NoteModel.enc_read(filepath)
+    except (IOError, OSError):
+        return filepath, None, None, None, None
+    if data is None:
+        # it couldn't be decoded
+        return filepath, None, None, None, None
+    content, metadata = NoteModel.parse_note_content(data)
+    return filepath, mtime, content, metadata, split_words(content)
+
+
+def read_note_files(filepaths):
+    """ read_note_file for a chunk of note files
+
+    :param filepaths: a list of note file paths
+    :return: a list of read_note_file results
+    """
+    return [read_note_file(filepath) for filepath in filepaths]
+
+
+class BulkIndexer(QtCore.QObject):
+    """
+    Reads, parses and splits the words of many note files in a pool of worker processes, e.g. when a notes directory
+    is opened for the first time.
+
+    The results are handed back on the GUI thread a batch at a time from a timer, and each timer tick only takes
+    batch_time, so the window keeps responding while the notes and indexes fill up.
+    """
+    # the number of notes done and the number started
+    progress = QtCore.Signal(int, int)
+    # emitted when all the started notes are done or the indexer is stopped
+    finished = QtCore.Signal()
+
+    def __init__(self, apply_batch, parent=None):
+        """
+        :param apply_batch: called on the GUI thread with each list of read_note_file results
+        """
+        super(BulkIndexer, self).__init__(parent)
+
+        self.apply_batch = apply_batch
+
+        self.processes = None  # None starts a worker process per CPU
+        self.chunksize = 32  # note files sent to a worker at a time
+        self.batch_size = 64  # results handed to apply_batch at a time
+        self.batch_time = 0.05  # seconds of results applied a timer tick
+        self.poll_interval = 25  # msec
+
+        self.done = 0
+        self.total = 0
+
+        self._pool = None
+        self._results = []  # the result iterators of the started files, in start order
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self._poll)
+
+    @property
+    def is_running(self):
+        return self._pool is not None
+
+    def start(self, filepaths):
+        """ Read note files in the worker processes, more can be started while others are still being read
+
+        :param filepaths: a list of note file paths
+        :return: boolean True if the files are being read, False if the worker processes couldn't be started and the
+                 files should be read some other way
+        """
+        if len(filepaths) == 0:
+            return True
+        if self._pool is None:
+            try:
+                self._pool = multiprocessing.Pool(self.processes)
+            except (OSError, ImportError, NotImplementedError) as e:
+                logger.warning('[BulkIndexer/start] %r' % e)
+                return False
+        # the chunks are made here, the pool's own chunking leaves nothing to poll
+        chunks = [filepaths[i:i + self.chunksize] for i in range(0, len(filepaths), self.chunksize)]
+        self._results.append(self._pool.imap_unordered(read_note_files, chunks))
+        self.total += len(filepaths)
+        self.progress.emit(self.done, self.total)
+        if not self._timer.isActive():
+            self._timer.start(self.poll_interval)
+        return True
+
+    def stop(self):
+        """ Drop the results not applied yet and shut down the worker processes
+        """
+        if self._pool is None:
+            return
+        self._pool.terminate()
+        self._finish()
+
+    def _poll(self):
+        deadline = time.time() + self.batch_time
+        applied = False
+        while time.time() < deadline:
+            batch = self._take(self.batch_size)
+            if len(batch) == 0:
+                break
+            self.done += len(batch)
+            self.apply_batch(batch)
+            applied = True
+        if applied:
+            self.progress.emit(self.done, self.total)
+        if len(self._results) == 0:
+            self._pool.close()
+            self._finish()
+
+    def _take(self, count):
+        """ About count of the results that are ready, a chunk at a time
+        """
+        batch = []
+        while len(batch) < count and len(self._results) > 0:
+            try:
+                batch.extend(self._results[0].next(timeout=0))
+            except multiprocessing.TimeoutError:
+                break
+            except StopIteration:
+                self._results.pop(0)
+            except Exception as e:
+                # a chunk that failed in a worker, its notes are left for the notes list to read when they're opened
+                logger.warning('[BulkIndexer/take] %r' % e)
+                self.done = min(self.done + self.chunksize, self.total)
+        return batch
+
+    def _finish(self):
+        self._timer.stop()
+        self._pool.join()
+        self._pool = None
+        self._results = []
+        self.done = 0
+        self.total = 0
+        self.finished.emit()
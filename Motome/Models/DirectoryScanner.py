@@ -0,0 +1,94 @@
+# Import the future
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import logging
+import os
+import stat
+
+# os.scandir is in Python 3.5+, the scandir package backports it, otherwise fall back to listing and stat'ing
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+
+class DirectoryScanner(object):
+    """
+    Keeps a snapshot of the (mtime, size, inode) of the files in a directory and works out what changed between scans.
+
+    Only the names and stat values of the directory entries are compared, no file is opened, so the callers only need
+    to do work for the files that were added, removed or modified since the last scan.
+    """
+    def __init__(self, directory, extension=None):
+        self.directory = directory
+        self.extension = extension
+        self.snapshot = dict()  # filename -> (mtime, size, inode)
+
+    def __contains__(self, filename):
+        return filename in self.snapshot
+
+    def scan(self):
+        """ Take a new snapshot of the directory and compare it to the last one
+
+        :return: a tuple of (added, removed, modified) sets of filenames
+        """
+        new_snapshot = self.read_directory()
+        old_names = set(self.snapshot)
+        new_names = set(new_snapshot)
+        added = new_names - old_names
+        removed = old_names - new_names
+        modified = set(name for name in new_names & old_names if new_snapshot[name] != self.snapshot[name])
+        self.snapshot = new_snapshot
+        return added, removed, modified
+
+    def read_directory(self):
+        """ Get the stat values of the matching files in the directory
+
+        :return: a dict of filename -> (mtime, size, inode)
+        """
+        entries = dict()
+        if self.directory is None or self.directory == '':
+            return entries
+        try:
+            if scandir is not None:
+                for entry in scandir(self.directory):
+                    if self._wanted(entry.name) and entry.is_file():
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            # removed since the directory was listed
+                            continue
+                        entries[entry.name] = (st.st_mtime, st.st_size, st.st_ino)
+            else:
+                for name in os.listdir(self.directory):
+                    if not self._wanted(name):
+                        continue
+                    try:
+                        st = os.stat(os.path.join(self.directory, name))
+                    except OSError:
+                        continue
+                    if stat.S_ISREG(st.st_mode):
+                        entries[name] = (st.st_mtime, st.st_size, st.st_ino)
+        except OSError as e:
+            logger.warning('[DirectoryScanner/read_directory] %r' % e)
+        return entries
+
+    def mtime(self, filename):
+        """ The modification time of a file from the last scan, or None if it wasn't there
+        """
+        try:
+            return self.snapshot[filename][0]
+        except KeyError:
+            return None
+
+    def _wanted(self, name):
+        # like glob, hidden files are skipped
+        return not name.startswith('.') and (self.extension is None or name.endswith(self.extension))
@@ -0,0 +1,86 @@
+# Import the future
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import collections
+import logging
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# Import Qt modules
+from PySide import QtCore
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+
+class FileWorker(QtCore.QObject):
+    """
+    Runs note file jobs (writes, history records and reads) on a background thread, so a slow disk or network share
+    doesn't freeze the window.
+
+    The jobs run one at a time in the order they were queued, so writes to the same file land in order. Each job's
+    callback is called with its result on the GUI thread.
+    """
+    # emitted on the worker thread when a job is done, the connection delivers it on the GUI thread
+    _job_done = QtCore.Signal()
+
+    def __init__(self, parent=None):
+        super(FileWorker, self).__init__(parent)
+
+        # the number of jobs whose callbacks haven't been called yet
+        self.pending = 0
+
+        self._jobs = queue.Queue()  # (function, args, callback)
+        self._done = collections.deque()  # (callback, result, error)
+        self._thread = None
+        self._job_done.connect(self._call_back)
+
+    def submit(self, function, args=(), callback=None):
+        """ Queue a job
+
+        :param function: the job, it's called on the worker thread so it mustn't touch Qt objects or shared state
+        :param args: a tuple of the function's arguments
+        :param callback: called on the GUI thread as callback(result, error), error is the exception the function
+                         raised or None
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='FileWorker')
+            self._thread.daemon = True
+            self._thread.start()
+        self.pending += 1
+        self._jobs.put((function, args, callback))
+
+    def wait(self):
+        """ Block until all the queued jobs are done and call their callbacks, e.g. before the notes are renamed or
+        the session is saved
+        """
+        if self.pending == 0:
+            return
+        self._jobs.join()
+        self._call_back()
+
+    def _run(self):
+        while True:
+            function, args, callback = self._jobs.get()
+            try:
+                result, error = function(*args), None
+            except Exception as e:
+                # the thread has to keep going, the callback gets the error
+                logger.warning('[FileWorker/run] %r' % e)
+                result, error = None, e
+            self._done.append((callback, result, error))
+            self._jobs.task_done()
+            self._job_done.emit()
+
+    def _call_back(self):
+        while len(self._done) > 0:
+            callback, result, error = self._done.popleft()
+            self.pending -= 1
+            if callback is not None:
+                callback(result, error)
@@ -0,0 +1,218 @@
+# Import the future
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import logging
+import os
+import sqlite3
+
+from Motome.Models.NoteIndex import NoteIndex
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+
+class FullTextIndex(object):
+    """
+    A SQLite FTS5 full text index of the notes in a notes directory, an alternative search engine to the in-memory
+    NoteIndex.
+
+    Notes push their content, title and tags to it through the same hooks they use for the NoteIndex. Queries are
+    FTS5 MATCH expressions (see SearchModel.fulltext_query), matches are ranked with FTS5's built in BM25 and snippets
+    of the matching text can be pulled out for highlighting. Changes are written in one transaction by commit().
+    """
+    # the FTS5 columns, a note's row id comes from the files table
+    COLUMNS = ('title', 'content', 'tags')
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+        data_dir = os.path.dirname(filepath)
+        if data_dir != '' and not os.path.exists(data_dir):
+            os.makedirs(data_dir)
+        self.connection = sqlite3.connect(filepath)
+        self._create_tables()
+        self._ids = dict(self.connection.execute('SELECT filename, id FROM files'))  # note filename -> row id
+        self.is_saved = True
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, filename):
+        return filename in self._ids
+
+    @property
+    def notes(self):
+        """ The set of all the indexed note filenames
+        """
+        return set(self._ids.keys())
+
+    @staticmethod
+    def is_available():
+        """ Was the sqlite3 library built with FTS5?
+
+        :return: boolean
+        """
+        connection = sqlite3.connect(':memory:')
+        try:
+            connection.execute('CREATE VIRTUAL TABLE fts5_test USING fts5(content)')
+            return True
+        except sqlite3.OperationalError:
+            return False
+        finally:
+            connection.close()
+
+    def update_note(self, filename, content):
+        """ Replace the indexed content of a note
+
+        :param filename: the note's filename
+        :param content: the note's content string
+        """
+        self._update_column(filename, 'content', content)
+
+    def update_note_title(self, filename, title):
+        """ Replace the indexed title of a note
+
+        :param filename: the note's filename
+        :param title: the note's title string
+        """
+        self._update_column(filename, 'title', title)
+
+    def update_note_tags(self, filename, tags):
+        """ Replace the indexed tags of a note
+
+        :param filename: the note's filename
+        :param tags: an iterable of the note's tags, a leading tag query character is dropped and case is ignored
+        """
+        tags = set(NoteIndex.normalize_tag(tag) for tag in tags) - {''}
+        self._update_column(filename, 'tags', ' '.join(sorted(tags)))
+
+    def remove_note(self, filename):
+        """ Remove a note from the index
+
+        :param filename: the note's filename
+        """
+        try:
+            row_id = self._ids.pop(filename)
+        except KeyError:
+            return
+        self.connection.execute('DELETE FROM notes_fts WHERE rowid = ?', (row_id,))
+        self.connection.execute('DELETE FROM files WHERE id = ?', (row_id,))
+        self.is_saved = False
+
+    def rename_note(self, old_filename, new_filename):
+        """ Move a note's indexed text to a new filename
+
+        :param old_filename: the note's previous filename
+        :param new_filename: the note's new filename
+        """
+        try:
+            row_id = self._ids.pop(old_filename)
+        except KeyError:
+            return
+        self.remove_note(new_filename)
+        self.connection.execute('UPDATE files SET filename = ? WHERE id = ?', (new_filename, row_id))
+        self._ids[new_filename] = row_id
+        self.is_saved = False
+
+    def search(self, match, exclude=None, weights=(1.0, 1.0, 1.0), limit=None):
+        """ Find the notes matching a query, best first
+
+        :param match: the FTS5 MATCH expression the notes have to match, or None to start from all the notes
+        :param exclude: an FTS5 MATCH expression of the notes to leave out, or None
+        :param weights: the BM25 weights of the title, content and tags columns
+        :param limit: the number of results to return, all the matching notes if None
+        :return: a list of (score, note filename) tuples, higher scores are better
+        """
+        if limit is None:
+            limit = -1
+        params = []
+        if match is None:
+            sql = 'SELECT 0.0, filename FROM files'
+            if exclude is not None:
+                sql += ' WHERE id NOT IN (SELECT rowid FROM notes_fts WHERE notes_fts MATCH ?)'
+                params.append(exclude)
+            sql += ' ORDER BY filename'
+        else:
+            # bm25() is lower for better matches
+            sql = 'SELECT -bm25(notes_fts, ?, ?, ?) AS score, files.filename ' \
+                  'FROM notes_fts JOIN files ON files.id = notes_fts.rowid WHERE notes_fts MATCH ?'
+            params.extend(weights)
+            params.append(match)
+            if exclude is not None:
+                sql += ' AND notes_fts.rowid NOT IN (SELECT rowid FROM notes_fts WHERE notes_fts MATCH ?)'
+                params.append(exclude)
+            sql += ' ORDER BY score DESC'
+        sql += ' LIMIT ?'
+        params.append(limit)
+        try:
+            return list(self.connection.execute(sql, params))
+        except sqlite3.OperationalError as e:
+            # a query FTS5 can't parse
+            logger.warning('[FullTextIndex/search] %r' % e)
+            return []
+
+    def snippets(self, match, filenames, before='<b>', after='</b>', ellipsis='...', num_tokens=12):
+        """ Pull out the best matching bit of each note's content
+
+        :param match: the FTS5 MATCH expression used to find the notes
+        :param filenames: the note filenames to get snippets for
+        :param before: the text put before each matching word
+        :param after: the text put after each matching word
+        :param ellipsis: the text marking where the content was cut
+        :param num_tokens: the most words in a snippet
+        :return: a dict of note filename -> snippet string
+        """
+        found = dict()
+        row_ids = [self._ids[filename] for filename in filenames if filename in self._ids]
+        if match is None or len(row_ids) == 0:
+            return found
+        sql = 'SELECT files.filename, snippet(notes_fts, 1, ?, ?, ?, ?) ' \
+              'FROM notes_fts JOIN files ON files.id = notes_fts.rowid ' \
+              'WHERE notes_fts MATCH ? AND notes_fts.rowid IN ({0})'
+        try:
+            # stay under SQLite's limit on query parameters
+            for start in range(0, len(row_ids), 500):
+                chunk = row_ids[start:start + 500]
+                params = [before, after, ellipsis, num_tokens, match] + chunk
+                for filename, snippet in self.connection.execute(sql.format(', '.join('?' * len(chunk))), params):
+                    found[filename] = snippet
+        except sqlite3.OperationalError as e:
+            logger.warning('[FullTextIndex/snippets] %r' % e)
+        return found
+
+    def commit(self):
+        """ Write the index changes in one transaction
+        """
+        if self.is_saved:
+            return
+        try:
+            self.connection.commit()
+            self.is_saved = True
+        except sqlite3.Error as e:
+            logger.warning('[FullTextIndex/commit] %r' % e)
+
+    def close(self):
+        """ Commit any changes and close the index database
+        """
+        self.commit()
+        self.connection.close()
+
+    def _create_tables(self):
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, filename TEXT UNIQUE)')
+            # index two and three character prefixes so partial word queries don't scan the vocabulary
+            self.connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5({0}, prefix='2 3')".format(
+                ', '.join(self.COLUMNS)))
+
+    def _update_column(self, filename, column, value):
+        try:
+            row_id = self._ids[filename]
+        except KeyError:
+            row_id = self.connection.execute('INSERT INTO files (filename) VALUES (?)', (filename,)).lastrowid
+            self._ids[filename] = row_id
+            self.connection.execute('INSERT INTO notes_fts (rowid, {0}) VALUES (?, ?)'.format(column), (row_id, value))
+        else:
+            self.connection.execute('UPDATE notes_fts SET {0} = ? WHERE rowid = ?'.format(column), (value, row_id))
+        self.is_saved = False
@@ -0,0 +1,206 @@
+# Import the future
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import collections
+import os
+import sys
+import time
+import zipfile
+
+from Motome.config import ENCODING, HISTORY_COMPRESSLEVEL
+from Motome.Models.External import diff_match_patch as dmp
+
+# what a note keeps of each version in its history archive, ZipInfo's name and date fields
+HistoryEntry = collections.namedtuple('HistoryEntry', ['filename', 'date_time'])
+
+
+class HistoryStore(object):
+    """
+    A note's history, the versions of the note file recorded so far in a zip archive.
+
+    Every keyframe_interval versions one is kept whole, named for when it was recorded ('20140102030405.txt') like all
+    the versions were before. The versions in between are kept as a diff_match_patch patch from the version before
+    them ('20140102030405.txt.patch'), so a version is rebuilt from at most keyframe_interval - 1 patches. Archives
+    of whole versions only, from older versions of Motome, are read the same way.
+
+    A version recorded in the same second as one already in the archive gets a sequence number after the time
+    ('20140102030405_1.txt'), the versions are ordered by time and then sequence number.
+
+    The versions are written into the archive straight from memory with ZipFile.writestr.
+    """
+    PATCH_EXTENSION = '.patch'
+    SEQUENCE_SEPARATOR = '_'
+
+    # a whole version is kept every this many versions
+    keyframe_interval = 16
+    # how the versions are compressed, see HISTORY_COMPRESSLEVEL, a compresslevel of 0 stores them as they are and
+    # Python before 3.7 deflates the others at zlib's default
+    compress_type = zipfile.ZIP_DEFLATED
+    compresslevel = HISTORY_COMPRESSLEVEL
+
+    def __init__(self, zip_filepath):
+        self.zip_filepath = zip_filepath
+        self._dmp = dmp.diff_match_patch()
+
+    def versions(self):
+        """ The archive's versions
+
+        :return: a list of ZipInfo oldest first, empty if there's no archive yet
+        """
+        try:
+            with zipfile.ZipFile(self.zip_filepath, 'r') as myzip:
+                return self._sorted(myzip)
+        except IOError:
+            return []
+
+    def entries(self):
+        """ The archive's versions in the small form the notes keep
+
+        :return: a list of HistoryEntry oldest first, empty if there's no archive yet
+        """
+        return self.entries_of(self.versions())
+
+    def archive_key(self):
+        """ What tells whether the archive changed
+
+        :return: a tuple of the archive's (mtime, size), None if there's no archive
+        """
+        try:
+            st = os.stat(self.zip_filepath)
+        except OSError:
+            return None
+        return st.st_mtime, st.st_size
+
+    def read(self, index):
+        """ Rebuild a version of the note file
+
+        :param index: the version's index in versions()
+        :return: the note file data
+        """
+        with zipfile.ZipFile(self.zip_filepath, 'r') as myzip:
+            return self._rebuild(myzip, self._sorted(myzip), index)
+
+    def append(self, data, name):
+        """ Add a version of the note file, whole or as a patch from the last version
+
+        :param data: the note file data
+        :param name: the version's name, the time it was recorded as '%Y%m%d%H%M%S' and the note extension, a
+                     sequence number is added if the archive already has a version with the name
+        :return: the list of HistoryEntry of the archive's versions after the new one is added
+        """
+        history_dir = os.path.dirname(self.zip_filepath)
+        if not os.path.exists(history_dir):
+            os.makedirs(history_dir)
+        with zipfile.ZipFile(self.zip_filepath, 'a') as myzip:
+            versions = self._sorted(myzip)
+            name = self._unused_name(name, versions)
+            patch = None
+            if not self._needs_keyframe(versions):
+                patch = self._patch(self._rebuild(myzip, versions, len(versions) - 1), data)
+            if patch is None:
+                versions.append(self._write(myzip, name, data.encode(ENCODING)))
+            else:
+                versions.append(self._write(myzip, name + self.PATCH_EXTENSION, patch))
+        return self.entries_of(sorted(versions, key=self.version_order))
+
+    @staticmethod
+    def entries_of(versions):
+        """ HistoryEntrys from ZipInfos, the seconds rounded down to even like the zip file keeps them
+        """
+        return [HistoryEntry(info.filename, tuple(info.date_time[:5]) + (info.date_time[5] // 2 * 2,))
+                for info in versions]
+
+    @classmethod
+    def version_name(cls, info):
+        """ The name a version was recorded with, without the patch extension
+
+        :param info: the version's ZipInfo or HistoryEntry
+        :return: the name, e.g. '20140102030405.txt'
+        """
+        if cls.is_patch(info):
+            return info.filename[:-len(cls.PATCH_EXTENSION)]
+        return info.filename
+
+    @classmethod
+    def is_patch(cls, info):
+        return info.filename.endswith(cls.PATCH_EXTENSION)
+
+    @classmethod
+    def version_order(cls, info):
+        """ The sort key of a version, the time it was recorded and its sequence number within that second
+
+        :param info: the version's ZipInfo or HistoryEntry
+        :return: a tuple of the '%Y%m%d%H%M%S' time and the sequence number, 0 for the first version of a second
+        """
+        stem = os.path.splitext(cls.version_name(info))[0]
+        if stem[14:15] == cls.SEQUENCE_SEPARATOR:
+            return stem[:14], int(stem[15:])
+        return stem[:14], 0
+
+    @classmethod
+    def _sorted(cls, myzip):
+        return sorted(myzip.infolist(), key=cls.version_order)
+
+    def _unused_name(self, name, versions):
+        """ The name, with the next sequence number for its second if a version already has it
+        """
+        names = set(self.version_name(info) for info in versions)
+        stem, extension = os.path.splitext(name)
+        sequence = 0
+        while name in names:
+            sequence += 1
+            name = stem + self.SEQUENCE_SEPARATOR + '{0}'.format(sequence) + extension
+        return name
+
+    def _rebuild(self, myzip, versions, index):
+        if index < 0:
+            index += len(versions)
+        start = index
+        while start > 0 and self.is_patch(versions[start]):
+            start -= 1
+        data = None
+        for info in versions[start:index + 1]:
+            data = self._next_version(myzip, info, data)
+        return data
+
+    def _next_version(self, myzip, info, data):
+        """ A version's data from the data of the version before it
+        """
+        if not self.is_patch(info):
+            return myzip.read(info).decode(ENCODING)
+        patches = self._dmp.patch_fromText(myzip.read(info).decode('ascii'))
+        return self._dmp.patch_apply(patches, data)[0]
+
+    def _needs_keyframe(self, versions):
+        """ Is the next version after these kept whole
+        """
+        since_keyframe = 0
+        for info in reversed(versions):
+            if not self.is_patch(info):
+                break
+            since_keyframe += 1
+        return len(versions) == 0 or since_keyframe + 1 >= self.keyframe_interval
+
+    def _patch(self, last, data):
+        """ The patch from the last version's data to data, None when data is better kept whole
+        """
+        patches = self._dmp.patch_make(last, data)
+        patch = self._dmp.patch_toText(patches)
+        # the patch has to give back the version exactly and be worth it
+        if len(patch) >= len(data) or self._dmp.patch_apply(self._dmp.patch_fromText(patch), last)[0] != data:
+            return None
+        return patch.encode('ascii')
+
+    def _write(self, myzip, name, data):
+        date_time = time.strptime(name[:14], '%Y%m%d%H%M%S')[:6]
+        info = zipfile.ZipInfo(name, date_time)
+        info.compress_type = self.compress_type
+        if self.compresslevel == 0:
+            info.compress_type = zipfile.ZIP_STORED
+        if self.compresslevel not in (None, 0) and sys.version_info >= (3, 7):
+            myzip.writestr(info, data, compresslevel=self.compresslevel)
+        else:
+            myzip.writestr(info, data)
+        return info
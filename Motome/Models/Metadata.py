@@ -0,0 +1,90 @@
+# Import the future
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import re
+
+import yaml
+
+# PyYAML's C parser and emitter are much faster when libyaml is installed
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+SafeDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+# the metadata Motome writes is a few plain 'key: value' lines, keys and values YAML reads back as the same string
+# without any quoting: starting with a letter, no ':', '#' or quote at the start and nothing YAML would take for a
+# boolean or null, or decimal integers like the pinned flag
+KEY_RE = re.compile(r'^[A-Za-z_]+$')
+PLAIN_RE = re.compile(r"^[^\W\d_](?:[\w .,/()&'+!?@-]*[\w.,/()&'+!?@-])?$", re.UNICODE)
+INT_RE = re.compile(r'^(?:0|-?[1-9][0-9]*)$')
+LINE_RE = re.compile(r'^([A-Za-z_]+): (.*)$')
+RESERVED = {'y', 'n', 'yes', 'no', 'true', 'false', 'on', 'off', 'null'}
+BOOLEANS = {'true': True, 'false': False}
+
+
+def _is_plain(value):
+    return PLAIN_RE.match(value) is not None and value.lower() not in RESERVED
+
+
+def _is_plain_key(key):
+    return KEY_RE.match(key) is not None and key.lower() not in RESERVED
+
+
+def dump_metadata(metadata):
+    """ The YAML text of a note's metadata, the simple keys and values Motome writes are written without PyYAML
+
+    :param metadata: the metadata dict
+    :return: the YAML text, ending in a newline like yaml.safe_dump's
+    """
+    lines = []
+    for key in sorted(metadata.keys()):
+        value = metadata[key]
+        if not isinstance(key, basestring) or not _is_plain_key(key):
+            break
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        elif isinstance(value, (int, long)):
+            value = '{0:d}'.format(value)
+        elif not isinstance(value, basestring):
+            break
+        elif value == '':
+            value = "''"
+        elif not _is_plain(value):
+            break
+        lines.append('{0}: {1}\n'.format(key, value))
+    else:
+        return ''.join(lines)
+    # use safe_dump to prevent dumping non-standard YAML tags
+    return yaml.dump(metadata, Dumper=SafeDumper, default_flow_style=False)
+
+
+def load_metadata(text):
+    """ Read the YAML text of a note's metadata, the lines dump_metadata writes are read without PyYAML
+
+    :param text: the YAML text
+    :return: what the YAML holds, a dict for valid metadata
+    :raises yaml.YAMLError: when the text isn't valid YAML
+    """
+    text = text.strip()
+    metadata = dict()
+    for line in text.splitlines():
+        match = LINE_RE.match(line)
+        if match is None:
+            break
+        key, value = match.groups()
+        if not _is_plain_key(key):
+            break
+        if value in BOOLEANS:
+            value = BOOLEANS[value]
+        elif INT_RE.match(value) is not None:
+            value = int(value)
+        elif value == "''":
+            value = ''
+        elif not _is_plain(value):
+            break
+        metadata[key] = value
+    else:
+        if len(metadata) > 0:
+            return metadata
+    # use the safe loader to prevent loading non-standard YAML tags
+    return yaml.load(text, Loader=SafeLoader)
@@ -0,0 +1,318 @@
+# Import the future
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import collections
+import json
+import logging
+import os
+import sqlite3
+
+from Motome.Models.NoteIndex import NoteIndex
+from Motome.Models.NoteModel import NoteModel
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+
+class NoteRecord(object):
+    """
+    What the notes list needs of a note that isn't built, kept instead of its whole catalog row.
+    """
+    __slots__ = ('mtime', 'title', 'pinned')
+
+    def __init__(self, mtime, title, pinned):
+        self.mtime = mtime
+        self.title = title
+        self.pinned = pinned
+
+
+class NoteCatalog(collections.MutableMapping):
+    """
+    A SQLite backed catalog of the notes in a notes directory, used as the session notes dict.
+
+    It maps note filenames to NoteModels like a dict. Only a small NoteRecord of each note is read when it is opened,
+    a NoteModel is built from the note's full row when the note is asked for and can be unloaded back to a record
+    once it's saved. Notes stage their row whenever they change and the staged rows are written in a single
+    transaction by commit(), so an interrupted save can't corrupt the catalog.
+
+    The notes' word index is kept in the catalog database too, see index, and its changes are committed with the
+    rows. So the index never holds words of a note version other than the one in the note's row, e.g. after a crash.
+    """
+    COLUMNS = ('filename', 'mtime', 'title', 'tags', 'pinned', 'metadata', 'history')
+
+    def __init__(self, filepath, notes_dir):
+        self.filepath = filepath
+        self.notes_dir = notes_dir
+
+        self._records = dict()  # note filename -> NoteRecord, for notes not built
+        self._notes = dict()  # note filename -> NoteModel
+        self._pending = dict()  # note filename -> row tuple to write, or None to delete
+        self._stale = set()  # note filenames whose index changes were lost in a failed commit, see commit
+
+        data_dir = os.path.dirname(filepath)
+        if data_dir != '' and not os.path.exists(data_dir):
+            os.makedirs(data_dir)
+        self.connection = sqlite3.connect(filepath)
+        self._create_tables()
+        self._load()
+
+        # the indexes the notes keep up to date, given to each note when it's built
+        self.index = NoteIndex(self.connection)
+        self.fulltext = None
+
+    def __getitem__(self, filename):
+        try:
+            return self._notes[filename]
+        except KeyError:
+            record = self._records[filename]  # raises the KeyError for missing notes
+        row = self._pending.get(filename)
+        if row is None:
+            row = self._read_row(filename)
+        if row is None:
+            # the file is read for the rest
+            row = (filename, -1, record.title, None, record.pinned, None, None)
+        del self._records[filename]
+        note = NoteModel.from_catalog_record(self.notes_dir, row)
+        note.catalog = self
+        note.index = self.index
+        note.fulltext = self.fulltext
+        self._notes[filename] = note
+        return note
+
+    def __setitem__(self, filename, note):
+        self._records.pop(filename, None)
+        self._notes[filename] = note
+        note.catalog = self
+        self.update_note(note)
+
+    def __delitem__(self, filename):
+        if filename in self._notes:
+            del self._notes[filename]
+        else:
+            del self._records[filename]
+        self._pending[filename] = None
+
+    def __contains__(self, filename):
+        return filename in self._notes or filename in self._records
+
+    def __iter__(self):
+        for filename in self._notes.keys():
+            yield filename
+        for filename in self._records.keys():
+            yield filename
+
+    def __len__(self):
+        return len(self._notes) + len(self._records)
+
+    @property
+    def is_saved(self):
+        return len(self._pending) == 0 and not self._index_changed
+
+    @property
+    def _index_changed(self):
+        """ Are there word index changes in the catalog database for the next commit
+        """
+        return self.index is not None and self.index.connection is self.connection and not self.index.is_saved
+
+    @property
+    def loaded_notes(self):
+        """ The NoteModels built so far, the only ones that can have unsaved changes
+        """
+        return self._notes.values()
+
+    def set_indexes(self, index, fulltext):
+        """ Set the indexes the notes keep up to date, see NoteModel.index and NoteModel.fulltext
+
+        :param index: the NoteIndex or None, e.g. the catalog's own index
+        :param fulltext: the FullTextIndex or None
+        """
+        if index is self.index and fulltext is self.fulltext:
+            return
+        self.index = index
+        self.fulltext = fulltext
+        for note in self._notes.itervalues():
+            note.index = index
+            note.fulltext = fulltext
+
+    def summary(self, filename):
+        """ The title and pinned state of a note for the notes list, from its record if the note isn't built
+
+        :param filename: the note filename
+        :return: a tuple of (title, pinned)
+        """
+        try:
+            note = self._notes[filename]
+        except KeyError:
+            record = self._records[filename]
+            return record.title, bool(record.pinned)
+        return note.title, note.pinned
+
+    def is_stale(self, filename, mtime):
+        """ Is the cataloged data of a note older than its file, built notes always are so they check for themselves
+
+        :param filename: the note filename
+        :param mtime: the modification time of the note file
+        :return: boolean True if the note may need to be read again
+        """
+        try:
+            record = self._records[filename]
+        except KeyError:
+            return True
+        return record.mtime is None or record.mtime < mtime
+
+    def unrecorded(self, notes):
+        """ The notes whose file version may not be recorded in their history archive yet, told from the catalog's
+        history summaries without building the notes or opening their archives
+
+        Built notes are asked with NoteModel.recorded, notes without a summary (e.g. never recorded) are included.
+
+        :param notes: a list of (note filename, modification time of the note file) tuples
+        :return: a list of note filenames, in the order given
+        """
+        summaries = dict()
+        try:
+            summaries.update(self.connection.execute('SELECT filename, history FROM notes'))
+        except sqlite3.Error as e:
+            logger.warning('[NoteCatalog/unrecorded] %r' % e)
+        column = self.COLUMNS.index('history')
+        for filename, row in self._pending.iteritems():
+            summaries[filename] = None if row is None else row[column]
+        unrecorded = []
+        for filename, mtime in notes:
+            note = self._notes.get(filename)
+            if note is not None:
+                if not note.recorded:
+                    unrecorded.append(filename)
+                continue
+            if filename not in self._records:
+                continue
+            history = summaries.get(filename)
+            latest = None if history is None else json.loads(history)['latest']
+            if latest is None or not NoteModel.is_recorded(latest[1], mtime):
+                unrecorded.append(filename)
+        return unrecorded
+
+    def unload(self, filename):
+        """ Drop a built note without unsaved changes and keep just its record, it's built again when asked for
+
+        Only unload notes nothing else holds on to, e.g. not the note in the editor.
+
+        :param filename: the note filename
+        :return: boolean True if the note was unloaded
+        """
+        note = self._notes.get(filename)
+        if note is None or not note.is_saved:
+            return False
+        # the note is built from its staged row until that's committed
+        row = self._staged_row(note.catalog_record())
+        self._pending[filename] = row
+        del self._notes[filename]
+        self._records[filename] = NoteRecord(row[1], row[2], row[4])
+        return True
+
+    def update_note(self, note):
+        """ Stage a note's current catalog row to be written on the next commit
+
+        :param note: the changed NoteModel
+        """
+        if note.filename in self._notes:
+            self._pending[note.filename] = self._staged_row(note.catalog_record())
+
+    def rename_note(self, old_filename, note):
+        """ Move a note's catalog row to its new filename
+
+        :param old_filename: the note's previous filename
+        :param note: the renamed NoteModel
+        """
+        self._notes.pop(old_filename, None)
+        self._records.pop(old_filename, None)
+        self._pending[old_filename] = None
+        if old_filename in self._stale:
+            self._stale.add(note.filename)
+        self[note.filename] = note
+
+    def commit(self):
+        """ Write all the staged rows and the word index changes in one transaction
+        """
+        if self.is_saved:
+            return
+        pending = self._pending
+        self._pending = dict()
+        updates = [row for row in pending.itervalues() if row is not None]
+        deletes = [(filename,) for filename, row in pending.iteritems() if row is None]
+        try:
+            with self.connection:
+                self.connection.executemany('DELETE FROM notes WHERE filename = ?', deletes)
+                self.connection.executemany('INSERT OR REPLACE INTO notes ({0}) VALUES ({1})'.format(
+                    ', '.join(self.COLUMNS), ', '.join('?' * len(self.COLUMNS))), updates)
+        except sqlite3.Error as e:
+            logger.warning('[NoteCatalog/commit] %r' % e)
+            self._rolled_back(pending)
+        else:
+            if self._index_changed:
+                self.index.is_saved = True
+
+    def _rolled_back(self, pending):
+        """ Keep the rows of a failed commit for the next try
+
+        The word index changes that went with them are lost, so the rows are kept stale and the notes are read into the
+        index again the next time the notes directory is opened.
+        """
+        try:
+            self.connection.rollback()
+        except sqlite3.Error as e:
+            logger.warning('[NoteCatalog/commit] %r' % e)
+        pending.update(self._pending)
+        self._stale.update(filename for filename, row in pending.iteritems() if row is not None)
+        self._pending = dict((filename, self._staged_row(row)) for filename, row in pending.iteritems())
+        if self.index is not None and self.index.connection is self.connection:
+            self.index.reload()
+            self.index.is_saved = True
+
+    def _staged_row(self, row):
+        """ The row to write, with no file version for notes whose index changes were lost so they count as stale
+        """
+        if row is None or row[0] not in self._stale:
+            return row
+        return row[:1] + (-1,) + row[2:]
+
+    def close(self):
+        """ Commit any staged rows and close the catalog database
+        """
+        self.commit()
+        self.connection.close()
+
+    def _create_tables(self):
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS notes ('
+                                    'filename TEXT PRIMARY KEY, '
+                                    'mtime REAL, '
+                                    'title TEXT, '
+                                    'tags TEXT, '
+                                    'pinned INTEGER, '
+                                    'metadata TEXT, '
+                                    'history TEXT)')
+
+    def _load(self):
+        try:
+            cursor = self.connection.execute('SELECT filename, mtime, title, pinned FROM notes')
+            self._records = dict((row[0], NoteRecord(row[1], row[2], row[3])) for row in cursor)
+        except sqlite3.Error as e:
+            logger.warning('[NoteCatalog/load] %r' % e)
+            self._records = dict()
+
+    def _read_row(self, filename):
+        """ Read a note's full catalog row
+
+        :param filename: the note filename
+        :return: a tuple in COLUMNS order, or None if the note isn't in the catalog database
+        """
+        try:
+            cursor = self.connection.execute('SELECT {0} FROM notes WHERE filename = ?'.format(
+                ', '.join(self.COLUMNS)), (filename,))
+            return cursor.fetchone()
+        except sqlite3.Error as e:
+            logger.warning('[NoteCatalog/read_row] %r' % e)
+            return None
@@ -0,0 +1,510 @@
+# Import the future
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import logging
+import re
+import sqlite3
+from array import array
+
+from Motome.config import SEARCH_MATCH_MODE, TAG_QUERY_CHAR
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+# tables keyed only by their primary key are stored once instead of as a table and an index, where SQLite has it
+WITHOUT_ROWID = ' WITHOUT ROWID' if sqlite3.sqlite_version_info >= (3, 8, 2) else ''
+
+
+def pack_positions(positions):
+    """ Pack a note's word positions compactly, each word's positions delta encoded in one array
+
+    :param positions: a dict of word -> sorted list of the word's positions in the note
+    :return: a tuple of (the words joined by newlines, the bytes of an array of each word's count of positions
+             followed by the differences between them, after the array's type code)
+    """
+    words = sorted(positions)
+    numbers = []
+    for word in words:
+        word_positions = positions[word]
+        numbers.append(len(word_positions))
+        last = 0
+        for position in word_positions:
+            numbers.append(position - last)
+            last = position
+    # the deltas are mostly small, so the narrowest array that holds them all is used
+    largest = max(numbers) if len(numbers) > 0 else 0
+    typecode = 'B' if largest < 2 ** 8 else 'H' if largest < 2 ** 16 else 'i'
+    return '\n'.join(words), typecode.encode('ascii') + array(str(typecode), numbers).tostring()
+
+
+def packed_counts(packed):
+    """ The word counts from pack_positions, without the positions
+
+    :param packed: a tuple from pack_positions
+    :return: a dict of word -> number of times the word is in the note
+    """
+    words, data = packed
+    if words == '':
+        return dict()
+    numbers = array(str(data[:1].decode('ascii')))
+    numbers.fromstring(data[1:])
+    counts = dict()
+    i = 0
+    for word in words.split('\n'):
+        counts[word] = numbers[i]
+        i += 1 + numbers[i]
+    return counts
+
+
+def unpack_positions(packed):
+    """ The word positions from pack_positions
+
+    :param packed: a tuple from pack_positions
+    :return: a dict of word -> sorted list of the word's positions in the note
+    """
+    words, data = packed
+    if words == '':
+        return dict()
+    numbers = array(str(data[:1].decode('ascii')))
+    numbers.fromstring(data[1:])
+    positions = dict()
+    i = 0
+    for word in words.split('\n'):
+        count = numbers[i]
+        word_positions = []
+        last = 0
+        for delta in numbers[i + 1:i + 1 + count]:
+            last += delta
+            word_positions.append(last)
+        positions[word] = word_positions
+        i += 1 + count
+    return positions
+
+
+class NoteIndex(object):
+    """
+    An inverted index of the words in a notes directory, kept in a SQLite database.
+
+    Each word has a posting for every note that contains it, with the word's count in the note, so a query can be
+    answered by intersecting and subtracting the notes of its words instead of scanning the wordset of every note. The
+    postings are ordered by word, so partial word (prefix) queries read a range of them. The notes' metadata tags get
+    the same treatment in a separate tag table so tag filters are set operations too. Note lengths and title words are
+    kept for ranking the search results, and the positions of each word in a note (packed, see pack_positions) answer
+    phrase and proximity queries without reading the note again.
+
+    Only the note filenames and their row ids are kept in memory, the rest is read when a query needs it. A notes
+    directory's index is in its catalog database and its changes are committed with the catalog rows (see
+    NoteCatalog), a standalone index is kept in an in-memory database.
+    """
+    def __init__(self, connection=None):
+        if connection is None:
+            connection = sqlite3.connect(':memory:')
+        self.connection = connection
+        self._create_tables()
+        self._ids = dict()  # note filename -> row id
+        self.is_saved = True  # are all the changes committed to the database
+        self.generation = 0  # bumped whenever the index changes so cached search results can be dropped
+        self.reload()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, filename):
+        return filename in self._ids
+
+    def reload(self):
+        """ Read the note filenames again, e.g. after the changes since the last commit were rolled back
+        """
+        try:
+            self._ids = dict(self.connection.execute('SELECT filename, id FROM index_notes'))
+        except sqlite3.Error as e:
+            logger.warning('[NoteIndex/reload] %r' % e)
+            self._ids = dict()
+        self.generation += 1
+
+    @property
+    def notes(self):
+        """ The set of all the indexed note filenames
+        """
+        return set(self._ids.keys())
+
+    @property
+    def average_length(self):
+        """ The average number of words in a note
+        """
+        average = self.connection.execute('SELECT AVG(length) FROM index_notes').fetchone()[0]
+        return 0.0 if average is None else float(average)
+
+    @property
+    def tags(self):
+        """ The sorted list of all the tags in use
+        """
+        return [row[0] for row in self.connection.execute('SELECT DISTINCT tag FROM tag_postings ORDER BY tag')]
+
+    @property
+    def terms(self):
+        """ The sorted list of all the indexed words
+        """
+        return [row[0] for row in self.connection.execute('SELECT DISTINCT word FROM postings ORDER BY word')]
+
+    def update_note(self, filename, words):
+        """ Replace the indexed words for a note, only touching the postings that changed
+
+        :param filename: the note's filename
+        :param words: a list of all the note's (lowercase) words in order, which records their positions,
+                      a dict of word counts, or a set of words each counted once
+        """
+        if isinstance(words, dict):
+            new_counts = dict(words)
+            packed = ('\n'.join(sorted(new_counts)), None)
+        elif isinstance(words, (list, tuple)):
+            positions = dict()
+            for position, word in enumerate(words):
+                positions.setdefault(word, []).append(position)
+            new_counts = dict((word, len(p)) for word, p in positions.iteritems())
+            packed = pack_positions(positions)
+        else:
+            new_counts = dict.fromkeys(words, 1)
+            packed = ('\n'.join(sorted(new_counts)), None)
+        note_id = self._note_id(filename)
+        old_words, old_positions = self.connection.execute('SELECT words, positions FROM index_notes WHERE id = ?',
+                                                           (note_id,)).fetchone()
+        if old_positions is not None:
+            old_positions = bytes(old_positions)
+        if packed == (old_words, old_positions):
+            return
+
+        if old_positions is None:
+            # the old counts aren't known, every posting is written again
+            old_counts = dict.fromkeys(old_words.split('\n') if old_words != '' else [])
+        else:
+            old_counts = packed_counts((old_words, old_positions))
+        self.connection.executemany('DELETE FROM postings WHERE word = ? AND note = ?',
+                                    [(word, note_id) for word in old_counts if word not in new_counts])
+        self.connection.executemany('INSERT OR REPLACE INTO postings (word, note, count) VALUES (?, ?, ?)',
+                                    [(word, note_id, count) for word, count in new_counts.iteritems()
+                                     if old_counts.get(word) != count])
+        self.connection.execute('UPDATE index_notes SET length = ?, words = ?, positions = ? WHERE id = ?',
+                                (sum(new_counts.itervalues()), packed[0],
+                                 None if packed[1] is None else sqlite3.Binary(packed[1]), note_id))
+        self._changed()
+
+    def update_note_title(self, filename, title):
+        """ Replace the indexed title words for a note
+
+        :param filename: the note's filename
+        :param title: the note's title string
+        """
+        words = ' '.join(sorted(set(re.findall(r'\w+', title.lower()))))
+        cursor = self.connection.execute('UPDATE index_notes SET title = ? WHERE id = ? AND title != ?',
+                                         (words, self._note_id(filename), words))
+        if cursor.rowcount > 0:
+            self.is_saved = False
+
+    def update_note_tags(self, filename, tags):
+        """ Replace the indexed tags for a note
+
+        :param filename: the note's filename
+        :param tags: an iterable of the note's tags, a leading tag query character is dropped and case is ignored
+        """
+        new_tags = set(self.normalize_tag(tag) for tag in tags) - {''}
+        note_id = self._note_id(filename)
+        old_tags = self._split(self.connection.execute('SELECT tags FROM index_notes WHERE id = ?',
+                                                       (note_id,)).fetchone()[0])
+        if new_tags == old_tags:
+            return
+
+        self.connection.executemany('DELETE FROM tag_postings WHERE tag = ? AND note = ?',
+                                    [(tag, note_id) for tag in old_tags - new_tags])
+        self.connection.executemany('INSERT INTO tag_postings (tag, note) VALUES (?, ?)',
+                                    [(tag, note_id) for tag in new_tags - old_tags])
+        self.connection.execute('UPDATE index_notes SET tags = ? WHERE id = ?', (' '.join(sorted(new_tags)), note_id))
+        self._changed()
+
+    def remove_note(self, filename):
+        """ Remove a note and all its postings from the index
+
+        :param filename: the note's filename
+        """
+        try:
+            note_id = self._ids.pop(filename)
+        except KeyError:
+            return
+        words, tags = self.connection.execute('SELECT words, tags FROM index_notes WHERE id = ?', (note_id,)).fetchone()
+        self.connection.executemany('DELETE FROM postings WHERE word = ? AND note = ?',
+                                    [(word, note_id) for word in self._split(words, '\n')])
+        self.connection.executemany('DELETE FROM tag_postings WHERE tag = ? AND note = ?',
+                                    [(tag, note_id) for tag in self._split(tags)])
+        self.connection.execute('DELETE FROM index_notes WHERE id = ?', (note_id,))
+        self._changed()
+
+    def rename_note(self, old_filename, new_filename):
+        """ Move a note's postings to a new filename
+
+        :param old_filename: the note's previous filename
+        :param new_filename: the note's new filename
+        """
+        if old_filename not in self._ids or old_filename == new_filename:
+            return
+        self.remove_note(new_filename)
+        note_id = self._ids.pop(old_filename)
+        # the postings are kept by row id, only the filename changes
+        self.connection.execute('UPDATE index_notes SET filename = ? WHERE id = ?', (new_filename, note_id))
+        self._ids[new_filename] = note_id
+        self._changed()
+
+    def positions_of(self, filename):
+        """ Read a note's word positions
+
+        :param filename: the note's filename
+        :return: a dict of word -> sorted list of the word's positions in the note, None if they aren't known
+        """
+        note_id = self._ids.get(filename)
+        if note_id is None:
+            return None
+        words, positions = self.connection.execute('SELECT words, positions FROM index_notes WHERE id = ?',
+                                                   (note_id,)).fetchone()
+        if positions is None:
+            return None
+        return unpack_positions((words, bytes(positions)))
+
+    def note_details(self, filenames):
+        """ Read what the ranking needs to know about notes besides their word counts
+
+        :param filenames: an iterable of note filenames
+        :return: a dict of note filename -> (the number of words in the note, the set of words in its title, the set
+                 of its tags)
+        """
+        ids = [self._ids[filename] for filename in filenames if filename in self._ids]
+        details = dict()
+        # stay under SQLite's limit on query parameters
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            sql = 'SELECT filename, length, title, tags FROM index_notes WHERE id IN ({0})'.format(
+                ', '.join('?' * len(chunk)))
+            for filename, length, title, tags in self.connection.execute(sql, chunk):
+                details[filename] = (length, self._split(title), self._split(tags))
+        return details
+
+    def word_counts(self, word, mode=SEARCH_MATCH_MODE):
+        """ Read the postings of the indexed words a query word matches
+
+        :param word: the (lowercase) query word
+        :param mode: the match mode, see terms_with_word
+        :return: a dict of indexed word -> dict of note filename -> the word's count in the note
+        """
+        counts = dict()
+        for term, filename, count in self._postings(word, mode, 'postings.word, index_notes.filename, postings.count'):
+            try:
+                counts[term][filename] = count
+            except KeyError:
+                counts[term] = {filename: count}
+        return counts
+
+    def terms_with_prefix(self, prefix):
+        """ Find the indexed words starting with the given text
+
+        :param prefix: the (lowercase) start of the words
+        :return: a list of words in sorted order
+        """
+        condition, params = self._prefix_condition(prefix)
+        return [row[0] for row in self.connection.execute(
+            'SELECT DISTINCT word FROM postings WHERE {0} ORDER BY word'.format(condition), params)]
+
+    def terms_with_word(self, word, mode=SEARCH_MATCH_MODE):
+        """ Find the indexed words a query word matches
+
+        :param word: the (lowercase) query word
+        :param mode: 'prefix' matches the start of words, 'exact' whole words and 'substring' any part of a word
+        :return: a list of words
+        """
+        if mode == 'exact':
+            found = self.connection.execute('SELECT 1 FROM postings WHERE word = ? LIMIT 1', (word,)).fetchone()
+            return [] if found is None else [word]
+        elif mode == 'substring':
+            # the original search behavior, only the vocabulary is scanned, not every note
+            return [term for term in self.terms if word in term]
+        else:
+            return self.terms_with_prefix(word)
+
+    def notes_with_word(self, word, mode=SEARCH_MATCH_MODE, within=None):
+        """ Find the notes with a word matching the query word
+
+        :param word: the (lowercase) query word
+        :param mode: the match mode, see terms_with_word
+        :param within: an optional set of note filenames to limit the results to
+        :return: a set of note filenames
+        """
+        found = set(row[0] for row in self._postings(word, mode, 'index_notes.filename'))
+        if within is None:
+            return found
+        return found & within
+
+    def notes_with_tag(self, tag, within=None):
+        """ Find the notes with a tag, tags must match exactly
+
+        :param tag: the tag to look for
+        :param within: an optional set of note filenames to limit the results to
+        :return: a set of note filenames
+        """
+        found = set(row[0] for row in self.connection.execute(
+            'SELECT index_notes.filename FROM tag_postings JOIN index_notes ON index_notes.id = tag_postings.note '
+            'WHERE tag_postings.tag = ?', (self.normalize_tag(tag),)))
+        if within is None:
+            return found
+        return found & within
+
+    def notes_with_phrase(self, phrase, within=None, last_mode='exact'):
+        """ Find the notes containing the words of a phrase next to each other and in order
+
+        :param phrase: a sequence of (lowercase) words
+        :param within: an optional set of note filenames to limit the results to
+        :param last_mode: the match mode of the phrase's last word, see terms_with_word, e.g. a partial word while
+                          the phrase is typed
+        :return: a set of note filenames
+        """
+        found = within
+        for i, word in enumerate(phrase):
+            found = self.notes_with_word(word, last_mode if i == len(phrase) - 1 else 'exact', within=found)
+            if len(found) == 0:
+                return found
+
+        phrase_terms = [[word] for word in phrase[:-1]] + [self.terms_with_word(phrase[-1], last_mode)]
+        matched = set()
+        for filename in found:
+            positions = self.positions_of(filename)
+            if positions is None:
+                continue
+            starts = None
+            for offset, terms in enumerate(phrase_terms):
+                word_starts = set(p - offset for term in terms for p in positions.get(term, ()))
+                starts = word_starts if starts is None else starts & word_starts
+                if len(starts) == 0:
+                    break
+            if len(starts) > 0:
+                matched.add(filename)
+        return matched
+
+    def notes_near(self, word_a, word_b, distance, mode=SEARCH_MATCH_MODE, within=None):
+        """ Find the notes where two query words are within a number of words of each other, in either order
+
+        :param word_a: the first (lowercase) query word
+        :param word_b: the second (lowercase) query word
+        :param distance: the most words apart the two can be
+        :param mode: the match mode of the query words, see terms_with_word
+        :param within: an optional set of note filenames to limit the results to
+        :return: a set of note filenames
+        """
+        terms_a = self.terms_with_word(word_a, mode)
+        terms_b = self.terms_with_word(word_b, mode)
+        found = self.notes_with_word(word_a, mode, within=within)
+        found = self.notes_with_word(word_b, mode, within=found)
+
+        matched = set()
+        for filename in found:
+            positions = self.positions_of(filename)
+            if positions is None:
+                continue
+            positions_a = sorted(p for term in terms_a for p in positions.get(term, ()))
+            positions_b = sorted(p for term in terms_b for p in positions.get(term, ()))
+            # walk both sorted lists looking for the closest pair
+            i = j = 0
+            while i < len(positions_a) and j < len(positions_b):
+                if abs(positions_a[i] - positions_b[j]) <= distance and positions_a[i] != positions_b[j]:
+                    matched.add(filename)
+                    break
+                if positions_a[i] < positions_b[j]:
+                    i += 1
+                else:
+                    j += 1
+        return matched
+
+    @staticmethod
+    def normalize_tag(tag):
+        return tag.lstrip(TAG_QUERY_CHAR).lower()
+
+    def commit(self):
+        """ Commit the index changes in one transaction, a notes directory's catalog commits them with its rows instead
+        """
+        if self.is_saved:
+            return
+        try:
+            self.connection.commit()
+            self.is_saved = True
+        except sqlite3.Error as e:
+            logger.warning('[NoteIndex/commit] %r' % e)
+
+    def _note_id(self, filename):
+        """ The row id of a note, a row is added for a note that isn't indexed yet
+        """
+        try:
+            return self._ids[filename]
+        except KeyError:
+            pass
+        cursor = self.connection.execute(
+            "INSERT INTO index_notes (filename, length, title, tags, words) VALUES (?, 0, '', '', '')", (filename,))
+        self._ids[filename] = cursor.lastrowid
+        self._changed()
+        return cursor.lastrowid
+
+    def _changed(self):
+        self.generation += 1
+        self.is_saved = False
+
+    def _postings(self, word, mode, columns):
+        """ The postings of the indexed words a query word matches joined with their notes' rows
+
+        :param word: the (lowercase) query word
+        :param mode: the match mode, see terms_with_word
+        :param columns: the columns of postings and index_notes to select
+        :return: a list of rows
+        """
+        sql = 'SELECT {0} FROM postings JOIN index_notes ON index_notes.id = postings.note WHERE '.format(columns)
+        if mode == 'exact':
+            return self.connection.execute(sql + 'postings.word = ?', (word,)).fetchall()
+        elif mode == 'substring':
+            rows = []
+            for term in self.terms_with_word(word, mode):
+                rows.extend(self.connection.execute(sql + 'postings.word = ?', (term,)))
+            return rows
+        else:
+            condition, params = self._prefix_condition(word, 'postings.word')
+            return self.connection.execute(sql + condition, params).fetchall()
+
+    @staticmethod
+    def _prefix_condition(prefix, column='word'):
+        """ An SQL condition matching the words that start with prefix, a range of the postings' primary key
+
+        :return: a tuple of (the condition, its parameters)
+        """
+        if prefix == '':
+            return '1', ()
+        # the first string after all the ones starting with prefix
+        end = prefix[:-1] + unichr(ord(prefix[-1]) + 1)
+        return '{0} >= ? AND {0} < ?'.format(column), (prefix, end)
+
+    @staticmethod
+    def _split(text, separator=' '):
+        return set(text.split(separator)) - {''}
+
+    def _create_tables(self):
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS index_notes ('
+                                    'id INTEGER PRIMARY KEY, '
+                                    'filename TEXT UNIQUE, '
+                                    'length INTEGER, '
+                                    'title TEXT, '
+                                    'tags TEXT, '
+                                    'words TEXT, '
+                                    'positions BLOB)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS postings ('
+                                    'word TEXT, '
+                                    'note INTEGER, '
+                                    'count INTEGER, '
+                                    'PRIMARY KEY (word, note))' + WITHOUT_ROWID)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS tag_postings ('
+                                    'tag TEXT, '
+                                    'note INTEGER, '
+                                    'PRIMARY KEY (tag, note))' + WITHOUT_ROWID)
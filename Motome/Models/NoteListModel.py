@@ -0,0 +1,427 @@
+# Import the future
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+from array import array
+
+# Import Qt modules
+from PySide import QtCore, QtGui
+
+
+class NoteListModel(QtCore.QAbstractListModel):
+    """
+    The rows of the notes list, newest first with the pinned notes above the others.
+
+    The model keeps what the list shows in a few columns (filename, title, pinned and modification time) instead of a
+    Qt item per note, and the view only asks it for the rows it draws. Nothing here touches the notes or their files,
+    the NoteListWidget hands in the column values.
+    """
+    # the data role with the note filename of a row
+    FilenameRole = QtCore.Qt.UserRole
+
+    # update_notes re-sorts the list once instead of moving the rows one by one when more than this many move
+    move_batch_limit = 8
+
+    def __init__(self, parent=None):
+        super(NoteListModel, self).__init__(parent)
+
+        self.filenames = []
+        self.titles = []
+        self.pinned = array(str('b'))
+        self.mtimes = array(str('d'))
+
+        # note filename -> tool tip, e.g. the search snippets
+        self.tooltips = dict()
+
+        self._pin_icon = None
+        self._row_map = None  # note filename -> row, built when needed and kept up to date as rows change
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.filenames)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == QtCore.Qt.DisplayRole:
+            return self.titles[row]
+        elif role == QtCore.Qt.DecorationRole:
+            if self.pinned[row]:
+                if self._pin_icon is None:
+                    self._pin_icon = QtGui.QIcon(":/icons/resources/pushpin_16.png")
+                return self._pin_icon
+        elif role == QtCore.Qt.ToolTipRole:
+            return self.tooltips.get(self.filenames[row])
+        elif role == self.FilenameRole:
+            return self.filenames[row]
+        return None
+
+    def row_of(self, filename):
+        """ The row of a note, or None if it isn't in the list
+        """
+        if self._row_map is None:
+            self._row_map = dict(zip(self.filenames, range(len(self.filenames))))
+        return self._row_map.get(filename)
+
+    def set_notes(self, rows):
+        """ Replace all the rows
+
+        :param rows: an iterable of (filename, title, pinned, mtime) tuples in any order
+        """
+        rows = sorted(rows, key=lambda r: (r[2], r[3]), reverse=True)
+        self.beginResetModel()
+        self.filenames = [r[0] for r in rows]
+        self.titles = [r[1] for r in rows]
+        self.pinned = array(str('b'), (1 if r[2] else 0 for r in rows))
+        self.mtimes = array(str('d'), (r[3] for r in rows))
+        self._row_map = None
+        self.endResetModel()
+
+    def merge_notes(self, rows):
+        """ Add or replace many rows at once with a single re-sort, the views are reset
+
+        :param rows: an iterable of (filename, title, pinned, mtime) tuples
+        """
+        new_rows = dict((r[0], r) for r in rows)
+        old_rows = [r for r in zip(self.filenames, self.titles, self.pinned, self.mtimes) if r[0] not in new_rows]
+        self.set_notes(old_rows + list(new_rows.values()))
+
+    def add_note(self, row):
+        """ Insert a row at its sorted place, or update it if the note is already in the list
+
+        :param row: a (filename, title, pinned, mtime) tuple
+        """
+        if self.row_of(row[0]) is not None:
+            self.update_note(row[0], row)
+            return
+        i = self._sorted_row(row[2], row[3])
+        self.beginInsertRows(QtCore.QModelIndex(), i, i)
+        self._insert(i, row)
+        self.endInsertRows()
+
+    def remove_note(self, filename):
+        """ Remove a note's row if it's in the list
+        """
+        i = self.row_of(filename)
+        if i is None:
+            return
+        self.beginRemoveRows(QtCore.QModelIndex(), i, i)
+        self._take(i)
+        self.endRemoveRows()
+
+    def update_note(self, filename, row):
+        """ Change a note's row and move it to its sorted place, the views keep their current and selected rows
+
+        :param filename: the note's filename in the list, it's different from the one in the row after a rename
+        :param row: the new (filename, title, pinned, mtime) tuple
+        """
+        i = self.row_of(filename)
+        if i is None:
+            self.add_note(row)
+            return
+        # where the row goes with the note out of the way, the note's own row is above it if it moves down
+        new_i = self._sorted_row(row[2], row[3])
+        if new_i > i:
+            new_i -= 1
+        if new_i != i:
+            # moving the row the Qt way keeps the views' persistent indexes, e.g. the current row, on the note
+            destination = new_i if new_i < i else new_i + 1
+            self.beginMoveRows(QtCore.QModelIndex(), i, i, QtCore.QModelIndex(), destination)
+            self._move(i, new_i, row)
+            self.endMoveRows()
+        else:
+            self._move(i, i, row)
+        index = self.index(new_i)
+        self.dataChanged.emit(index, index)
+
+    def update_notes(self, rows):
+        """ Change many notes' rows, the rows that stay in place are changed with a single dataChanged
+
+        :param rows: an iterable of (filename, title, pinned, mtime) tuples
+        """
+        moved = []
+        added = []
+        changed = []
+        for row in rows:
+            i = self.row_of(row[0])
+            if i is None:
+                added.append(row)
+            elif self.pinned[i] != (1 if row[2] else 0) or self.mtimes[i] != row[3]:
+                moved.append(row)
+            else:
+                self.titles[i] = row[1]
+                changed.append(i)
+        if len(changed) > 0:
+            self.dataChanged.emit(self.index(min(changed)), self.index(max(changed)))
+        if len(moved) > self.move_batch_limit:
+            self._sort_moved(moved)
+        else:
+            for row in moved:
+                self.update_note(row[0], row)
+        for row in added:
+            self.add_note(row)
+
+    def _sort_moved(self, rows):
+        """ Change many notes' rows with one re-sort, the views keep their current and selected rows through a single
+        layout change
+
+        :param rows: (filename, title, pinned, mtime) tuples of notes in the list
+        """
+        self.layoutAboutToBeChanged.emit()
+        persistent = [(index, self.filenames[index.row()]) for index in self.persistentIndexList()]
+        new_rows = dict((r[0], r) for r in rows)
+        all_rows = [new_rows.get(r[0], r) for r in zip(self.filenames, self.titles, self.pinned, self.mtimes)]
+        all_rows.sort(key=lambda r: (1 if r[2] else 0, r[3]), reverse=True)
+        self.filenames = [r[0] for r in all_rows]
+        self.titles = [r[1] for r in all_rows]
+        self.pinned = array(str('b'), (1 if r[2] else 0 for r in all_rows))
+        self.mtimes = array(str('d'), (r[3] for r in all_rows))
+        self._row_map = dict(zip(self.filenames, range(len(self.filenames))))
+        self.changePersistentIndexList([index for index, filename in persistent],
+                                       [self.index(self._row_map[filename]) for index, filename in persistent])
+        self.layoutChanged.emit()
+
+    def _sorted_row(self, pinned, mtime):
+        """ The row a note with this pinned state and modification time goes in, with a binary search
+        """
+        key = (1 if pinned else 0, mtime)
+        lo = 0
+        hi = len(self.filenames)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (self.pinned[mid], self.mtimes[mid]) < key:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def _insert(self, i, row):
+        self._insert_columns(i, row)
+        self._update_row_map(i, len(self.filenames))
+
+    def _take(self, i):
+        row = self._take_columns(i)
+        if self._row_map is not None:
+            del self._row_map[row[0]]
+        self._update_row_map(i, len(self.filenames))
+        return row
+
+    def _move(self, i, new_i, row):
+        """ Replace row i with row at new_i, only the rows in between change places
+        """
+        old_filename = self._take_columns(i)[0]
+        self._insert_columns(new_i, row)
+        if self._row_map is not None and old_filename != row[0]:
+            del self._row_map[old_filename]
+        self._update_row_map(min(i, new_i), max(i, new_i) + 1)
+
+    def _update_row_map(self, start, end):
+        """ Put the rows from start up to end in the row map after they moved
+        """
+        if self._row_map is not None:
+            self._row_map.update(zip(self.filenames[start:end], range(start, end)))
+
+    def _insert_columns(self, i, row):
+        filename, title, pinned, mtime = row
+        self.filenames.insert(i, filename)
+        self.titles.insert(i, title)
+        self.pinned.insert(i, 1 if pinned else 0)
+        self.mtimes.insert(i, mtime)
+
+    def _take_columns(self, i):
+        return self.filenames.pop(i), self.titles.pop(i), self.pinned.pop(i), self.mtimes.pop(i)
+
+
+class NoteFilterModel(QtCore.QAbstractListModel):
+    """
+    Shows the NoteListModel rows found by a search, in the list's order or in the search's rank order.
+
+    The shown rows are kept in a row map worked out in one pass over the list when the results change, so applying a
+    search is a single layout change however many notes it hides, and finding the first, next or previous shown row
+    is a lookup. When nothing is filtered the rows are the list's rows and its changes are passed straight on.
+    """
+    def __init__(self, parent=None):
+        super(NoteFilterModel, self).__init__(parent)
+
+        # the note filenames to show, None shows them all
+        self.found = None
+        # note filename -> search rank, None keeps the list's order
+        self.ranks = None
+
+        self._source = None
+        self._rows = None  # shown row -> list row, None when all the list's rows are shown in order
+        self._positions = None  # list row -> shown row or -1 if it's hidden
+        self._layout_indexes = None  # (persistent index, note filename) while the layout changes
+
+    def sourceModel(self):
+        return self._source
+
+    def setSourceModel(self, model):
+        """ Show the rows of a NoteListModel
+
+        :param model: the NoteListModel
+        """
+        self.beginResetModel()
+        self._source = model
+        self._update_rows()
+        self.endResetModel()
+        model.rowsAboutToBeInserted.connect(self._source_rows_about_to_be_inserted)
+        model.rowsInserted.connect(self._source_rows_inserted)
+        model.rowsAboutToBeRemoved.connect(self._source_rows_about_to_be_removed)
+        model.rowsRemoved.connect(self._source_rows_removed)
+        model.rowsAboutToBeMoved.connect(self._source_rows_about_to_be_moved)
+        model.rowsMoved.connect(self._source_rows_moved)
+        model.layoutAboutToBeChanged.connect(self._begin_layout_change)
+        model.layoutChanged.connect(self._end_layout_change)
+        model.modelAboutToBeReset.connect(self.beginResetModel)
+        model.modelReset.connect(self._source_reset)
+        model.dataChanged.connect(self._source_data_changed)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid() or self._source is None:
+            return 0
+        if self._rows is None:
+            return len(self._source.filenames)
+        return len(self._rows)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        return self._source.data(self.mapToSource(index), role)
+
+    def source_row(self, row):
+        """ The list row of a shown row
+        """
+        if self._rows is None:
+            return row
+        return self._rows[row]
+
+    def shown_row(self, source_row):
+        """ The shown row of a list row, or -1 if it's hidden
+        """
+        if self._positions is None:
+            return source_row
+        return self._positions[source_row]
+
+    def mapToSource(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        return self._source.index(self.source_row(index.row()))
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid():
+            return QtCore.QModelIndex()
+        row = self.shown_row(source_index.row())
+        if row < 0:
+            return QtCore.QModelIndex()
+        return self.index(row)
+
+    def set_results(self, found, ranking=None):
+        """ Show only the found notes, the views are told with a single layout change
+
+        :param found: a set of note filenames, or None to show all the notes
+        :param ranking: a list of note filenames in rank order to show the found notes in that order
+        """
+        if found is None and self.found is None:
+            # already showing all the notes
+            return
+        self._begin_layout_change()
+        self.found = found
+        if ranking is None:
+            self.ranks = None
+        else:
+            self.ranks = dict((filename, i) for i, filename in enumerate(ranking))
+        self._end_layout_change()
+
+    def _update_rows(self):
+        """ Work out the row map from the search results in one pass over the list
+        """
+        if self.found is None or self._source is None:
+            self._rows = None
+            self._positions = None
+            return
+        filenames = self._source.filenames
+        found = self.found
+        rows = [i for i, filename in enumerate(filenames) if filename in found]
+        if self.ranks is not None:
+            # the ranked notes go first in rank order, the rest stay in the list's order
+            ranks = self.ranks
+            ranked = sorted((i for i in rows if filenames[i] in ranks), key=lambda i: ranks[filenames[i]])
+            rows = ranked + [i for i in rows if filenames[i] not in ranks]
+        positions = array(str('l'), [-1]) * len(filenames)
+        for shown, row in enumerate(rows):
+            positions[row] = shown
+        self._rows = array(str('l'), rows)
+        self._positions = positions
+
+    def _begin_layout_change(self, *args):
+        self.layoutAboutToBeChanged.emit()
+        # the views' current and selected rows are put back on the same notes
+        self._layout_indexes = [(index, index.data(NoteListModel.FilenameRole))
+                                for index in self.persistentIndexList()]
+
+    def _end_layout_change(self, *args):
+        self._update_rows()
+        old_indexes = []
+        new_indexes = []
+        for index, filename in self._layout_indexes:
+            source_row = self._source.row_of(filename)
+            old_indexes.append(index)
+            if source_row is None:
+                new_indexes.append(QtCore.QModelIndex())
+            else:
+                new_indexes.append(self.mapFromSource(self._source.index(source_row)))
+        self._layout_indexes = None
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
+
+    def _source_rows_about_to_be_inserted(self, parent, first, last):
+        if self._rows is None:
+            self.beginInsertRows(QtCore.QModelIndex(), first, last)
+        else:
+            self._begin_layout_change()
+
+    def _source_rows_inserted(self, *args):
+        if self._rows is None:
+            self.endInsertRows()
+        else:
+            self._end_layout_change()
+
+    def _source_rows_about_to_be_removed(self, parent, first, last):
+        if self._rows is None:
+            self.beginRemoveRows(QtCore.QModelIndex(), first, last)
+        else:
+            self._begin_layout_change()
+
+    def _source_rows_removed(self, *args):
+        if self._rows is None:
+            self.endRemoveRows()
+        else:
+            self._end_layout_change()
+
+    def _source_rows_about_to_be_moved(self, parent, first, last, destination_parent, destination):
+        if self._rows is None:
+            self.beginMoveRows(QtCore.QModelIndex(), first, last, QtCore.QModelIndex(), destination)
+        else:
+            self._begin_layout_change()
+
+    def _source_rows_moved(self, *args):
+        if self._rows is None:
+            self.endMoveRows()
+        else:
+            self._end_layout_change()
+
+    def _source_reset(self):
+        self._update_rows()
+        self.endResetModel()
+
+    def _source_data_changed(self, top_left, bottom_right, *args):
+        if self._positions is None:
+            rows = [top_left.row(), bottom_right.row()]
+        else:
+            rows = [row for row in self._positions[top_left.row():bottom_right.row() + 1] if row >= 0]
+        if len(rows) > 0:
+            self.dataChanged.emit(self.index(min(rows)), self.index(max(rows)))
@@ -3,33 +3,79 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import absolute_import
 
-import glob
 import os
+import time
 
 # Import Qt modules
 from PySide import QtCore, QtGui
 
-from Motome.Models.NoteListWidgetItem import NoteListWidgetItem
+from Motome.Models.BulkIndexer import BulkIndexer, read_note_file
+from Motome.Models.DirectoryScanner import DirectoryScanner
+from Motome.Models.FileWorker import FileWorker
+from Motome.Models.NoteCatalog import NoteCatalog
+from Motome.Models.NoteIndex import NoteIndex
+from Motome.Models.NoteListModel import NoteListModel, NoteFilterModel
 from Motome.Models.NoteModel import NoteModel
+from Motome.Models.Utils import count_stat_calls
 
 from Motome.config import NOTE_EXTENSION
 
 
-class NoteListWidget(QtGui.QListWidget):
+class NoteListWidget(QtGui.QListView):
+    # emitted after changes made outside of Motome were applied to the list
+    notes_changed = QtCore.Signal()
+    # emitted when another note becomes the current one
+    current_note_changed = QtCore.Signal()
 
     def __init__(self, notemodel_dict):
         super(NoteListWidget, self).__init__()
 
         self.session_notemodel_dict = notemodel_dict
+        self.session_note_index = NoteIndex()
+        # the SQLite full text index, only set when that search engine is used
+        self.session_fulltext_index = None
 
-        self.itemDoubleClicked.connect(self._dblclick_pin_note)
+        # the rows are kept in a NoteListModel, the view shows them through a NoteFilterModel with the search results
+        self.notes_model = NoteListModel(self)
+        self.filter_model = NoteFilterModel(self)
+        self.filter_model.setSourceModel(self.notes_model)
+        self.setModel(self.filter_model)
+        # the rows are all the same height so the view doesn't ask for every row to lay them out
+        self.setUniformItemSizes(True)
 
-        self.previous_item = None
-        self.currentItemChanged.connect(self._update_previous_item)
+        self.doubleClicked.connect(self._dblclick_pin_note)
+
+        self.previous_filename = None
+        self.selectionModel().currentChanged.connect(self._update_current)
+
+        # up to this many changed notes are moved into place one at a time, more re-sort the whole list
+        self.incremental_sort_limit = 64
+
+        # at least this many notes to read into the indexes are read by the bulk indexer's worker processes, e.g. the
+        # first time a notes directory is opened
+        self.bulk_index_limit = 256
+        self.bulk_indexer = BulkIndexer(self._apply_read_results, self)
+        # the notes read in the background may match the search
+        self.bulk_indexer.finished.connect(self.notes_changed)
+        # the note files are saved, recorded and read again on a background thread
+        self.file_worker = FileWorker(self)
 
         self._notes_dir = None
+        self.scanner = DirectoryScanner(None, NOTE_EXTENSION)
         self.dir_watcher = QtCore.QFileSystemWatcher(self)
-        # self.dir_watcher.directoryChanged.connect(self.update_list)
+        self.dir_watcher.directoryChanged.connect(self._queue_directory_change)
+
+        # directory change signals come in bursts (e.g. a sync or a checkout), the directory is scanned once a burst
+        # has been quiet for watch_interval, or after watch_max_wait if it keeps going
+        self.watch_interval = 500  # msec
+        self.watch_max_wait = 3000  # msec
+        self.watch_timer = QtCore.QTimer(self)
+        self.watch_timer.setSingleShot(True)
+        self.watch_timer.timeout.connect(self._process_directory_changes)
+        self._burst_start = None
+
+        # note filenames Motome itself changed on disk since the last scan, the scan leaves them alone
+        self.suppressed = set()
 
         self.update_list()
 
@@ -39,56 +85,175 @@ class NoteListWidget(QtGui.QListWidget):
 
     @notes_dir.setter
     def notes_dir(self, value):
+        self.bulk_indexer.stop()
         self._notes_dir = value
         old_paths = self.dir_watcher.directories()
         if len(old_paths) > 0:
             self.dir_watcher.removePaths(old_paths)
         self.dir_watcher.addPath(value)
-        self.clear()
+        self.notes_model.set_notes([])
+        self.scanner = DirectoryScanner(value, NOTE_EXTENSION)
         self.update_list()
-        self.setCurrentRow(0)
+        self.select_row(0)
+
+    @property
+    def current_filename(self):
+        index = self.currentIndex()
+        if not index.isValid():
+            return None
+        return index.data(NoteListModel.FilenameRole)
 
     @property
-    def all_items(self):
-        return self.findItems('*', QtCore.Qt.MatchWildcard)
+    def current_note(self):
+        return self._get_note(self.current_filename)
 
     @property
-    def all_visible_items(self):
-        items = []
-        for item in self.all_items:
-            if not item.isHidden():
-                items.append(item)
-        return items
+    def previous_note(self):
+        return self._get_note(self.previous_filename)
+
+    def unrecorded_notes(self):
+        """ The notes whose file version isn't recorded in their history archive, in list order
+
+        A catalog only builds the notes its history summaries don't show as recorded.
+
+        :return: a list of NoteModels
+        """
+        listed = zip(self.notes_model.filenames, self.notes_model.mtimes)
+        if isinstance(self.session_notemodel_dict, NoteCatalog):
+            filenames = self.session_notemodel_dict.unrecorded(listed)
+        else:
+            filenames = [filename for filename, mtime in listed]
+        notes = [self._get_note(filename) for filename in filenames]
+        return [note for note in notes if note is not None and not note.recorded]
 
     def update_list(self):
-        self._update_notemodel_dict()
-        for value in self.session_notemodel_dict.values():
-            if len(self.findItems(value.title, QtCore.Qt.MatchWildcard)) == 0:
-                n = NoteListWidgetItem(value)
-                self.addItem(n)
-        self.sortItems(QtCore.Qt.DescendingOrder)
-
-    def search_noteitems(self, search_object):
-        for nw in self.all_items:
-            if not search_object.search_notemodel(nw.notemodel):
-                nw.setHidden(True)
-            else:
-                nw.setHidden(False)
-        try:
-            self.setCurrentItem(self.all_visible_items[0])
-            return True
-        except IndexError:
-            # no items found
-            self.setCurrentRow(-1)
+        """ Bring the notes and the list up to date with the notes directory, only the changed notes are touched
+
+        :return: boolean True if anything changed
+        """
+        with count_stat_calls('update notes list'):
+            added, removed, modified = self._update_notemodel_dict()
+
+        for filename in removed - added:
+            self.notes_model.remove_note(filename)
+        rows = [self._list_row(filename) for filename in added | modified
+                if filename in self.session_notemodel_dict]
+
+        if len(rows) > self.incremental_sort_limit:
+            # the model is reset, put the current note back without telling anyone it changed
+            current = self.current_filename
+            self.selectionModel().blockSignals(True)
+            self.notes_model.merge_notes(rows)
+            restored = current is not None and self.select_note(current)
+            self.selectionModel().blockSignals(False)
+            if current is not None and not restored:
+                self.current_note_changed.emit()
+        else:
+            for row in rows:
+                self.notes_model.add_note(row)
+        return len(added) + len(removed) + len(modified) > 0
+
+    def update_note(self, note, old_filename=None):
+        """ Move a note's row to its place in the list after the note changed (e.g. pinned, saved or renamed)
+
+        :param note: the changed NoteModel
+        :param old_filename: the note's filename before it was renamed
+        """
+        if old_filename is None:
+            old_filename = note.filename
+        self.notes_model.update_note(old_filename, (note.filename, note.title, note.pinned, note.timestamp))
+
+    def select_row(self, row):
+        """ Make a row of the shown notes the current one
+
+        :param row: the row number, out of range rows clear the current note
+        :return: boolean True if there was a note in the row
+        """
+        index = self.filter_model.index(row, 0)
+        self.setCurrentIndex(index)
+        return index.isValid()
+
+    def select_note(self, filename):
+        """ Make a note the current one, a search hiding it is cleared
+
+        :param filename: the note filename
+        :return: boolean True if the note is in the list
+        """
+        source_row = self.notes_model.row_of(filename)
+        if source_row is None:
             return False
+        row = self.filter_model.shown_row(source_row)
+        if row < 0:
+            self.show_all()
+            row = source_row
+        self.select_row(row)
+        return True
+
+    def select_next(self, step=1):
+        """ Move through the shown notes, looping at each end
+
+        :param step: the number of rows to move, negative moves up
+        """
+        count = self.filter_model.rowCount()
+        if count == 0:
+            return
+        row = self.currentIndex().row()
+        if row < 0:
+            row = 0 if step > 0 else count - 1
+        else:
+            row = (row + step) % count
+        self.select_row(row)
+
+    def find_title(self, title):
+        """ Find a note by its title
+
+        :param title: the title, it can have * and ? wildcards
+        :return: the filename of the first matching note or None
+        """
+        matches = self.notes_model.match(self.notes_model.index(0), QtCore.Qt.DisplayRole, title, 1,
+                                         QtCore.Qt.MatchWildcard)
+        if len(matches) == 0:
+            return None
+        return matches[0].data(NoteListModel.FilenameRole)
+
+    def search_noteitems(self, search_object, ranked=False, limit=None):
+        """ Only show the notes matching the search
+
+        :param search_object: the SearchModel with the query
+        :param ranked: show the notes in order of relevance, only used when the query has words to rank on
+        :param limit: only show this many of the best ranked notes
+        :return: boolean True if any notes were found
+        """
+        ranking = None
+        snippets = dict()
+        if self.session_fulltext_index is not None:
+            ranking = search_object.search_fulltext(self.session_fulltext_index, limit if ranked else None)
+            found = set(filename for __, filename in ranking)
+            snippets = self.session_fulltext_index.snippets(search_object.fulltext_query[0], found)
+            if not ranked or len(search_object.rank_words) == 0:
+                ranking = None
+        elif ranked and len(search_object.rank_words) > 0:
+            ranking = search_object.search_ranked(self.session_note_index, limit)
+            found = set(filename for __, filename in ranking)
+        else:
+            found = search_object.search_index(self.session_note_index)
+
+        self.notes_model.tooltips = snippets
+        if ranking is not None:
+            ranking = [filename for __, filename in ranking]
+        self.filter_model.set_results(found, ranking)
+        return self.select_row(0)
 
     def show_all(self):
-        for nw in self.all_items:
-            nw.setHidden(False)
+        self.notes_model.tooltips = dict()
+        self.filter_model.set_results(None)
 
     def delete_current_item(self):
+        note = self.current_note
+        if note is None:
+            return
         message_box = QtGui.QMessageBox()
-        message_box.setText('Delete {0}?'.format(self.currentItem().notemodel.title))
+        message_box.setText('Delete {0}?'.format(note.title))
         message_box.setInformativeText('Are you sure you want to delete this note?')
         delete_btn = message_box.addButton('Delete', QtGui.QMessageBox.YesRole)
         cancel_btn = message_box.addButton(QtGui.QMessageBox.Cancel)
@@ -98,48 +263,211 @@ class NoteListWidget(QtGui.QListWidget):
         message_box.exec_()
 
         if message_box.clickedButton() == delete_btn:
-            i = self.currentRow()
-            item = self.takeItem(i)
-            if not item.notemodel.remove():
+            if note.is_writing:
+                # a queued save would write the file back
+                self.file_worker.wait()
+            row = self.currentIndex().row()
+            self.notes_model.remove_note(note.filename)
+            if not self.currentIndex().isValid():
+                # the search results don't move the current row on like the full list does
+                self.select_row(min(row, self.filter_model.rowCount() - 1))
+            if not note.remove():
                 message_box = QtGui.QMessageBox()
-                message_box.setText('Delete Error!'.format(item.notemodel.title))
+                message_box.setText('Delete Error!'.format(note.title))
                 message_box.setInformativeText('There was a problem deleting all the note files. Please check the {0} '
                                                'directory for any remaining data.'.format(self.notes_dir))
                 message_box.exec_()
-            else:
-                del item
 
     def rename_current_item(self):
-        self.dir_watcher.blockSignals(True)
-        self.currentItem().notemodel.rename()
-        self.update()
-        self.dir_watcher.blockSignals(False)
-
-    def _dblclick_pin_note(self, noteitem):
-        if noteitem.notemodel.pinned:
-            noteitem.notemodel.pinned = False
+        note = self.current_note
+        if note.is_writing:
+            # the queued saves are for the file under its old name
+            self.file_worker.wait()
+        old_filename = note.filename
+        note.rename()
+        new_filename = note.filename
+        if new_filename != old_filename:
+            if self.session_notemodel_dict.get(old_filename) is note:
+                # a plain dict isn't told about renames like the catalog is
+                del self.session_notemodel_dict[old_filename]
+                self.session_notemodel_dict[new_filename] = note
+            self.suppress_changes([old_filename, new_filename])
+        self.update_note(note, old_filename)
+
+    def suppress_changes(self, filenames):
+        """ Tell the next directory scan that Motome changed these note files itself and already has the changes
+
+        :param filenames: an iterable of note filenames
+        """
+        self.suppressed.update(filenames)
+
+    def _dblclick_pin_note(self, index):
+        note = self._get_note(index.data(NoteListModel.FilenameRole))
+        if note is None:
+            return
+        if note.pinned:
+            note.pinned = False
         else:
-            noteitem.notemodel.pinned = True
-        self.update_list()
+            note.pinned = True
+        self.update_note(note)
+
+    def _get_note(self, filename):
+        if filename is None:
+            return None
+        try:
+            return self.session_notemodel_dict[filename]
+        except KeyError:
+            return None
+
+    def _list_row(self, filename):
+        """ The NoteListModel row of a note, from the catalog when the note isn't built so no note file is read
+
+        :param filename: the note filename
+        :return: a (filename, title, pinned, mtime) tuple
+        """
+        if isinstance(self.session_notemodel_dict, NoteCatalog):
+            title, pinned = self.session_notemodel_dict.summary(filename)
+        else:
+            note = self.session_notemodel_dict[filename]
+            title, pinned = note.title, note.pinned
+        return filename, title, pinned, self.scanner.mtime(filename)
 
     def _update_notemodel_dict(self):
+        """ Apply the changes in the notes directory since the last scan to the session notes and the indexes
+
+        :return: a tuple of (added, removed, modified) sets of note filenames
+        """
         if self.notes_dir is None or self.notes_dir == '':
-            return
-        notepaths = set(glob.glob(self.notes_dir + '/*' + NOTE_EXTENSION))
-        notenames = map(os.path.basename, notepaths)
-        note_keys = set(self.session_notemodel_dict.keys())
-        keys_missing_notes = note_keys - set(notenames)
+            return set(), set(), set()
+        first_scan = len(self.scanner.snapshot) == 0
+        added, removed, modified = self.scanner.scan()
+        if not first_scan:
+            added -= self.suppressed
+            removed -= self.suppressed
+            modified -= self.suppressed
+        self.suppressed = set()
+
+        if first_scan:
+            # the session data may have notes that were removed while Motome wasn't running
+            removed = set(self.session_notemodel_dict.keys()) - added
+            removed |= self.session_note_index.notes - added
+            if self.session_fulltext_index is not None:
+                removed |= self.session_fulltext_index.notes - added
 
-        # remove keys missing notes
-        for filename in keys_missing_notes:
-            del self.session_notemodel_dict[filename]
+        # remove keys and index entries missing notes, keeping any renamed notes to put back under their new names
+        renamed = dict()
+        for filename in removed:
+            if filename in self.session_notemodel_dict:
+                note = self.session_notemodel_dict[filename]
+                if note.filename != filename:
+                    renamed[note.filename] = note
+                del self.session_notemodel_dict[filename]
+            self.session_note_index.remove_note(filename)
+            if self.session_fulltext_index is not None:
+                self.session_fulltext_index.remove_note(filename)
 
         # add notes missing keys
-        for filepath in notepaths:
-            filename = os.path.basename(filepath)
-            if filename not in self.session_notemodel_dict.keys():
-                note = NoteModel(filepath)
+        for filename in added:
+            if filename in renamed:
+                self.session_notemodel_dict[filename] = renamed[filename]
+            elif filename not in self.session_notemodel_dict:
+                note = NoteModel(os.path.join(self.notes_dir, filename))
+                note.index = self.session_note_index
+                note.fulltext = self.session_fulltext_index
                 self.session_notemodel_dict[note.filename] = note
 
-    def _update_previous_item(self, current, previous):
-        self.previous_item = previous
\ No newline at end of file
+        # make sure the new notes keep the indexes updated
+        is_catalog = isinstance(self.session_notemodel_dict, NoteCatalog)
+        if is_catalog:
+            # the catalog hands the indexes to its notes as they're built
+            self.session_notemodel_dict.set_indexes(self.session_note_index, self.session_fulltext_index)
+        to_index = []
+        for filename in added:
+            if not is_catalog:
+                note = self.session_notemodel_dict[filename]
+                note.index = self.session_note_index
+                note.fulltext = self.session_fulltext_index
+            if filename not in self.session_note_index:
+                # new note, or session data from before there was an index
+                to_index.append(filename)
+            elif self.session_fulltext_index is not None and filename not in self.session_fulltext_index:
+                # the full text index was just switched on
+                to_index.append(filename)
+            elif is_catalog and self.session_notemodel_dict.is_stale(filename, self.scanner.mtime(filename)) or \
+                    not is_catalog and self.session_notemodel_dict[filename].is_changed(self.scanner.mtime(filename)):
+                # changed while Motome wasn't running, read with the other notes off the GUI thread
+                to_index.append(filename)
+
+        if len(to_index) < self.bulk_index_limit or \
+                not self.bulk_indexer.start([os.path.join(self.notes_dir, filename) for filename in to_index]):
+            self._read_notes(to_index)
+
+        # notes changed by something else get read again
+        self._read_notes(filename for filename in modified if filename in self.session_notemodel_dict)
+
+        if is_catalog:
+            # the notes were only built to be read into the indexes, the catalog can go back to their records
+            keep = (self.current_filename, self.previous_filename)
+            for filename in added | modified:
+                if filename not in keep:
+                    self.session_notemodel_dict.unload(filename)
+
+        return added, removed, modified
+
+    def _read_notes(self, filenames):
+        """ Read note files into their notes and the indexes on the file worker's thread
+
+        :param filenames: an iterable of note filenames
+        """
+        for filename in filenames:
+            self.file_worker.submit(read_note_file, (os.path.join(self.notes_dir, filename),),
+                                    self._apply_read_result)
+
+    def _apply_read_result(self, result, error):
+        if error is None:
+            self._apply_read_results([result])
+
+    def _apply_read_results(self, results):
+        """ Put the note files read by the bulk indexer or the file worker into their notes and the indexes
+
+        :param results: a list of BulkIndexer.read_note_file results
+        """
+        notes = self.session_notemodel_dict
+        is_catalog = isinstance(notes, NoteCatalog)
+        keep = (self.current_filename, self.previous_filename)
+        changed = []
+        for filepath, mtime, content, metadata, split in results:
+            filename = os.path.basename(filepath)
+            if mtime is None or filename not in notes:
+                continue
+            if is_catalog:
+                # the list rows of notes the catalog only had a filename for change once the notes are read
+                summary = notes.summary(filename)
+                if notes[filename].update_from_parsed(mtime, content, metadata, split) and \
+                        notes.summary(filename) != summary:
+                    changed.append(filename)
+                if filename not in keep:
+                    notes.unload(filename)
+            else:
+                notes[filename].update_from_parsed(mtime, content, metadata, split)
+        self.notes_model.update_notes([self._list_row(filename) for filename in changed])
+
+    def _queue_directory_change(self, path):
+        now = time.time()
+        if self._burst_start is None:
+            self._burst_start = now
+        if not self.watch_timer.isActive() or (now - self._burst_start) * 1000 < self.watch_max_wait:
+            # (re)start the quiet period
+            self.watch_timer.start(self.watch_interval)
+
+    def _process_directory_changes(self):
+        self._burst_start = None
+        if self.update_list():
+            self.notes_changed.emit()
+
+    def _update_current(self, current, previous):
+        if previous.isValid():
+            self.previous_filename = previous.data(NoteListModel.FilenameRole)
+        else:
+            self.previous_filename = None
+        self.current_note_changed.emit()
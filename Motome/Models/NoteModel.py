@@ -3,17 +3,26 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import absolute_import
 
+import ctypes
 import datetime
+import functools
 import hashlib
+import json
 import logging
 import os
+from multiprocessing.pool import ThreadPool
 import re
 import shutil
-import zipfile
+import time
+import weakref
 
 import yaml
 
-from Motome.config import ZIP_EXTENSION, NOTE_EXTENSION, ENCODING, STATUS_TEMPLATE, HISTORY_FOLDER, YAML_BRACKET
+from Motome.config import ZIP_EXTENSION, NOTE_EXTENSION, ENCODING, STATUS_TEMPLATE, HISTORY_FOLDER, YAML_BRACKET, \
+    STAT_CACHE_TTL
+from Motome.Models.HistoryStore import HistoryStore, HistoryEntry
+from Motome.Models.Metadata import dump_metadata, load_metadata
+from Motome.Models.Vocabulary import split_words
 
 # Set up the logger
 logger = logging.getLogger(__name__)
@@ -24,15 +33,55 @@ class NoteModel(object):
     The main note model contains note information and name conversions for a given note.
     It also handles reading and writing data to the note file.
     """
+    # the NoteIndex kept up to date with this note's words, it's set by the notes list and never pickled
+    index = None
+    # the NoteCatalog holding this note's catalog row, it's set by the catalog and never pickled
+    catalog = None
+    # the FullTextIndex kept up to date with this note's text when that search engine is used, never pickled
+    fulltext = None
+    # the (mtime, size) of the history archive the history entries were read from, None if they weren't
+    _history_key = None
+    # a note built from its catalog row only has the number of history entries and the latest one until the entries
+    # are asked for, its _history is None until then
+    _history_count = 0
+    _history_last = None
+    # the history archive's (mtime, size) and when it was taken, it's trusted for stat_ttl seconds like the stat
+    _archive_key = None
+    _archive_key_time = None
+    # the cached os.stat of the note file and when it was taken, see stat()
+    _stat = None
+    _stat_time = None
+    # how many seconds a cached stat is trusted
+    stat_ttl = STAT_CACHE_TTL
+    # the number of times any note file was stat'ed, see Utils.count_stat_calls
+    stat_calls = 0
+    # the modification time of the file version the metadata came from, the content can be from an older one
+    _metadata_seen = -1
+    # how many bytes at the end of a note file are read first to find the metadata
+    trailer_block_size = 4096
+    # the number of writes and records of the note file queued on a FileWorker, the file isn't read back meanwhile
+    _writing = 0
+    # the notes with changes that aren't saved yet by id, so finding them doesn't mean looking through every note
+    _unsaved = weakref.WeakValueDictionary()
+    _is_saved = True
+    # (sha1 of the data last written to the note file, the file's mtime, size and inode after the write), an unchanged
+    # note isn't written again while the file is still the one written
+    _written = None
+
     def __init__(self, filepath=None):
         self.filepath = filepath
-        self.wordset = ''
         self.is_saved = True
+        self.index = None
+        self.catalog = None
+        self.fulltext = None
 
         self._content = ''
         self._metadata = dict()
         self._history = []
         self._last_seen = -1
+        self._metadata_seen = -1
+        self._stat = None
+        self._stat_time = None
 
     def __repr__(self):
         return '<Note: {0}, Last Modified: {1}>'.format(self.notename, self.timestamp)
@@ -43,7 +92,15 @@ class NoteModel(object):
         state = self.__dict__.copy()
         state['_content'] = ''
         state['_history'] = []
-        state['is_saved'] = True
+        state.pop('_history_key', None)
+        state.pop('_archive_key', None)
+        state.pop('_archive_key_time', None)
+        state.pop('_is_saved', None)
+        state.pop('index', None)
+        state.pop('catalog', None)
+        state.pop('fulltext', None)
+        state.pop('_stat', None)
+        state.pop('_stat_time', None)
         return state
 
     def __eq__(self, other):
@@ -51,9 +108,29 @@ class NoteModel(object):
             return False
         return self.filepath == other.filepath
 
+    @property
+    def is_saved(self):
+        return self._is_saved
+
+    @is_saved.setter
+    def is_saved(self, value):
+        self._is_saved = value
+        if value:
+            NoteModel._unsaved.pop(id(self), None)
+        else:
+            NoteModel._unsaved[id(self)] = self
+
+    @classmethod
+    def unsaved_notes(cls):
+        """ The notes with changes that aren't saved yet, the changed content, metadata or pinned
+
+        :return: a list of NoteModels
+        """
+        return list(cls._unsaved.values())
+
     @property
     def content(self):
-        if self.timestamp > self._last_seen or self._content == '':
+        if self._writing == 0 and (self.timestamp > self._last_seen or self._content == ''):
             self._update_from_file()
         return self._content
 
@@ -66,8 +143,9 @@ class NoteModel(object):
 
     @property
     def metadata(self):
-        if self.timestamp > self._last_seen:
-            self._update_from_file()
+        if self._writing == 0 and self.timestamp > self._metadata_seen:
+            # only the metadata trailer is read, the content waits until it's asked for
+            self._update_metadata_from_file()
         return self._metadata
 
     @metadata.setter
@@ -78,19 +156,48 @@ class NoteModel(object):
         """
         self._metadata = value
         self.is_saved = False
+        self._update_index_metadata()
+        self._update_catalog()
         # self._save_to_file()
 
     @property
     def history(self):
-        zip_filepath = self.historypath
-        self._history = []
-        try:
-            with zipfile.ZipFile(zip_filepath, 'r') as myzip:
-                self._history = sorted(myzip.infolist(), key=lambda x: x.filename)
-        except IOError:
-            pass
+        """ The versions in the note's history archive, the archive is only read again when it changed
+
+        :return: a list of HistoryEntry oldest first
+        """
+        archive_key = self._current_archive_key()
+        if self._history is None or archive_key != self._history_key:
+            self._history = [] if archive_key is None else HistoryStore(self.historypath).entries()
+            self._history_key = archive_key
         return self._history
 
+    @property
+    def history_count(self):
+        """ The number of versions in the note's history archive, the archive isn't read while it's unchanged
+        """
+        return self._history_summary()[0]
+
+    def _current_archive_key(self):
+        """ The history archive's HistoryStore.archive_key, the stat behind it is trusted for stat_ttl seconds
+        """
+        now = time.time()
+        if self._archive_key_time is None or now - self._archive_key_time > self.stat_ttl:
+            self._archive_key = HistoryStore(self.historypath).archive_key()
+            self._archive_key_time = now
+        return self._archive_key
+
+    def _history_summary(self):
+        """ The number of versions in the note's history archive and the latest HistoryEntry or None, from the
+        catalog row's summary while the archive is unchanged
+
+        :return: a tuple of (count, latest entry)
+        """
+        if self._history is None and self._current_archive_key() == self._history_key:
+            return self._history_count, self._history_last
+        history = self.history
+        return len(history), history[-1] if len(history) > 0 else None
+
     @property
     def pinned(self):
         try:
@@ -108,21 +215,16 @@ class NoteModel(object):
         else:
             self._metadata['pinned'] = 0
         self.is_saved = False
+        self._update_catalog()
         # self.save_to_file()
 
     @property
     def recorded(self):
-        if len(self.history) == 0:
+        count, latest = self._history_summary()
+        if count == 0:
             return False
         else:
-            two_sec = datetime.timedelta(seconds=2)
-            dt = self.history[-1].date_time
-            latest_dt = datetime.datetime(*dt)
-            current_dt = datetime.datetime.fromtimestamp(self.timestamp)
-            if abs(current_dt - latest_dt) < two_sec:
-                return True
-            else:
-                return False
+            return self.is_recorded(latest.date_time, self.timestamp)
 
     @property
     def filename(self):
@@ -145,6 +247,7 @@ class NoteModel(object):
         :param value: string of the new name
         """
         basepath, ext = os.path.splitext(self.filepath)
+        oldname = self.filename
         newname = value + ext
         newpath = ''.join([basepath[:-len(self.notename)], newname])
         try:
@@ -158,6 +261,13 @@ class NoteModel(object):
         except IOError:
             pass
         self.filepath = newpath
+        self.invalidate_stat()
+        if self.index is not None:
+            self.index.rename_note(oldname, newname)
+        if self.fulltext is not None:
+            self.fulltext.rename_note(oldname, newname)
+        if self.catalog is not None:
+            self.catalog.rename_note(oldname, self)
 
     @property
     def historypath(self):
@@ -184,10 +294,30 @@ class NoteModel(object):
 
     @property
     def timestamp(self):
-        try:
-            return os.stat(self.filepath).st_mtime
-        except OSError:
+        st = self.stat()
+        if st is None:
             return -1
+        return st.st_mtime
+
+    def stat(self):
+        """ The os.stat of the note file, cached for stat_ttl seconds or until invalidate_stat is called
+
+        :return: the os.stat_result or None if the file isn't there
+        """
+        now = time.time()
+        if self._stat_time is None or now - self._stat_time > self.stat_ttl:
+            NoteModel.stat_calls += 1
+            try:
+                self._stat = os.stat(self.filepath)
+            except OSError:
+                self._stat = None
+            self._stat_time = now
+        return self._stat
+
+    def invalidate_stat(self):
+        """ Forget the cached stat, e.g. when the note file is known to have changed
+        """
+        self._stat_time = None
 
     @property
     def first_line(self):
@@ -216,40 +346,95 @@ class NoteModel(object):
         :returns: a tuple containing the unparsed note content, a date string ('YYYYMMDDHHMMSS')
         """
         try:
-            zip_filepath = self.historypath
-            with zipfile.ZipFile(zip_filepath, 'r') as myzip:
-                old_content_bytes = myzip.read(self.history[index])
-                old_content = old_content_bytes.decode(ENCODING)
-                old_date = self.history[index].filename[:-(len(ZIP_EXTENSION)+1)]
+            old_content = HistoryStore(self.historypath).read(index)
+            old_date = HistoryStore.version_name(self.history[index])[:14]
         except Exception as e:
             logger.debug('[NoteModel/load_old_note] %s'%e)
             old_content = None
             old_date = None
         return old_content, old_date
 
-    def record(self):
-        """ Write the old file data to the zip archive
+    @property
+    def is_writing(self):
+        """ Are writes or records of the note file still queued on a FileWorker
+        """
+        return self._writing > 0
+
+    def record(self, worker=None, callback=None):
+        """ Save the note and add this version of the file to the history archive
+
+        :param worker: a FileWorker to save and record the note on, None does it here
+        :param callback: called with the note once the version is in the archive
         """
-        history_dir = os.path.join(self.notedirectory, HISTORY_FOLDER)
-        now = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-        old_filename = now + NOTE_EXTENSION
-        old_filepath = os.path.join(history_dir, old_filename)
-        
-        # create the history storage directory
-        if not os.path.exists(history_dir):
+        self.save_to_file(worker=worker)
+        args = self._record_args()
+        if worker is None:
             try:
-                os.makedirs(history_dir)
-            except OSError as e:
+                history = self.record_note_file(*args)
+            except (IOError, OSError) as e:
                 logger.warning(e)
                 return
+            self._record_done(callback, history, None)
+        else:
+            self._submit(worker, self.record_note_file, args, functools.partial(self._record_done, callback))
+
+    @classmethod
+    def record_notes(cls, notes, worker=None, threads=4):
+        """ Save notes and record them all at once, each note's archive written on its own thread, e.g. when
+        Motome closes
 
-        self.save_to_file()
-        self.save_to_file(filepath=old_filepath)
+        This blocks until all the versions are in the archives.
 
-        zip_filepath = self.historypath  # self.filepath + ZIP_EXTENSION
-        with zipfile.ZipFile(zip_filepath, 'a') as myzip:
-            myzip.write(old_filepath, old_filename)
-        os.remove(old_filepath)
+        :param notes: a list of NoteModels
+        :param worker: a FileWorker to save the notes on, None saves them here
+        :param threads: the most archives written at the same time
+        """
+        if len(notes) == 0:
+            return
+        if worker is not None:
+            # records already queued on the worker write to the same archives
+            worker.wait()
+        # the file data is handed to the archives, the records don't wait for the saves
+        jobs = []
+        for note in notes:
+            note.save_to_file(worker=worker)
+            jobs.append((note, note._record_args()))
+        pool = ThreadPool(min(threads, len(jobs)))
+        try:
+            results = pool.map(cls._try_record, [args for note, args in jobs])
+        finally:
+            pool.close()
+            pool.join()
+        for (note, args), (history, error) in zip(jobs, results):
+            note._record_done(None, history, error)
+
+    @classmethod
+    def _try_record(cls, args):
+        """ record_note_file on a record_notes thread, a tuple of (the result, the error or None)
+        """
+        try:
+            return cls.record_note_file(*args), None
+        except (IOError, OSError) as e:
+            logger.warning('[NoteModel/record_notes] %r' % e)
+            return None, e
+
+    def _record_args(self):
+        """ The record_note_file arguments to record the note as it is now
+        """
+        # the version is named for when it was asked for, not when the worker gets to it
+        old_filename = datetime.datetime.now().strftime('%Y%m%d%H%M%S') + NOTE_EXTENSION
+        return (self.filepath, self.historypath, old_filename,
+                self.note_file_data(self.content, self.metadata))
+
+    def _record_done(self, callback, history, error):
+        if error is None:
+            # the archive doesn't need reading again
+            self._history, self._history_key = history
+            self._archive_key = self._history_key
+            self._archive_key_time = time.time()
+            self._update_catalog()
+        if callback is not None:
+            callback(self)
 
     def rename(self):
         """ Renames the note using the metadata['title'] value
@@ -276,12 +461,21 @@ class NoteModel(object):
                 except OSError as e:
                     logger.warning(e)
         if ret:
-            # clear all info
-            self.wordset = ''
+            self.invalidate_stat()
+            if self.index is not None:
+                self.index.remove_note(self.filename)
+            if self.fulltext is not None:
+                self.fulltext.remove_note(self.filename)
+            # clear all info, there's nothing left to save
+            self.is_saved = True
+            self._written = None
             self._content = ''
             self._metadata = {}
             self._history = []
+            self._history_key = None
+            self._archive_key_time = None
             self._last_seen = -1
+            self._metadata_seen = -1
         return ret
 
     def get_status(self):
@@ -311,28 +505,236 @@ class NoteModel(object):
         """ Update the object's internal values from the file
         """
         try:
-            self._content, self._metadata = self.parse_note_content(self.enc_read(self.filepath))
-            self._last_seen = self.timestamp
-            self.wordset = ' '.join(set(re.findall(r'\w+', self._content.lower())))
+            content, metadata = self.parse_note_content(self.enc_read(self.filepath))
         except IOError:
             # file not there or couldn't access it, things may be different
             self._last_seen = -1
+            return
+        self.invalidate_stat()
+        self._update_from_parsed(self.timestamp, content, metadata)
+
+    def update_from_parsed(self, mtime, content, metadata, split=None):
+        """ Update the object's internal values from a file version read and parsed elsewhere, e.g. by the BulkIndexer
+
+        Unsaved changes and file versions no newer than the one already read are left alone.
 
-    def save_to_file(self, filepath=None):
+        :param mtime: the modification time of the file version, from before it was read
+        :param content: the note content
+        :param metadata: the note metadata dict
+        :param split: the content's words from split_words, or None to split them here
+        :return: boolean True if the note was updated
+        """
+        if not self.is_saved or mtime <= self._last_seen:
+            return False
+        self._update_from_parsed(mtime, content, metadata, split)
+        return True
+
+    def _update_from_parsed(self, mtime, content, metadata, split=None):
+        self._content = content
+        self._last_seen = mtime
+        if self._last_seen != self._metadata_seen:
+            # the metadata in memory, which may have unsaved changes, is from this file version
+            self._metadata = metadata
+            self._metadata_seen = self._last_seen
+        self._update_index_words(split)
+        self._update_index_metadata()
+        self._update_catalog()
+
+    def _update_metadata_from_file(self):
+        """ Update the object's metadata from the file's metadata trailer without reading the content
+        """
+        try:
+            self._metadata = self.read_metadata(self.filepath)
+        except IOError:
+            self._metadata_seen = -1
+            return
+        self.invalidate_stat()
+        self._metadata_seen = self.timestamp
+        self._update_index_metadata()
+        self._update_catalog()
+
+    def save_to_file(self, filepath=None, worker=None, callback=None):
         """ Save the content and metadata to the note file
+
+        With a worker the note counts as saved straight away and its file isn't read back until the write is done,
+        the index and catalog are updated then.
+
+        :param filepath: the file to write, the note file if None
+        :param worker: a FileWorker to write the file on, None writes it here
+        :param callback: called with the note once the file is written
         """
         if filepath is None:
             filepath = self.filepath
         if not 'title' in self.metadata.keys():
             self.metadata['title'] = self.notename
-        if self.content[-1] == '\n':
-            filedata = self.content
+        # a copy, the note can change again before the worker gets to it
+        written = self._written if filepath == self.filepath else None
+        args = (filepath, self.content, dict(self.metadata), written)
+        if worker is None:
+            # only saved once written, a failed write leaves the note unsaved
+            result = self.write_note_file(*args)
+            self.is_saved = True
+            self._write_done(filepath, callback, result, None)
         else:
-            filedata = self.content + '\n'
-        # use safe_dump to prevent dumping non-standard YAML tags
-        filedata += YAML_BRACKET + '\n' + yaml.safe_dump(self.metadata, default_flow_style=False) + YAML_BRACKET
-        self.enc_write(filepath, filedata)
-        self.is_saved = True
+            self.is_saved = True
+            self._submit(worker, self.write_note_file, args, functools.partial(self._write_done, filepath, callback))
+
+    def _submit(self, worker, function, args, done):
+        """ Queue a job on the note file, the file isn't read until done is called with its result and error
+        """
+        self._writing += 1
+
+        def job_done(result, error):
+            self._writing -= 1
+            done(result, error)
+        worker.submit(function, args, job_done)
+
+    def _write_done(self, filepath, callback, result, error):
+        if error is not None:
+            # it's tried again with the next save
+            self.is_saved = False
+            return
+        stat, written = result
+        if filepath == self.filepath:
+            # what's in memory is what's in the file now, no need to read it back
+            self._written = written
+            self._stat = stat
+            self._stat_time = time.time()
+            self._last_seen = stat.st_mtime
+            self._metadata_seen = self._last_seen
+            self._update_index_words()
+            self._update_index_metadata()
+            self._update_catalog()
+        if callback is not None:
+            callback(self)
+
+    def _update_index_words(self, split=None):
+        """ Push the note's words, in order, to the indexes
+
+        :param split: the content's words from split_words, or None to split them here
+        """
+        if self.index is not None:
+            distinct, indexes = split_words(self._content) if split is None else split
+            self.index.update_note(self.filename, list(map(distinct.__getitem__, indexes)))
+        if self.fulltext is not None:
+            self.fulltext.update_note(self.filename, self._content)
+
+    def catalog_record(self):
+        """ Build the note's NoteCatalog row from what's in memory
+
+        :return: a tuple in NoteCatalog.COLUMNS order
+        """
+        try:
+            metadata = json.dumps(self._metadata)
+        except (TypeError, ValueError):
+            # metadata JSON can't hold (e.g. dates), the file will be read instead
+            metadata = None
+        try:
+            title = self._metadata['title']
+        except (TypeError, KeyError):
+            title = self.unsafename
+        try:
+            tags = '{0}'.format(self._metadata['tags'])
+        except (TypeError, KeyError):
+            tags = None
+        try:
+            pinned = 1 if int(self._metadata['pinned']) > 0 else 0
+        except (KeyError, TypeError, ValueError):
+            pinned = 0
+        if self._history_key is None:
+            history = None
+        else:
+            # enough to tell the history label and whether the note is recorded without opening the archive, while
+            # it's the one the summary came from
+            if self._history is None:
+                count, latest = self._history_count, self._history_last
+            else:
+                count, latest = len(self._history), self._history[-1] if len(self._history) > 0 else None
+            history = json.dumps({'key': self._history_key, 'count': count, 'latest': latest})
+        # the modification time of the file version the data came from, a newer file gets read again
+        return self.filename, self._metadata_seen, '{0}'.format(title), tags, pinned, metadata, history
+
+    @classmethod
+    def from_catalog_record(cls, notes_dir, record):
+        """ Build a note from its NoteCatalog row without reading the note file
+
+        :param notes_dir: the notes directory path
+        :param record: a tuple in NoteCatalog.COLUMNS order
+        :return: a NoteModel
+        """
+        filename, mtime, title, tags, pinned, metadata, history = record
+        note = cls(os.path.join(notes_dir, filename))
+        if history is not None:
+            history = json.loads(history)
+            # the entries are read from the archive when they're asked for
+            note._history = None
+            note._history_key = tuple(history['key'])
+            note._history_count = history['count']
+            if history['latest'] is not None:
+                name, date_time = history['latest']
+                note._history_last = HistoryEntry(name, tuple(date_time))
+        if metadata is not None:
+            note._metadata = json.loads(metadata)
+            note._metadata_seen = mtime
+        return note
+
+    def reload_if_changed(self, mtime=None):
+        """ Read the note file again if it changed since it was last read, e.g. it was edited by another program
+
+        :param mtime: the file's modification time if it's already known, saves a stat
+        :return: boolean True if the note was read again
+        """
+        if mtime is None:
+            mtime = self.timestamp
+        if self.is_changed(mtime):
+            self._update_from_file()
+            return True
+        return False
+
+    def is_changed(self, mtime):
+        """ Is a note file with this modification time newer than what was last read from it or written to it
+
+        :param mtime: the file's modification time
+        :return: boolean True if the note file needs to be read again
+        """
+        return self._writing == 0 and mtime > max(self._last_seen, self._metadata_seen)
+
+    def update_index(self):
+        """ Read the note file and push its words, their positions and the note's tags to the indexes
+        """
+        if self.index is None and self.fulltext is None:
+            return
+        self._update_from_file()
+
+    def _update_catalog(self):
+        """ Stage the note's changed catalog row
+        """
+        if self.catalog is not None:
+            self.catalog.update_note(self)
+
+    def _update_index_metadata(self):
+        """ Push the note's title and metadata tags to the indexes
+        """
+        if self.index is None and self.fulltext is None:
+            return
+        try:
+            tags = self._metadata['tags']
+        except (KeyError, TypeError):
+            tags = None
+        if tags is None:
+            tags = ''
+        try:
+            title = self._metadata['title']
+        except (KeyError, TypeError):
+            title = self.unsafename
+        tags = '{0}'.format(tags).split()
+        title = '{0}'.format(title)
+        if self.index is not None:
+            self.index.update_note_tags(self.filename, tags)
+            self.index.update_note_title(self.filename, title)
+        if self.fulltext is not None:
+            self.fulltext.update_note_tags(self.filename, tags)
+            self.fulltext.update_note_title(self.filename, title)
 
     @staticmethod
     def safe_filename(filename):
@@ -353,35 +755,177 @@ class NoteModel(object):
         :param data: file data
         :return: content str, metadata dict
         """
-        meta = dict()
+        # find the metadata between the last two brackets at the end of the document
+        end = data.rfind(YAML_BRACKET)
+        start = data.rfind(YAML_BRACKET, 0, end) if end > 0 else -1
+        if start < 0:
+            return data, dict()
         try:
-            # find the metadata at the end of the document
-            s = data.split(YAML_BRACKET)
-            m = s[-2]
-            content = ''.join(s[:-2])
-            meta = yaml.safe_load(m.strip())  # use safe_load to prevent loading non-standard YAML tags
-            # sanity check, is it valid metadata?
-            if meta is None or 'title' not in meta.keys():
-                meta = dict()
-                content = data
-        except IndexError:
-            content = data
+            meta = load_metadata(data[start + len(YAML_BRACKET):end])
         except yaml.YAMLError:
-            content = data
-        return content, meta
+            return data, dict()
+        # sanity check, is it valid metadata?
+        if not isinstance(meta, dict) or 'title' not in meta.keys():
+            return data, dict()
+        return data[:start], meta
+
+    @classmethod
+    def read_metadata(cls, filepath):
+        """ Read just the metadata at the end of a note file, the content before it isn't read
+
+        The end of the file is read in growing blocks until the last two YAML brackets are found.
+
+        :param filepath: the path to the note file
+        :return: metadata dict, empty if the file has no valid metadata
+        """
+        bracket = YAML_BRACKET.encode(ENCODING)
+        with open(filepath.encode(ENCODING), mode='rb') as f:
+            f.seek(0, os.SEEK_END)
+            file_size = f.tell()
+            block_size = cls.trailer_block_size
+            while True:
+                start = max(file_size - block_size, 0)
+                f.seek(start)
+                parts = f.read().rsplit(bracket, 2)
+                if len(parts) == 3 or start == 0:
+                    break
+                block_size *= 2
+        if len(parts) < 3:
+            return dict()
+        try:
+            meta = load_metadata(parts[1].decode(ENCODING))
+        except (yaml.YAMLError, UnicodeDecodeError):
+            return dict()
+        # sanity check, is it valid metadata?
+        if not isinstance(meta, dict) or 'title' not in meta.keys():
+            return dict()
+        return meta
+
+    @classmethod
+    def write_note_file(cls, filepath, content, metadata, written=None):
+        """ Write a note file from a note's content and metadata, this runs on the FileWorker thread for background
+        saves
+
+        The note file isn't written if it's still the file last written with the same data.
+
+        :param filepath: the path to the file
+        :param content: the note's content
+        :param metadata: the note's metadata dict
+        :param written: what was written to the file last, from an earlier call's result, or None
+        :return: a tuple of (the os.stat of the file, what was written for the next call's written)
+        """
+        ufiledata = cls.note_file_data(content, metadata).encode(ENCODING)
+        digest = hashlib.sha1(ufiledata).hexdigest()
+        if written is not None and written[0] == digest:
+            try:
+                NoteModel.stat_calls += 1
+                stat = os.stat(filepath)
+            except OSError:
+                stat = None
+            if stat is not None and (stat.st_mtime, stat.st_size, stat.st_ino) == written[1:]:
+                return stat, written
+        cls.replace_file(filepath, ufiledata)
+        NoteModel.stat_calls += 1
+        stat = os.stat(filepath)
+        return stat, (digest, stat.st_mtime, stat.st_size, stat.st_ino)
 
     @staticmethod
-    def enc_write(filepath, filedata):
+    def note_file_data(content, metadata):
+        """ The text of a note file
+
+        :param content: the note's content
+        :param metadata: the note's metadata dict
+        :return: the note file data, the content followed by the metadata between YAML brackets
+        """
+        filedata = content if content.endswith('\n') else content + '\n'
+        return filedata + YAML_BRACKET + '\n' + dump_metadata(metadata) + YAML_BRACKET
+
+    @classmethod
+    def record_note_file(cls, filepath, zip_filepath, old_filename, data=None):
+        """ Add a version of a note file to its history zip archive, this runs on the FileWorker thread for background
+        records
+
+        :param filepath: the path to the note file
+        :param zip_filepath: the path to the note's history archive
+        :param old_filename: the name of the version in the archive
+        :param data: the note file data to record, None reads it from the note file
+        :return: a tuple of (the list of HistoryEntry of the archive's versions, the archive's key from
+                 HistoryStore.archive_key)
+        """
+        if data is None:
+            data = cls.enc_read(filepath)
+        if data is None:
+            raise IOError('{0} could not be decoded'.format(filepath))
+        store = HistoryStore(zip_filepath)
+        entries = store.append(data, old_filename)
+        return entries, store.archive_key()
+
+    @classmethod
+    def enc_write(cls, filepath, filedata):
         """ Encode and write data to a file (unicode inside, bytes outside)
 
         :param filepath: the path to the output file
         :param filedata: the data to write
         """
-        # encode things
+        cls.replace_file(filepath, filedata.encode(ENCODING))
+
+    @staticmethod
+    def replace_file(filepath, data):
+        """ Write bytes to a hidden temporary file next to a file and then put it in the file's place, so the file is
+        never seen half written and sync tools see one change
+
+        The file is replaced in one step, with os.replace or, on Python 2, a rename outside Windows and MoveFileEx on
+        Windows.
+
+        :param filepath: the path to the output file
+        :param data: the bytes to write
+        """
         ufilepath = filepath.encode(ENCODING)
-        ufiledata = filedata.encode(ENCODING)
-        with open(ufilepath, mode='wb') as f:
-            f.write(ufiledata)
+        directory, filename = os.path.split(ufilepath)
+        temp_filepath = os.path.join(directory, b'.' + filename + b'.tmp')
+        try:
+            with open(temp_filepath, mode='wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(ufilepath):
+                shutil.copymode(ufilepath, temp_filepath)
+            try:
+                os.replace(temp_filepath, ufilepath)
+            except AttributeError:
+                # Python 2, rename only replaces an existing file outside Windows
+                if os.name == 'nt':
+                    NoteModel.windows_replace(temp_filepath.decode(ENCODING), filepath)
+                else:
+                    os.rename(temp_filepath, ufilepath)
+        except (IOError, OSError):
+            if os.path.exists(temp_filepath):
+                os.remove(temp_filepath)
+            raise
+
+    @staticmethod
+    def is_recorded(date_time, mtime):
+        """ Is the note file version with a modification time the latest version in its history archive
+
+        :param date_time: the date_time tuple of the latest HistoryEntry
+        :param mtime: the note file's modification time
+        :return: boolean True if the version was recorded
+        """
+        two_sec = datetime.timedelta(seconds=2)
+        latest_dt = datetime.datetime(*date_time)
+        current_dt = datetime.datetime.fromtimestamp(mtime)
+        return abs(current_dt - latest_dt) < two_sec
+
+    @staticmethod
+    def windows_replace(source, destination):
+        """ Move a file over another in one step on Windows, where Python 2 has no os.replace
+
+        :param source: the unicode path of the file to move
+        :param destination: the unicode path of the file to replace
+        """
+        flags = 0x1 | 0x8  # MOVEFILE_REPLACE_EXISTING | MOVEFILE_WRITE_THROUGH
+        if not ctypes.windll.kernel32.MoveFileExW(source, destination, flags):
+            raise ctypes.WinError()
 
     @staticmethod
     def enc_read(filepath):
@@ -3,19 +3,57 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import absolute_import
 
+# Import standard library modules
+import heapq
+import math
+import re
+from collections import OrderedDict
+
 # Import configuration values
-from Motome.config import TAG_QUERY_CHAR
+from Motome.config import TAG_QUERY_CHAR, SEARCH_MATCH_MODE
+
+# a quoted phrase, optionally ignored with a leading '-', the closing quote can be left off while typing
+PHRASE_RE = re.compile(r'(-?)"([^"]*)("?)')
+
+# the proximity operator between two words, e.g. 'release NEAR/3 checklist'
+NEAR_RE = re.compile(r'^near/(\d*)$', re.IGNORECASE)
+
+
+def fulltext_string(text):
+    """ Quote text as an FTS5 string so any operators or punctuation in it are taken literally
+    """
+    return '"{0}"'.format(text.replace('"', '""'))
 
 
 class SearchModel(object):
-    def __init__(self):
+    # how many recent query results are kept for refining and backspacing
+    cache_size = 32
+
+    # BM25 ranking parameters and the score multipliers for words found in a note's title or tags
+    bm25_k1 = 1.2
+    bm25_b = 0.75
+    title_boost = 2.0
+    tag_boost = 1.5
+
+    def __init__(self, match_mode=SEARCH_MATCH_MODE):
         self._query = ''
+        self.match_mode = match_mode
+
+        # recent results, (query key -> set of note filenames), only valid for one index generation
+        self._results_cache = OrderedDict()
+        self._cache_index = None
+        self._cache_generation = -1
+        self._cache_match_mode = match_mode
 
         self.ignore_items = []
         self.use_words = []
         self.use_tags = []
         self.ignore_tags = []
         self.ignore_words = []
+        self.use_phrases = []
+        self.ignore_phrases = []
+        self.open_phrase = None
+        self.use_near = []
 
     @property
     def query(self):
@@ -27,26 +65,276 @@ class SearchModel(object):
         self.parse_query()
 
     def parse_query(self):
-        search_terms = self.query.split()
+        # pull out the quoted phrases first
+        self.use_phrases = []
+        self.ignore_phrases = []
+        self.open_phrase = None
+        for ignore, phrase, closed in PHRASE_RE.findall(self.query):
+            words = tuple(re.findall(r'\w+', phrase.lower()))
+            if len(words) == 0:
+                continue
+            elif ignore:
+                self.ignore_phrases.append(words)
+            else:
+                self.use_phrases.append(words)
+            if closed == '':
+                # still being typed, its last word is matched like the other query words
+                self.open_phrase = (bool(ignore), words)
+        search_terms = PHRASE_RE.sub(' ', self.query).split()
+
+        # then the word NEAR/n word groups
+        self.use_near = []
+        terms = []
+        i = 0
+        while i < len(search_terms):
+            near = NEAR_RE.match(search_terms[i])
+            if near is None:
+                terms.append(search_terms[i])
+            elif near.group(1) != '' and len(terms) > 0 and i + 1 < len(search_terms) and \
+                    terms[-1][0] not in ('-', TAG_QUERY_CHAR) and search_terms[i + 1][0] not in ('-', TAG_QUERY_CHAR):
+                self.use_near.append((terms.pop(), search_terms[i + 1], int(near.group(1))))
+                i += 1
+            # else it's a partly typed operator, skip it
+            i += 1
+        search_terms = terms
+
         self.ignore_items = [t[1:] for t in search_terms if t[0] == '-']
         self.use_words = [x for x in search_terms if x[0] != '-' and x[0] != TAG_QUERY_CHAR]
         self.use_tags = [t[1:] for t in search_terms if t[0] == TAG_QUERY_CHAR]
         self.ignore_tags = [t[1:] for t in self.ignore_items if len(t) > 2 and t[0] == TAG_QUERY_CHAR]
         self.ignore_words = [t for t in self.ignore_items if len(t) > 2 and t[0] != TAG_QUERY_CHAR]
 
-    def search_notemodel(self, note_model):
-        content_words = note_model.wordset
+    @property
+    def query_key(self):
+        """ A normalized, hashable version of the parsed query
+        """
+        return (tuple(sorted(set(self.use_words))),
+                tuple(sorted(set(self.ignore_words))),
+                tuple(sorted(set(self.use_tags))),
+                tuple(sorted(set(self.ignore_tags))),
+                tuple(sorted(set(self.use_phrases))),
+                tuple(sorted(set(self.ignore_phrases))),
+                tuple(sorted(set(self.use_near))),
+                self.open_phrase)
+
+    @property
+    def rank_words(self):
+        """ All the words in the query that should be found in a note, used for ranking
+        """
+        words = list(self.use_words)
+        for phrase in self.use_phrases:
+            words.extend(phrase)
+        for word_a, word_b, __ in self.use_near:
+            words.extend([word_a, word_b])
+        return words
+
+    @property
+    def fulltext_query(self):
+        """ The query translated to SQLite FTS5 MATCH expressions
+
+        Words, phrases and NEAR groups match the title and content columns, tags match the tags column. FTS5 only
+        matches whole words or their starts so the 'substring' match mode is treated like 'prefix'.
+
+        :return: a (match, exclude) tuple of the expression the notes have to match and the expression of the notes
+                 to leave out, either is None if the query has nothing for it
+        """
+        prefix = '' if self.match_mode == 'exact' else '*'
+        words = [w for w in self.use_words if re.search(r'\w', w)]
+        ignore_words = [w for w in self.ignore_words if re.search(r'\w', w)]
+
+        include = ['{{title content}} : {0}{1}'.format(fulltext_string(w), prefix) for w in words]
+        include += ['{{title content}} : {0}'.format(self._fulltext_phrase(p, False)) for p in self.use_phrases]
+        for word_a, word_b, distance in self.use_near:
+            # FTS5 counts the words between the two, not how far apart they are
+            include.append('{{title content}} : NEAR({0}{2} {1}{2}, {3})'.format(
+                fulltext_string(word_a), fulltext_string(word_b), prefix, max(distance - 1, 0)))
+        include += ['tags : {0}'.format(fulltext_string(t)) for t in self.use_tags if re.search(r'\w', t)]
+
+        exclude = ['{{title content}} : {0}{1}'.format(fulltext_string(w), prefix) for w in ignore_words]
+        exclude += ['{{title content}} : {0}'.format(self._fulltext_phrase(p, True)) for p in self.ignore_phrases]
+        exclude += ['tags : {0}'.format(fulltext_string(t)) for t in self.ignore_tags if re.search(r'\w', t)]
+
+        match = ' AND '.join('({0})'.format(e) for e in include) if len(include) > 0 else None
+        exclude = ' OR '.join('({0})'.format(e) for e in exclude) if len(exclude) > 0 else None
+        return match, exclude
+
+    def _fulltext_phrase(self, phrase, ignore):
+        """ A phrase as an FTS5 phrase string, the open phrase's last word matched as the start of a word
+        """
+        text = fulltext_string(' '.join(phrase))
+        if self.match_mode != 'exact' and self.open_phrase == (ignore, phrase):
+            text += '*'
+        return text
+
+    def _phrase_mode(self, phrase, ignore):
+        """ The match mode of a phrase's last word, the query's for the open phrase and exact for the rest
+        """
+        return self.match_mode if self.open_phrase == (ignore, phrase) else 'exact'
+
+    def search_fulltext(self, fulltext_index, limit=None):
+        """ Find the notes matching the query with the SQLite FTS5 search engine, ordered by relevance
+
+        :param fulltext_index: the FullTextIndex of the notes directory
+        :param limit: the number of results to return, all the matching notes if None
+        :return: a list of (score, note filename) tuples, best first
+        """
+        match, exclude = self.fulltext_query
+        return fulltext_index.search(match, exclude, weights=(self.title_boost, 1.0, self.tag_boost), limit=limit)
+
+    def search_index(self, note_index):
+        """ Find the notes matching the query using the index posting sets
+
+        When the query refines one that was recently searched (more words or tags, longer words) only the earlier
+        results are filtered, and a query that was recently searched (e.g. after a backspace) is answered from the
+        cache.
+
+        :param note_index: the NoteIndex of the notes directory
+        :return: a set of matching note filenames
+        """
+        if note_index is not self._cache_index or note_index.generation != self._cache_generation or \
+                self.match_mode != self._cache_match_mode:
+            self.clear_cache()
+            self._cache_index = note_index
+            self._cache_generation = note_index.generation
+            self._cache_match_mode = self.match_mode
+
+        key = self.query_key
         try:
-            content_tags = note_model.metadata['tags']
-        except (KeyError, TypeError):
-            content_tags = ''
+            found = self._results_cache.pop(key)
+            self._results_cache[key] = found  # move it to the most recent end
+            return set(found)
+        except KeyError:
+            pass
+
+        found = None
+        for old_key, old_found in self._results_cache.iteritems():
+            if self._refines(key, old_key) and (found is None or len(old_found) < len(found)):
+                found = old_found
+        if found is None:
+            found = note_index.notes
+        else:
+            found = set(found)
+
+        for tag in self.use_tags:
+            if len(found) == 0:
+                break
+            found = note_index.notes_with_tag(tag, within=found)
+        for word in self.use_words:
+            if len(found) == 0:
+                break
+            found = note_index.notes_with_word(word, self.match_mode, within=found)
+        for phrase in self.use_phrases:
+            if len(found) == 0:
+                break
+            found = note_index.notes_with_phrase(phrase, within=found, last_mode=self._phrase_mode(phrase, False))
+        for word_a, word_b, distance in self.use_near:
+            if len(found) == 0:
+                break
+            found = note_index.notes_near(word_a, word_b, distance, self.match_mode, within=found)
+        for tag in self.ignore_tags:
+            if len(found) == 0:
+                break
+            found -= note_index.notes_with_tag(tag, within=found)
+        for word in self.ignore_words:
+            if len(found) == 0:
+                break
+            found -= note_index.notes_with_word(word, self.match_mode, within=found)
+        for phrase in self.ignore_phrases:
+            if len(found) == 0:
+                break
+            found -= note_index.notes_with_phrase(phrase, within=found, last_mode=self._phrase_mode(phrase, True))
+
+        self._results_cache[key] = found
+        if len(self._results_cache) > self.cache_size:
+            self._results_cache.popitem(last=False)
+        return set(found)
+
+    def search_ranked(self, note_index, limit=None):
+        """ Find the notes matching the query ordered by relevance
+
+        Matching notes are scored with BM25 over the note content, words that are also in the note's title or tags
+        get boosted. Only the postings of the query's words and the lengths, titles and tags of the matching notes are
+        read from the index. Only the best `limit` notes are kept in a heap so all the matches never need to be sorted.
+
+        :param note_index: the NoteIndex of the notes directory
+        :param limit: the number of results to return, all the matching notes if None
+        :return: a list of (score, note filename) tuples, best first
+        """
+        found = self.search_index(note_index)
+        if limit is None:
+            limit = len(found)
+
+        k1 = self.bm25_k1
+        b = self.bm25_b
+        num_notes = len(note_index)
+        average_length = note_index.average_length or 1.0
+        details = note_index.note_details(found)
+        scores = dict.fromkeys(found, 0.0)
+        for word in self.rank_words:
+            # a partial word can match many index words, only the best one counts in each note
+            best = dict()
+            for term, counts in note_index.word_counts(word, self.match_mode).iteritems():
+                # weight each index word a query word matches by how rare it is
+                num_with = len(counts)
+                idf = math.log(1.0 + (num_notes - num_with + 0.5) / (num_with + 0.5))
+                for filename, tf in counts.iteritems():
+                    if filename not in scores:
+                        continue
+                    length, title, tags = details.get(filename, (0, (), ()))
+                    norm = k1 * (1.0 - b + b * length / average_length)
+                    term_score = idf * tf * (k1 + 1.0) / (tf + norm)
+                    if term in title:
+                        term_score *= self.title_boost
+                    if term in tags:
+                        term_score *= self.tag_boost
+                    if term_score > best.get(filename, 0.0):
+                        best[filename] = term_score
+            for filename, term_score in best.iteritems():
+                scores[filename] += term_score
+
+        return heapq.nlargest(limit, ((score, filename) for filename, score in scores.iteritems()))
+
+    def clear_cache(self):
+        """ Forget the recent query results
+        """
+        self._results_cache.clear()
 
-        has_tag_filters = len(self.use_tags + self.ignore_tags) > 0  # are there tags in the search term
-        has_word_filters = len(self.use_words + self.ignore_words) > 0  # are there words in the search term
+    def _word_refines(self, new_word, old_word):
+        """ Does everything matching new_word also match old_word?
+        """
+        if self.match_mode == 'exact':
+            return new_word == old_word
+        elif self.match_mode == 'substring':
+            return old_word in new_word
+        else:
+            return new_word.startswith(old_word)
 
-        yay_tags = all([tag in content_tags for tag in self.use_tags]) if has_tag_filters else True
-        boo_tags = all([tag not in content_tags for tag in self.ignore_tags]) if has_tag_filters else True
-        yay_words = all([word in content_words for word in self.use_words]) if has_word_filters else True
-        boo_words = all([word not in content_words for word in self.ignore_words]) if has_word_filters else True
+    def _refines(self, new_key, old_key):
+        """ Is the new query a refinement of the old query, so its results are a subset of the old results?
 
-        return all([yay_words, boo_words, yay_tags, boo_tags])
\ No newline at end of file
+        :param new_key: the new query_key
+        :param old_key: the old query_key
+        :return: boolean
+        """
+        new_words, new_ignore_words, new_tags, new_ignore_tags, new_phrases, new_ignore_phrases, new_near, \
+            new_open = new_key
+        old_words, old_ignore_words, old_tags, old_ignore_tags, old_phrases, old_ignore_phrases, old_near, \
+            old_open = old_key
+        # every old word has to be kept or lengthened
+        for old_word in old_words:
+            if not any(self._word_refines(new_word, old_word) for new_word in new_words):
+                return False
+        # an open phrase matches differently than the same phrase closed, so it has to be kept as it is or be new
+        if new_open != old_open:
+            if old_open is not None:
+                return False
+            if new_open[1] in old_phrases or new_open[1] in old_ignore_phrases:
+                return False
+        # tags, phrases and NEAR groups match exactly, so changing any of them or an ignore term could let more
+        # notes back in
+        return set(old_tags) <= set(new_tags) and \
+            set(old_phrases) <= set(new_phrases) and \
+            set(old_near) <= set(new_near) and \
+            set(old_ignore_words) <= set(new_ignore_words) and \
+            set(old_ignore_tags) <= set(new_ignore_tags) and \
+            set(old_ignore_phrases) <= set(new_ignore_phrases)
\ No newline at end of file
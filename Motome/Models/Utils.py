@@ -12,6 +12,7 @@ import glob
 import inspect
 import os
 import re
+from contextlib import contextmanager
 from datetime import datetime
 
 import yaml
@@ -60,6 +61,23 @@ def inspect_caller():
     return inspect.stack()[2][3]
 
 
+@contextmanager
+def count_stat_calls(operation):
+    """ Log how many times note files were stat'ed during an operation
+
+    Usage:
+        with count_stat_calls('update notes list'):
+            notes_list.update_list()
+
+    :param operation: the name of the operation for the log
+    """
+    start = NoteModel.stat_calls
+    try:
+        yield
+    finally:
+        logger.debug('[{0}] {1} note stat calls'.format(operation, NoteModel.stat_calls - start))
+
+
 def pickle_find_NoteModel(module, name):
     """ A special unpickler to restrict unpickeled data to only NoteModels
 
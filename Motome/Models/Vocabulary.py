@@ -0,0 +1,26 @@
+# Import the future
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import re
+from array import array
+
+# the words of a note, the same as the index and search take them
+WORD_RE = re.compile(r'\w+')
+
+
+def split_words(text):
+    """ The words of a text in a compact form that's quick to pass between processes, see BulkIndexer
+
+    The words are matched and looked up in C loops, each distinct word is one string however often the text uses it.
+
+    :param text: the text
+    :return: a tuple of (the list of the text's distinct lowercase words, an array of the index in that list of each
+             of the text's words in order)
+    """
+    tokens = WORD_RE.findall(text.lower())
+    distinct = list(set(tokens))
+    indexes = dict(zip(distinct, range(len(distinct))))
+    return distinct, array(str('i'), map(indexes.__getitem__, tokens))
+
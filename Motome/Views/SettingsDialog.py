@@ -65,6 +65,15 @@ class Ui_SettingsDialog(object):
         self.conf_author.setObjectName("conf_author")
         self.horizontalLayout_2.addWidget(self.conf_author)
         self.verticalLayout.addLayout(self.horizontalLayout_2)
+        self.horizontalLayout_4 = QtGui.QHBoxLayout()
+        self.horizontalLayout_4.setObjectName("horizontalLayout_4")
+        self.label_4 = QtGui.QLabel(self.tab)
+        self.label_4.setObjectName("label_4")
+        self.horizontalLayout_4.addWidget(self.label_4)
+        self.conf_search_engine = QtGui.QComboBox(self.tab)
+        self.conf_search_engine.setObjectName("conf_search_engine")
+        self.horizontalLayout_4.addWidget(self.conf_search_engine)
+        self.verticalLayout.addLayout(self.horizontalLayout_4)
         spacerItem1 = QtGui.QSpacerItem(20, 40, QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
         self.verticalLayout.addItem(spacerItem1)
         self.conf_checkbox_firstlinetitle = QtGui.QCheckBox(self.tab)
@@ -155,6 +164,8 @@ class Ui_SettingsDialog(object):
         self.label_2.setText(QtGui.QApplication.translate("SettingsDialog", "Author", None, QtGui.QApplication.UnicodeUTF8))
         self.conf_author.setToolTip(QtGui.QApplication.translate("SettingsDialog", "Chijiiwa Motome <cmotome@example.com>", None, QtGui.QApplication.UnicodeUTF8))
         self.conf_author.setPlaceholderText(QtGui.QApplication.translate("SettingsDialog", "Optional - Please enter your name", None, QtGui.QApplication.UnicodeUTF8))
+        self.label_4.setText(QtGui.QApplication.translate("SettingsDialog", "Search engine", None, QtGui.QApplication.UnicodeUTF8))
+        self.conf_search_engine.setToolTip(QtGui.QApplication.translate("SettingsDialog", "The in-memory word index or a SQLite full text index of the notes", None, QtGui.QApplication.UnicodeUTF8))
         self.conf_checkbox_firstlinetitle.setText(QtGui.QApplication.translate("SettingsDialog", "Use the first  line of the note as the title", None, QtGui.QApplication.UnicodeUTF8))
         self.conf_checkbox_recordonsave.setText(QtGui.QApplication.translate("SettingsDialog", "Record note data to version history with Ctrl/Cmd-S", None, QtGui.QApplication.UnicodeUTF8))
         self.conf_checkbox_recordonswitch.setText(QtGui.QApplication.translate("SettingsDialog", "Record changed note data to version history when switching notes", None, QtGui.QApplication.UnicodeUTF8))
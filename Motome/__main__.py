@@ -3,6 +3,7 @@ from __future__ import absolute_import
 
 # Import standard library modules
 import logging
+import multiprocessing
 import os
 import sys
 
@@ -51,6 +52,8 @@ class App(QtGui.QApplication):
 
 
 def main():
+    # the bulk indexer's worker processes start here in frozen Windows builds
+    multiprocessing.freeze_support()
     global app
     app = App(sys.argv)
     app.exec_()
@@ -48,9 +48,30 @@ MEDIA_FOLDER = 'media'
 HTML_FOLDER = 'html'
 HISTORY_FOLDER = 'archive'
 
+# how hard the note versions in the history archives are compressed, zlib's level from 0 (stored as they are) to 9
+# (smallest and slowest), None is zlib's default
+HISTORY_COMPRESSLEVEL = None
+
 # the character prepended to tag values when searching
 TAG_QUERY_CHAR = '#'
 
+# how search words match note words: 'prefix' (start of a word), 'exact' (the whole word)
+# or 'substring' (anywhere in a word)
+SEARCH_MATCH_MODE = 'prefix'
+
+# order word searches by relevance instead of date, and how many of the best results to show (None shows them all,
+# a number hides the matching notes past the best ones)
+SEARCH_RANK_RESULTS = True
+SEARCH_RESULTS_LIMIT = None
+
+# the default search engine: 'index' (the in-memory word index) or 'fulltext' (a SQLite FTS5 database, when the
+# sqlite3 library has FTS5)
+SEARCH_ENGINE = 'index'
+
+# how many seconds a note file's stat (e.g. its modification time) is trusted before the file is checked again,
+# changes seen by the notes directory watcher are picked up straight away
+STAT_CACHE_TTL = 2.0
+
 # unsafe filename characters, being pretty strict
 UNSAFE_CHARS = '<>:"/\|?*#'
 
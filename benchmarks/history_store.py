@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare the history archive of whole note versions with the HistoryStore of whole versions and patches.
+
+Usage: python benchmarks/history_store.py [note size in KB ...]
+
+The default notes are 2, 20 and 200 KB of lines of synthetic words, each recorded 100 times with a few words changed
+between versions, like a note that's edited a little at a time. For each note the archive size, the milliseconds a
+record takes and the milliseconds reading back a version takes (the average and the slowest) are printed for both
+formats.
+"""
+
+# Import the future
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+
+import datetime
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from search_engines import make_word
+
+from Motome.Models.HistoryStore import HistoryStore
+from Motome.config import ENCODING, NOTE_EXTENSION
+
+NUM_VERSIONS = 100
+EDITS_PER_VERSION = 5
+WORDS_PER_LINE = 12
+
+
+def make_versions(size_kb, seed=3):
+    """ The versions of a note of about size_kb, a few words changed between each
+    """
+    rand = random.Random(seed)
+    words = [make_word(int(rand.paretovariate(1.2))) for __ in range(size_kb * 1024 // 6)]
+    versions = []
+    for __ in range(NUM_VERSIONS):
+        for __ in range(EDITS_PER_VERSION):
+            words[rand.randrange(len(words))] = make_word(rand.randrange(30000))
+        lines = [' '.join(words[i:i + WORDS_PER_LINE]) for i in range(0, len(words), WORDS_PER_LINE)]
+        versions.append('\n'.join(lines) + '\n')
+    return versions
+
+
+def version_name(i):
+    return (datetime.datetime(2014, 1, 1) + datetime.timedelta(minutes=i)).strftime('%Y%m%d%H%M%S') + NOTE_EXTENSION
+
+
+class WholeVersions(object):
+    """ The archive before HistoryStore, a whole copy of the note stored for every version
+    """
+    def __init__(self, zip_filepath):
+        self.zip_filepath = zip_filepath
+
+    def append(self, data, name):
+        with zipfile.ZipFile(self.zip_filepath, 'a') as myzip:
+            myzip.writestr(name, data.encode(ENCODING))
+
+    def read(self, index):
+        with zipfile.ZipFile(self.zip_filepath, 'r') as myzip:
+            return myzip.read(sorted(myzip.infolist(), key=lambda x: x.filename)[index]).decode(ENCODING)
+
+
+def measure(store, versions):
+    start = time.time()
+    for i, data in enumerate(versions):
+        store.append(data, version_name(i))
+    record_ms = (time.time() - start) / len(versions) * 1000
+    read_ms = []
+    for i, data in enumerate(versions):
+        start = time.time()
+        assert store.read(i) == data
+        read_ms.append((time.time() - start) * 1000)
+    return os.path.getsize(store.zip_filepath), record_ms, sum(read_ms) / len(read_ms), max(read_ms)
+
+
+def main(sizes):
+    history_dir = tempfile.mkdtemp()
+    try:
+        print('{0} versions, {1} words changed a version'.format(NUM_VERSIONS, EDITS_PER_VERSION))
+        print('{0:<8} {1:<8} {2:>12} {3:>10} {4:>10} {5:>10}'.format('note', 'format', 'archive KB', 'record ms',
+                                                                    'read ms', 'slowest ms'))
+        for size_kb in sizes:
+            versions = make_versions(size_kb)
+            for name, store_class in [('whole', WholeVersions), ('patches', HistoryStore)]:
+                store = store_class(os.path.join(history_dir, '{0}_{1}.zip'.format(name, size_kb)))
+                size, record_ms, read_ms, slowest_ms = measure(store, versions)
+                print('{0:<8} {1:<8} {2:>12.1f} {3:>10.2f} {4:>10.2f} {5:>10.2f}'.format(
+                    '{0} KB'.format(size_kb), name, size / 1024, record_ms, read_ms, slowest_ms))
+    finally:
+        shutil.rmtree(history_dir)
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [2, 20, 200])
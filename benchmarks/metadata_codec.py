@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare writing and reading note metadata with PyYAML and with the Metadata codec.
+
+Usage: python benchmarks/metadata_codec.py [number of notes]
+
+The default is 2000 synthetic notes, each a few hundred words with a title, tags, the 0 or 1 pinned flag NoteModel
+writes and author. The microseconds a note takes to dump its metadata, to load it back and to parse a whole note file
+are printed for yaml.safe_dump and yaml.safe_load with the old split of the file on every bracket, the C loader and
+dumper when libyaml is installed, and the codec with the rfind trailer lookup.
+"""
+
+# Import the future
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+
+import os
+import sys
+import timeit
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from search_engines import make_notes
+
+from Motome.Models.Metadata import SafeDumper, SafeLoader, dump_metadata, load_metadata
+from Motome.Models.NoteModel import NoteModel
+from Motome.config import YAML_BRACKET
+
+REPEATS = 3
+
+
+def old_parse_note_content(data):
+    """ The file parsing before the codec, the whole file is split on the brackets and the trailer goes to PyYAML
+    """
+    s = data.split(YAML_BRACKET)
+    return ''.join(s[:-2]), yaml.safe_load(s[-2].strip())
+
+
+def per_note(function, items):
+    """ The fewest microseconds function takes an item over REPEATS runs
+    """
+    seconds = min(timeit.repeat(lambda: [function(item) for item in items], number=1, repeat=REPEATS))
+    return seconds / len(items) * 1e6
+
+
+def main(num_notes):
+    metadatas = []
+    files = []
+    for i, (filename, title, content, tags) in enumerate(make_notes(num_notes)):
+        metadata = {'title': title, 'tags': ' '.join(tags), 'pinned': 1 if i % 10 == 0 else 0, 'author': 'Motome User'}
+        metadatas.append(metadata)
+        files.append(content + '\n' + YAML_BRACKET + '\n' + dump_metadata(metadata) + YAML_BRACKET)
+    texts = [yaml.safe_dump(metadata, default_flow_style=False) for metadata in metadatas]
+
+    print('{0} notes, libyaml {1}'.format(num_notes, 'found' if SafeLoader is not yaml.SafeLoader else 'not found'))
+    print('{0:<12} {1:>10} {2:>10} {3:>10}'.format('', 'dump us', 'load us', 'parse us'))
+    rows = [('yaml', lambda m: yaml.safe_dump(m, default_flow_style=False), yaml.safe_load, old_parse_note_content),
+            ('yaml C', lambda m: yaml.dump(m, Dumper=SafeDumper, default_flow_style=False),
+             lambda t: yaml.load(t, Loader=SafeLoader), None),
+            ('codec', dump_metadata, load_metadata, NoteModel.parse_note_content)]
+    for name, dump, load, parse in rows:
+        print('{0:<12} {1:>10.1f} {2:>10.1f} {3:>10}'.format(
+            name, per_note(dump, metadatas), per_note(load, texts),
+            '' if parse is None else '{0:.1f}'.format(per_note(parse, files))))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare the in-memory word index and the SQLite FTS5 full text index search engines on synthetic notes.
+
+Usage: python benchmarks/search_engines.py [number of notes ...]
+
+The default vaults have 10000, 50000 and 100000 notes. Each note is a few hundred words drawn from a skewed
+vocabulary so some words are in most notes and most words are rare, like real notes. The time to build each index and
+the average time of a set of queries are printed.
+"""
+
+# Import the future
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Motome.Models.FullTextIndex import FullTextIndex
+from Motome.Models.NoteIndex import NoteIndex
+from Motome.Models.Search import SearchModel
+
+VOCABULARY_SIZE = 30000
+TAGS = ['work', 'home', 'ideas', 'todo', 'travel', 'reading', 'recipes', 'meetings']
+QUERIES = ['wa', 'wab', 'waba bec', 'be', '#work', '#todo ka', 'ka -wa', '"ba be"', 'ba NEAR/5 ka', 'zazu']
+REPEATS = 5
+
+
+def make_word(i):
+    """ A pronounceable made up word for a vocabulary position
+    """
+    syllables = 'ba be bi bo bu ka ke ki ko ku wa we wi wo za ze zi zo'.split()
+    word = ''
+    while True:
+        word += syllables[i % len(syllables)]
+        i //= len(syllables)
+        if i == 0:
+            return word
+
+
+def make_notes(num_notes, seed=3):
+    """ Make a list of (filename, title, content, tags) synthetic notes
+    """
+    rand = random.Random(seed)
+    vocabulary = [make_word(i) for i in range(VOCABULARY_SIZE)]
+    # a Zipf like distribution, the first words are much more common
+    weights = [1.0 / (i + 1) for i in range(VOCABULARY_SIZE)]
+    cumulative = []
+    total = 0.0
+    for w in weights:
+        total += w
+        cumulative.append(total)
+
+    def pick():
+        x = rand.random() * total
+        lo, hi = 0, len(cumulative) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if cumulative[mid] < x:
+                lo = mid + 1
+            else:
+                hi = mid
+        return vocabulary[lo]
+
+    notes = []
+    for n in range(num_notes):
+        words = [pick() for __ in range(rand.randint(50, 400))]
+        title = ' '.join(words[:3])
+        tags = rand.sample(TAGS, rand.randint(0, 3))
+        notes.append(('note_{0}.txt'.format(n), title, ' '.join(words), tags))
+    return notes
+
+
+def build_word_index(notes):
+    index = NoteIndex()
+    for filename, title, content, tags in notes:
+        index.update_note(filename, content.split())
+        index.update_note_title(filename, title)
+        index.update_note_tags(filename, tags)
+    return index
+
+
+def build_fulltext_index(notes, filepath):
+    index = FullTextIndex(filepath)
+    for filename, title, content, tags in notes:
+        index.update_note(filename, content)
+        index.update_note_title(filename, title)
+        index.update_note_tags(filename, tags)
+    index.commit()
+    return index
+
+
+def time_queries(search_function):
+    """ The average seconds a query takes, each query is searched afresh
+    """
+    results = dict()
+    for query in QUERIES:
+        start = timeit.default_timer()
+        for __ in range(REPEATS):
+            search = SearchModel()
+            search.query = query
+            search_function(search)
+        results[query] = (timeit.default_timer() - start) / REPEATS
+    return results
+
+
+def main(sizes):
+    for num_notes in sizes:
+        notes = make_notes(num_notes)
+        print('{0} notes'.format(num_notes))
+
+        start = timeit.default_timer()
+        word_index = build_word_index(notes)
+        print('  build    word index {0:8.2f} s'.format(timeit.default_timer() - start))
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            start = timeit.default_timer()
+            fulltext_index = build_fulltext_index(notes, os.path.join(tmp_dir, 'Motome_fulltext.db'))
+            print('  build    full text  {0:8.2f} s'.format(timeit.default_timer() - start))
+
+            word_times = time_queries(lambda s: s.search_ranked(word_index, 250) if s.rank_words
+                                      else s.search_index(word_index))
+            fulltext_times = time_queries(lambda s: s.search_fulltext(fulltext_index, 250))
+            for query in QUERIES:
+                print('  {0:<16} word index {1:8.2f} ms   full text {2:8.2f} ms'.format(
+                    query, word_times[query] * 1000, fulltext_times[query] * 1000))
+            fulltext_index.close()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 50000, 100000])
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure the memory the session notes take to list a notes directory, before and after the compact catalog records.
+
+Usage: python benchmarks/session_memory.py [number of notes ...]
+
+The default vaults have 10000 and 100000 synthetic notes. For each vault the resident memory of a fresh process is
+measured after loading the notes the old way, a NoteModel per note with its metadata like the pickled session data held,
+and the new way, a NoteCatalog of NoteRecords plus the NoteListModel columns. Both open the NoteIndex in the catalog
+database too, as a session does, and the index alone is measured as well. The new way is checked against
+BASELINE_BYTES_PER_NOTE, the exit status is 1 when a vault takes more.
+"""
+
+# Import the future
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from search_engines import make_notes
+
+from Motome.Models.NoteCatalog import NoteCatalog
+from Motome.Models.NoteIndex import NoteIndex
+from Motome.Models.NoteModel import NoteModel
+from Motome.config import NOTE_EXTENSION
+
+# what a session took per note with NoteModels and the pickled word index, before the catalog
+BASELINE_BYTES_PER_NOTE = 8.4 * 1024
+
+
+def resident_kb():
+    """ The resident memory of this process in KB, from /proc on Linux
+    """
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def catalog_path(notes_dir):
+    return os.path.join(notes_dir, '.motome', 'Motome_catalog.db')
+
+
+def make_vault(notes_dir, num_notes):
+    """ Write synthetic notes, their catalog and their index, like a notes directory Motome has already opened
+    """
+    catalog = NoteCatalog(catalog_path(notes_dir), notes_dir)
+    index = catalog.index
+    for filename, title, content, tags in make_notes(num_notes):
+        note = NoteModel(os.path.join(notes_dir, filename.replace('.txt', NOTE_EXTENSION)))
+        note.index = index
+        note.content = content
+        note.metadata = {'title': title, 'tags': ' '.join(tags)}
+        note.save_to_file()
+        catalog[note.filename] = note
+        catalog.unload(note.filename)
+    catalog.close()
+
+
+def load_notemodels(notes_dir):
+    """ A NoteModel per note with its metadata, like the session dict unpickled from Motome_data.fs
+    """
+    notes = dict()
+    for filename in os.listdir(notes_dir):
+        if filename.endswith(NOTE_EXTENSION):
+            note = NoteModel(os.path.join(notes_dir, filename))
+            note.content
+            note._content = ''
+            notes[filename] = note
+    return notes, load_index(notes_dir)
+
+
+def load_catalog(notes_dir):
+    """ The catalog records and the notes list columns
+    """
+    from Motome.Models.NoteListModel import NoteListModel
+    catalog = NoteCatalog(catalog_path(notes_dir), notes_dir)
+    model = NoteListModel()
+    model.set_notes((filename,) + catalog.summary(filename) + (0.0,) for filename in catalog)
+    return catalog, model
+
+
+def load_index(notes_dir):
+    """ The word and tag index of the notes, only its note ids are read into memory
+    """
+    return NoteIndex(sqlite3.connect(catalog_path(notes_dir)))
+
+
+def measure(how, notes_dir):
+    before = resident_kb()
+    loaded = {'notemodels': load_notemodels, 'catalog': load_catalog, 'index': load_index}[how](notes_dir)
+    print(resident_kb() - before)
+    return loaded
+
+
+def main(sizes):
+    over_baseline = False
+    for num_notes in sizes:
+        notes_dir = tempfile.mkdtemp()
+        try:
+            make_vault(notes_dir, num_notes)
+            print('{0} notes'.format(num_notes))
+            for how in ('notemodels', 'catalog', 'index'):
+                # each in a fresh process so the measurements don't share freed memory
+                kb = int(subprocess.check_output([sys.executable, __file__, '--measure', how, notes_dir]))
+                per_note = kb * 1024 / num_notes
+                print('  {0:<12} {1:8.1f} MB  {2:6.0f} bytes/note  {3:4.0%} of baseline'.format(
+                    how, kb / 1024, per_note, per_note / BASELINE_BYTES_PER_NOTE))
+                if how == 'catalog' and per_note > BASELINE_BYTES_PER_NOTE:
+                    over_baseline = True
+        finally:
+            shutil.rmtree(notes_dir)
+    return 1 if over_baseline else 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--measure':
+        measure(sys.argv[2], sys.argv[3])
+    else:
+        sys.exit(main([int(arg) for arg in sys.argv[1:]] or [10000, 100000]))
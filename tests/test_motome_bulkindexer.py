@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_motome_bulkindexer
+----------------------------------
+
+Tests for `Motome.Models.BulkIndexer`
+"""
+
+import glob
+import os
+import unittest
+
+from Motome.Models.BulkIndexer import BulkIndexer, read_note_file
+from Motome.Models.NoteIndex import NoteIndex
+from Motome.Models.NoteModel import NoteModel
+from Motome.config import NOTE_EXTENSION
+
+TESTER_NOTES_PATH = os.path.join(os.getcwd(), 'tests', 'notes_for_testing')
+
+
+class TestBulkIndexer(unittest.TestCase):
+
+    def setUp(self):
+        self.notepaths = sorted(glob.glob(TESTER_NOTES_PATH + '/*' + NOTE_EXTENSION))
+
+    def test_read_note_file(self):
+        filepath, mtime, content, metadata, split = read_note_file(self.notepaths[0])
+        self.assertEqual(filepath, self.notepaths[0])
+        self.assertEqual(mtime, os.stat(filepath).st_mtime)
+        self.assertEqual((content, metadata), NoteModel.parse_note_content(NoteModel.enc_read(filepath)))
+        distinct, indexes = split
+        self.assertEqual(len(distinct), len(set(distinct)))
+        self.assertEqual(' '.join(distinct[i] for i in indexes).split()[:3], content.lower().split()[:3])
+
+        self.assertEqual(read_note_file(os.path.join(TESTER_NOTES_PATH, 'missing.txt'))[1:],
+                         (None, None, None, None))
+
+    def test_bulk_index(self):
+        results = []
+        indexer = BulkIndexer(results.extend)
+        indexer.processes = 2
+        indexer.chunksize = 2
+        self.assertTrue(indexer.start(self.notepaths))
+        while indexer.is_running:
+            indexer._poll()
+        self.assertEqual(sorted(r[0] for r in results), self.notepaths)
+
+        # the results index the notes like reading them one by one does
+        bulk_index = NoteIndex()
+        serial_index = NoteIndex()
+        for filepath, mtime, content, metadata, split in results:
+            note = NoteModel(filepath)
+            note.index = bulk_index
+            self.assertTrue(note.update_from_parsed(mtime, content, metadata, split))
+            self.assertFalse(note.update_from_parsed(mtime, content, metadata, split))
+            note = NoteModel(filepath)
+            note.index = serial_index
+            note.update_index()
+        self.assertEqual(bulk_index.notes, serial_index.notes)
+        for filename in bulk_index.notes:
+            self.assertEqual(bulk_index.positions_of(filename), serial_index.positions_of(filename))
+        self.assertEqual(bulk_index.note_details(bulk_index.notes), serial_index.note_details(serial_index.notes))
+        self.assertEqual(bulk_index.tags, serial_index.tags)
+
+    def test_worker_error(self):
+        results = []
+        indexer = BulkIndexer(results.extend)
+        indexer.processes = 2
+        indexer.chunksize = 1
+        # not a path, reading it raises in the worker
+        self.assertTrue(indexer.start(self.notepaths + [None]))
+        while indexer.is_running:
+            indexer._poll()
+        self.assertEqual(sorted(r[0] for r in results), self.notepaths)
+
+
+if __name__ == '__main__':
+    unittest.main()
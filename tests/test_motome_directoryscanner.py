@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_motome_directoryscanner
+----------------------------------
+
+Tests for `Motome.Models.DirectoryScanner`
+"""
+
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+from Motome.Models.DirectoryScanner import DirectoryScanner
+from Motome.config import NOTE_EXTENSION
+
+TESTER_NOTES_PATH = os.path.join(os.getcwd(), 'tests', 'notes_for_testing')
+
+
+class TestDirectoryScanner(unittest.TestCase):
+
+    def setUp(self):
+        self.notes_dir = tempfile.mkdtemp()
+        for filepath in glob.glob(TESTER_NOTES_PATH + '/*' + NOTE_EXTENSION):
+            shutil.copy(filepath, self.notes_dir)
+        self.filenames = set(map(os.path.basename, glob.glob(self.notes_dir + '/*' + NOTE_EXTENSION)))
+        self.scanner = DirectoryScanner(self.notes_dir, NOTE_EXTENSION)
+
+    def test_first_scan(self):
+        with open(os.path.join(self.notes_dir, 'not_a_note.zip'), 'w') as f:
+            f.write('zip')
+        with open(os.path.join(self.notes_dir, '.hidden' + NOTE_EXTENSION), 'w') as f:
+            f.write('hidden')
+        added, removed, modified = self.scanner.scan()
+        self.assertEqual(added, self.filenames)
+        self.assertEqual(removed, set())
+        self.assertEqual(modified, set())
+
+        # nothing changed
+        self.assertEqual(self.scanner.scan(), (set(), set(), set()))
+
+    def test_changes(self):
+        self.scanner.scan()
+        first, second = sorted(self.filenames)[:2]
+
+        os.remove(os.path.join(self.notes_dir, first))
+        with open(os.path.join(self.notes_dir, 'new' + NOTE_EXTENSION), 'w') as f:
+            f.write('a new note')
+        with open(os.path.join(self.notes_dir, second), 'a') as f:
+            f.write('more text')
+
+        added, removed, modified = self.scanner.scan()
+        self.assertEqual(added, {'new' + NOTE_EXTENSION})
+        self.assertEqual(removed, {first})
+        self.assertEqual(modified, {second})
+        self.assertNotIn(first, self.scanner)
+        self.assertEqual(self.scanner.mtime(second), os.stat(os.path.join(self.notes_dir, second)).st_mtime)
+
+        os.rename(os.path.join(self.notes_dir, second), os.path.join(self.notes_dir, 'renamed' + NOTE_EXTENSION))
+        self.assertEqual(self.scanner.scan(), ({'renamed' + NOTE_EXTENSION}, {second}, set()))
+
+    def tearDown(self):
+        shutil.rmtree(self.notes_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_motome_fileworker
+----------------------------------
+
+Tests for `Motome.Models.FileWorker`
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from Motome.Models.FileWorker import FileWorker
+from Motome.Models.HistoryStore import HistoryStore
+from Motome.Models.NoteModel import NoteModel
+from Motome.config import NOTE_EXTENSION
+
+
+class TestFileWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.notes_dir = tempfile.mkdtemp()
+        self.worker = FileWorker()
+
+    def tearDown(self):
+        shutil.rmtree(self.notes_dir)
+
+    def test_jobs_in_order(self):
+        filepath = os.path.join(self.notes_dir, 'order.txt')
+        done = []
+        for i in range(50):
+            self.worker.submit(NoteModel.enc_write, (filepath, '{0}'.format(i)),
+                               lambda result, error, i=i: done.append((i, error)))
+        self.worker.submit(os.remove, (os.path.join(self.notes_dir, 'missing.txt'),),
+                           lambda result, error: done.append((None, error)))
+        self.worker.wait()
+        self.assertEqual(self.worker.pending, 0)
+        self.assertEqual([i for i, __ in done], list(range(50)) + [None])
+        # the last write wins and a failed job doesn't stop the worker
+        self.assertEqual(NoteModel.enc_read(filepath), '49')
+        self.assertIsInstance(done[-1][1], OSError)
+
+    def test_save_and_record(self):
+        note = NoteModel(os.path.join(self.notes_dir, 'background' + NOTE_EXTENSION))
+        note.content = 'first version\n'
+        note.save_to_file()
+
+        saved = []
+        note.content = 'second version\n'
+        note.save_to_file(worker=self.worker, callback=saved.append)
+        self.assertTrue(note.is_saved)
+        self.assertTrue(note.is_writing)
+        # the note isn't read back while the write is queued
+        self.assertEqual(note.content, 'second version\n')
+        note.record(worker=self.worker, callback=saved.append)
+        self.worker.wait()
+
+        self.assertFalse(note.is_writing)
+        self.assertEqual(saved, [note, note])
+        self.assertEqual(NoteModel.parse_note_content(NoteModel.enc_read(note.filepath))[0], 'second version\n')
+        self.assertEqual(len(note.history), 1)
+        self.assertTrue(note.recorded)
+        self.assertFalse(note.reload_if_changed())
+
+    def test_record_notes_after_queued_record(self):
+        note = NoteModel(os.path.join(self.notes_dir, 'background' + NOTE_EXTENSION))
+        note.content = 'first version\n'
+        note.save_to_file()
+        note.record(worker=self.worker)
+        # the queued record is done before the batch writes to the same archive
+        note.content = 'second version\n'
+        NoteModel.record_notes([note], worker=self.worker)
+        self.worker.wait()
+
+        store = HistoryStore(note.historypath)
+        self.assertEqual(note.history, store.entries())
+        self.assertEqual([NoteModel.parse_note_content(store.read(i))[0] for i in range(len(note.history))],
+                         ['first version\n', 'second version\n'])
+        self.assertTrue(note.recorded)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_motome_fulltextindex
+----------------------------------
+
+Tests for `Motome.Models.FullTextIndex`
+"""
+
+import os
+import shutil
+import unittest
+
+from Motome.Models.FullTextIndex import FullTextIndex
+from Motome.Models.Search import SearchModel
+from Motome.config import NOTE_DATA_DIR
+
+TESTER_NOTES_PATH = os.path.join(os.getcwd(), 'tests', 'notes_for_testing')
+
+
+@unittest.skipUnless(FullTextIndex.is_available(), 'sqlite3 was built without FTS5')
+class TestFullTextIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.filepath = os.path.join(TESTER_NOTES_PATH, NOTE_DATA_DIR, 'Motome_fulltext.db')
+        self.index = FullTextIndex(self.filepath)
+        self.index.update_note('a.txt', 'The release checklist is ready for the budget review.')
+        self.index.update_note('b.txt', 'Checklist for the release party, bring a cake.')
+        self.index.update_note('c.txt', 'Release notes, then a long checklist of budget items.')
+        self.index.update_note_title('c.txt', 'Budget')
+        self.index.update_note_tags('a.txt', ['#Work'])
+        self.index.update_note_tags('b.txt', ['party', 'fun'])
+
+    def search(self, query, limit=None):
+        search = SearchModel()
+        search.query = query
+        return [filename for __, filename in search.search_fulltext(self.index, limit)]
+
+    def test_query_translation(self):
+        search = SearchModel()
+        # the phrase isn't closed yet, so its last word is partial too
+        search.query = 'bud #work -"release party'
+        self.assertEqual(search.fulltext_query,
+                         ('({title content} : "bud"*) AND (tags : "work")',
+                          '({title content} : "release party"*)'))
+        search.query = 'bud -"release party"'
+        self.assertEqual(search.fulltext_query[1], '({title content} : "release party")')
+        search.query = '-cake'
+        self.assertEqual(search.fulltext_query, (None, '({title content} : "cake"*)'))
+
+        search = SearchModel(match_mode='exact')
+        search.query = 'release NEAR/2 checklist'
+        self.assertEqual(search.fulltext_query, ('({title content} : NEAR("release" "checklist", 1))', None))
+
+    def test_search(self):
+        self.assertEqual(set(self.search('rele')), {'a.txt', 'b.txt', 'c.txt'})
+        self.assertEqual(set(self.search('checklist -cake')), {'a.txt', 'c.txt'})
+        self.assertEqual(set(self.search('#work')), {'a.txt'})
+        self.assertEqual(set(self.search('-#party')), {'a.txt', 'c.txt'})
+        self.assertEqual(set(self.search('"release checklist"')), {'a.txt'})
+        self.assertEqual(set(self.search('release NEAR/3 checklist')), {'a.txt', 'b.txt'})
+
+        # the title match ranks first
+        self.assertEqual(self.search('budget')[0], 'c.txt')
+        self.assertEqual(len(self.search('rele', limit=2)), 2)
+
+        # an unfinished query doesn't raise
+        self.assertEqual(self.search('"'), ['a.txt', 'b.txt', 'c.txt'])
+
+    def test_snippets(self):
+        snippets = self.index.snippets('cake', ['a.txt', 'b.txt'], before='[', after=']')
+        self.assertEqual(list(snippets.keys()), ['b.txt'])
+        self.assertIn('[cake]', snippets['b.txt'])
+
+    def test_update_remove_rename(self):
+        self.index.update_note('b.txt', 'Nothing to see here.')
+        self.assertEqual(self.search('cake'), [])
+        self.assertEqual(self.search('#fun'), ['b.txt'])
+
+        self.index.rename_note('b.txt', 'd.txt')
+        self.assertEqual(self.search('#fun'), ['d.txt'])
+        self.index.remove_note('d.txt')
+        self.assertNotIn('d.txt', self.index)
+        self.assertEqual(self.search('#fun'), [])
+
+        # changes are kept after a commit
+        self.index.close()
+        self.index = FullTextIndex(self.filepath)
+        self.assertEqual(self.index.notes, {'a.txt', 'c.txt'})
+        self.assertEqual(set(self.search('budget')), {'a.txt', 'c.txt'})
+
+    def tearDown(self):
+        self.index.connection.close()
+        if os.path.exists(os.path.join(TESTER_NOTES_PATH, NOTE_DATA_DIR)):
+            shutil.rmtree(os.path.join(TESTER_NOTES_PATH, NOTE_DATA_DIR))
+
+
+if __name__ == '__main__':
+    unittest.main()
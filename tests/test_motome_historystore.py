@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_motome_historystore
+----------------------------------
+
+Tests for `Motome.Models.HistoryStore`
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from Motome.Models.HistoryStore import HistoryStore
+from Motome.Models.NoteModel import NoteModel
+from Motome.config import HISTORY_FOLDER, NOTE_EXTENSION, ZIP_EXTENSION
+
+ZEN_TEXT_FILE = os.path.join(os.getcwd(), 'tests', 'zen.txt')
+
+
+def make_versions(count):
+    """ Versions of a note, each a line different from the one before
+    """
+    with open(ZEN_TEXT_FILE) as f:
+        lines = f.read().decode('utf-8').splitlines()
+    versions = []
+    for i in range(count):
+        lines[i % len(lines)] += ' (edit {0})'.format(i)
+        versions.append('\n'.join(lines) + '\n')
+    return versions
+
+
+def version_name(i):
+    return '201401{0:02d}120000'.format(i + 1) + NOTE_EXTENSION
+
+
+class TestHistoryStore(unittest.TestCase):
+
+    def setUp(self):
+        self.notes_dir = tempfile.mkdtemp()
+        self.zip_filepath = os.path.join(self.notes_dir, HISTORY_FOLDER, 'zen' + NOTE_EXTENSION + ZIP_EXTENSION)
+        self.versions = make_versions(10)
+
+    def tearDown(self):
+        shutil.rmtree(self.notes_dir)
+
+    def test_append_read(self):
+        store = HistoryStore(self.zip_filepath)
+        store.keyframe_interval = 4
+        self.assertEqual(store.versions(), [])
+        for i, data in enumerate(self.versions):
+            self.assertEqual(len(store.append(data, version_name(i))), i + 1)
+
+        versions = store.versions()
+        self.assertEqual([HistoryStore.is_patch(info) for info in versions], [False, True, True, True] * 2 +
+                         [False, True])
+        self.assertEqual(HistoryStore.version_name(versions[1]), version_name(1))
+        self.assertEqual(versions[1].date_time, (2014, 1, 2, 12, 0, 0))
+        for i, data in enumerate(self.versions):
+            self.assertEqual(store.read(i), data)
+        self.assertEqual(store.read(-1), self.versions[-1])
+
+    def test_same_second(self):
+        store = HistoryStore(self.zip_filepath)
+        store.keyframe_interval = 2
+        # a keyframe and then a patch recorded within one second
+        for data in self.versions[:3]:
+            store.append(data, version_name(0))
+        versions = store.versions()
+        self.assertEqual([info.filename for info in versions],
+                         [version_name(0), '20140101120000_1.txt.patch', '20140101120000_2.txt'])
+        self.assertEqual([info.date_time for info in versions], [(2014, 1, 1, 12, 0, 0)] * 3)
+        for i, data in enumerate(self.versions[:3]):
+            self.assertEqual(store.read(i), data)
+
+    def test_compresslevel(self):
+        sizes = []
+        for level in [0, 1, 9]:
+            zip_filepath = os.path.join(self.notes_dir, '{0}'.format(level) + ZIP_EXTENSION)
+            store = HistoryStore(zip_filepath)
+            store.compresslevel = level
+            for i, data in enumerate(self.versions[:3]):
+                store.append(data, version_name(i))
+            with zipfile.ZipFile(zip_filepath, 'r') as myzip:
+                self.assertIsNone(myzip.testzip())
+                sizes.append(sum(info.compress_size for info in myzip.infolist()))
+            for i, data in enumerate(self.versions[:3]):
+                self.assertEqual(store.read(i), data)
+        # level 0 stores the data as it is, 9 compresses it hardest
+        self.assertGreater(sizes[0], sizes[1])
+        self.assertGreaterEqual(sizes[1], sizes[2])
+
+    def test_whole_versions(self):
+        # an archive from before the patches
+        os.makedirs(os.path.dirname(self.zip_filepath))
+        with zipfile.ZipFile(self.zip_filepath, 'w') as myzip:
+            for i, data in enumerate(self.versions[:-1]):
+                myzip.writestr(zipfile.ZipInfo(version_name(i), (2014, 1, i + 1, 12, 0, 0)), data.encode('utf-8'))
+        store = HistoryStore(self.zip_filepath)
+        for i, data in enumerate(self.versions[:-1]):
+            self.assertEqual(store.read(i), data)
+
+        # the next version is a patch from the last whole one
+        store.append(self.versions[-1], version_name(len(self.versions) - 1))
+        self.assertTrue(HistoryStore.is_patch(store.versions()[-1]))
+        for i, data in enumerate(self.versions):
+            self.assertEqual(store.read(i), data)
+
+    def test_note_record(self):
+        note = NoteModel(os.path.join(self.notes_dir, 'zen' + NOTE_EXTENSION))
+        note.content = self.versions[0]
+        note.record()
+        note.content = self.versions[1]
+        note.save_to_file()
+        # recorded under a later name than the first version
+        entries, key = NoteModel.record_note_file(note.filepath, note.historypath, '20990101120000' + NOTE_EXTENSION)
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(key, HistoryStore(note.historypath).archive_key())
+        # written behind the note's back, it's seen once the cached archive key is too old
+        note.stat_ttl = 0
+
+        self.assertTrue(HistoryStore.is_patch(note.history[1]))
+        for i in range(2):
+            old_content, old_date = note.load_old_note(i)
+            self.assertEqual(NoteModel.parse_note_content(old_content)[0], self.versions[i])
+        self.assertEqual(old_date, '20990101120000')
+
+    def test_record_notes(self):
+        notes = []
+        for i, data in enumerate(self.versions[:5]):
+            note = NoteModel(os.path.join(self.notes_dir, 'zen{0}'.format(i) + NOTE_EXTENSION))
+            note.content = data
+            notes.append(note)
+        NoteModel.record_notes(notes, threads=3)
+        for note, data in zip(notes, self.versions):
+            self.assertTrue(note.is_saved)
+            self.assertTrue(note.recorded)
+            self.assertEqual(note.history, HistoryStore(note.historypath).entries())
+            # the recorded version is the note file
+            self.assertEqual(NoteModel.parse_note_content(note.load_old_note(0)[0])[0], data)
+            self.assertEqual(HistoryStore(note.historypath).read(0), NoteModel.enc_read(note.filepath))
+
+    def test_history_index(self):
+        note = NoteModel(os.path.join(self.notes_dir, 'zen' + NOTE_EXTENSION))
+        note.content = self.versions[0]
+        note.record()
+        history = note.history
+        self.assertEqual(history, HistoryStore(note.historypath).entries())
+
+        # the catalog row keeps a summary, a note built from it doesn't open the unchanged archive until the entries
+        # are asked for
+        mtime = int(os.stat(note.historypath).st_mtime)
+        os.utime(note.historypath, (mtime, mtime))
+        note.stat_ttl = 0
+        self.assertEqual(note.history, history)
+        row = note.catalog_record()
+        with open(note.historypath, 'r+b') as f:
+            f.write(b'not a zip')
+        os.utime(note.historypath, (mtime, mtime))
+        copy = NoteModel.from_catalog_record(self.notes_dir, row)
+        self.assertEqual(copy.history_count, len(history))
+        self.assertTrue(copy.recorded)
+        self.assertEqual(copy.catalog_record(), row)
+
+        # a changed archive is read again once the cached key is too old
+        os.remove(note.historypath)
+        copy.stat_ttl = 0
+        self.assertEqual(copy.history, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
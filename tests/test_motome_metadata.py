@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_motome_metadata
+----------------------------------
+
+Tests for `Motome.Models.Metadata`
+"""
+
+import unittest
+
+import yaml
+
+from Motome.Models.Metadata import dump_metadata, load_metadata
+from Motome.Models.NoteModel import NoteModel
+from Motome.config import YAML_BRACKET
+
+
+class TestMetadata(unittest.TestCase):
+
+    def test_round_trip(self):
+        for metadata in [{'title': 'Release checklist', 'tags': 'work todo', 'pinned': True, 'author': 'Me'},
+                         {'title': 'Plain', 'tags': ''},
+                         {'title': 'Pinned', 'pinned': 1}, {'title': 'Unpinned', 'pinned': 0, 'count': -12},
+                         # values YAML has to quote go through PyYAML
+                         {'title': 'yes', 'tags': 'a: b'},
+                         {'title': '2014', 'tags': '#tag', 'pinned': False},
+                         {'title': 'Keys', 'on': 'x', 'Yes': 'y', 'null': 'z', 'n': 'w'},
+                         {'title': 'Octal', 'tags': '012', 'count': 10 ** 20},
+                         {'title': ' padded ', 'tags': "'quoted'"},
+                         {'title': u'caf\xe9', 'count': 3, 'items': ['a', 'b']}]:
+            text = dump_metadata(metadata)
+            self.assertEqual(yaml.safe_load(text), metadata)
+            self.assertEqual(load_metadata(text), metadata)
+            # and the same as PyYAML reads what PyYAML wrote
+            text = yaml.safe_dump(metadata, default_flow_style=False)
+            self.assertEqual(load_metadata(text), yaml.safe_load(text))
+
+        self.assertEqual(dump_metadata({'title': 'Plain', 'pinned': True}), 'pinned: true\ntitle: Plain\n')
+        self.assertEqual(dump_metadata({'title': 'Plain', 'pinned': 1}), 'pinned: 1\ntitle: Plain\n')
+        # keys YAML reads as booleans or null aren't read as strings
+        for text in ['on: x\n', 'yes: x\ntitle: Plain\n', 'title: Plain\nNULL: x\n']:
+            self.assertEqual(load_metadata(text), yaml.safe_load(text))
+        self.assertRaises(yaml.YAMLError, load_metadata, 'title: [unclosed')
+
+    def test_parse_note_content(self):
+        data = 'Heading\n---\nbody\n' + YAML_BRACKET + '\n' + dump_metadata({'title': 'Heading'}) + YAML_BRACKET
+        # the brackets in the content are kept
+        self.assertEqual(NoteModel.parse_note_content(data), ('Heading\n---\nbody\n', {'title': 'Heading'}))
+        # no valid metadata, it's all content
+        for data in ['no metadata', 'one ---\nbracket', 'a\n---\nnot: metadata\n---\n']:
+            self.assertEqual(NoteModel.parse_note_content(data), (data, dict()))
+
+
+if __name__ == '__main__':
+    unittest.main()
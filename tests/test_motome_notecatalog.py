@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_motome_notecatalog
+----------------------------------
+
+Tests for `Motome.Models.NoteCatalog`
+"""
+
+import glob
+import os
+import shutil
+import time
+import unittest
+
+from Motome.Models.HistoryStore import HistoryStore
+from Motome.Models.NoteCatalog import NoteCatalog
+from Motome.Models.NoteIndex import NoteIndex
+from Motome.Models.NoteModel import NoteModel
+from Motome.config import NOTE_EXTENSION, NOTE_DATA_DIR, HISTORY_FOLDER
+
+TESTER_NOTES_PATH = os.path.join(os.getcwd(), 'tests', 'notes_for_testing')
+
+
+class TestNoteCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog_path = os.path.join(TESTER_NOTES_PATH, NOTE_DATA_DIR, 'Motome_catalog.db')
+        self.catalog = NoteCatalog(self.catalog_path, TESTER_NOTES_PATH)
+        self.notepaths = set(glob.glob(TESTER_NOTES_PATH + '/*' + NOTE_EXTENSION))
+        for filepath in self.notepaths:
+            note = NoteModel(filepath)
+            note.content  # read the note so its metadata is cataloged
+            self.catalog[note.filename] = note
+
+    def test_mapping(self):
+        self.assertEqual(len(self.catalog), len(self.notepaths))
+        for filepath in self.notepaths:
+            self.assertIn(os.path.basename(filepath), self.catalog)
+        self.assertNotIn('missing.txt', self.catalog)
+        self.assertRaises(KeyError, lambda: self.catalog['missing.txt'])
+
+        # the rows are built from what's in memory, the note files aren't stat'ed on the GUI thread
+        stat_calls = NoteModel.stat_calls
+        for note in self.catalog.loaded_notes:
+            note.invalidate_stat()
+            self.catalog.update_note(note)
+        self.assertEqual(NoteModel.stat_calls, stat_calls)
+
+    def test_commit_reload(self):
+        self.assertFalse(self.catalog.is_saved)
+        self.catalog.close()
+        self.assertTrue(self.catalog.is_saved)
+
+        reloaded = NoteCatalog(self.catalog_path, TESTER_NOTES_PATH)
+        self.assertEqual(set(reloaded), set(os.path.basename(p) for p in self.notepaths))
+        for filepath in self.notepaths:
+            note = NoteModel(filepath)
+            note.content
+            cataloged = reloaded[note.filename]
+            self.assertIs(cataloged.catalog, reloaded)
+            self.assertEqual(cataloged.filepath, note.filepath)
+            self.assertEqual(cataloged.title, note.title)
+            self.assertEqual(cataloged.metadata, note.metadata)
+
+        # a removed note stays removed
+        filename = os.path.basename(sorted(self.notepaths)[0])
+        del reloaded[filename]
+        reloaded.close()
+        self.assertNotIn(filename, NoteCatalog(self.catalog_path, TESTER_NOTES_PATH))
+
+    def test_summary(self):
+        self.catalog.close()
+        reloaded = NoteCatalog(self.catalog_path, TESTER_NOTES_PATH)
+        for filepath in self.notepaths:
+            note = NoteModel(filepath)
+            mtime = os.stat(filepath).st_mtime
+            # read from the row without building the note
+            self.assertEqual(reloaded.summary(note.filename), (note.title, note.pinned))
+            self.assertFalse(reloaded.is_stale(note.filename, mtime))
+            self.assertTrue(reloaded.is_stale(note.filename, mtime + 10))
+        self.assertEqual(len(reloaded.loaded_notes), 0)
+
+        # built notes get the catalog's indexes
+        index = NoteIndex()
+        reloaded.set_indexes(index, None)
+        note = reloaded[os.path.basename(sorted(self.notepaths)[0])]
+        self.assertIs(note.index, index)
+        self.assertEqual(reloaded.loaded_notes, [note])
+        reloaded.connection.close()
+
+    def test_unload(self):
+        filename = os.path.basename(sorted(self.notepaths)[0])
+        note = self.catalog[filename]
+        note.pinned = True
+        # unsaved changes keep the note
+        self.assertFalse(self.catalog.unload(filename))
+        note.is_saved = True
+        self.assertTrue(self.catalog.unload(filename))
+        self.assertNotIn(note, self.catalog.loaded_notes)
+        self.assertEqual(self.catalog.summary(filename), (note.title, True))
+
+        # built again from the staged row, then from the committed one
+        self.assertTrue(self.catalog[filename].pinned)
+        self.catalog.commit()
+        self.assertTrue(self.catalog.unload(filename))
+        rebuilt = self.catalog[filename]
+        self.assertIsNot(rebuilt, note)
+        self.assertTrue(rebuilt.pinned)
+        self.assertEqual(rebuilt.metadata, note.metadata)
+
+    def test_unrecorded(self):
+        filenames = sorted(os.path.basename(p) for p in self.notepaths)
+        note = self.catalog[filenames[0]]
+        now = time.time()
+        HistoryStore(note.historypath).append(note.note_file_data(note.content, note.metadata),
+                                              time.strftime('%Y%m%d%H%M%S', time.localtime(now)) + NOTE_EXTENSION)
+        self.assertEqual(note.history_count, 1)
+        self.catalog.update_note(note)
+        self.catalog.commit()
+        self.assertTrue(self.catalog.unload(filenames[0]))
+
+        # the recorded note is told from its summary without building it, the rest have no history
+        listed = [(filename, now) for filename in filenames]
+        self.assertEqual(self.catalog.unrecorded(listed), filenames[1:])
+        self.assertNotIn(filenames[0], [n.filename for n in self.catalog.loaded_notes])
+        # a newer file version isn't recorded, notes not in the catalog are left out
+        self.assertEqual(self.catalog.unrecorded([(filenames[0], now + 60), ('missing.txt', now)]), [filenames[0]])
+
+    def test_word_index(self):
+        index = self.catalog.index
+        self.assertIs(index.connection, self.catalog.connection)
+        index.update_note('a.txt', 'the release checklist is ready'.split())
+        index.update_note('b.txt', 'checklist for the release party'.split())
+        self.assertFalse(self.catalog.is_saved)
+        self.catalog.close()
+
+        # committed with the rows and read back from the catalog database
+        reloaded = NoteCatalog(self.catalog_path, TESTER_NOTES_PATH)
+        index = reloaded.index
+        self.assertEqual(index.notes_with_phrase(('release', 'checklist')), {'a.txt'})
+        self.assertEqual(index.notes_near('release', 'party', 1), {'b.txt'})
+        index.remove_note('a.txt')
+        index.rename_note('b.txt', 'c.txt')
+        reloaded.close()
+        self.assertEqual(NoteCatalog(self.catalog_path, TESTER_NOTES_PATH).index.notes, {'c.txt'})
+
+    def test_failed_commit(self):
+        self.catalog.commit()
+        filepaths = sorted(self.notepaths)
+        filename = os.path.basename(filepaths[0])
+        note = self.catalog[filename]
+        self.catalog.connection.execute('CREATE TRIGGER full BEFORE INSERT ON notes '
+                                        "BEGIN SELECT RAISE(ABORT, 'full'); END")
+        self.catalog.index.update_note(filename, ['lost'])
+        self.catalog.update_note(note)
+        self.catalog.commit()
+
+        # the index changes are rolled back with the rows, the row is kept for the next try without its file version
+        self.assertNotIn(filename, self.catalog.index)
+        self.assertFalse(self.catalog.is_saved)
+        self.catalog.connection.execute('DROP TRIGGER full')
+        self.catalog.close()
+        reloaded = NoteCatalog(self.catalog_path, TESTER_NOTES_PATH)
+        self.assertNotIn(filename, reloaded.index)
+        self.assertTrue(reloaded.is_stale(filename, os.stat(filepaths[0]).st_mtime))
+        self.assertFalse(reloaded.is_stale(os.path.basename(filepaths[1]), os.stat(filepaths[1]).st_mtime))
+
+    def test_history_read(self):
+        self.catalog.close()
+        reloaded = NoteCatalog(self.catalog_path, TESTER_NOTES_PATH)
+        filename = os.path.basename(sorted(self.notepaths)[0])
+        note = reloaded[filename]
+        self.assertEqual(note.history, [])
+        self.assertEqual(note.history_count, 0)
+        # reading the history doesn't stage the row
+        self.assertTrue(reloaded.is_saved)
+        reloaded.close()
+
+    def tearDown(self):
+        try:
+            self.catalog.connection.close()
+        except Exception:
+            pass
+        if os.path.exists(os.path.join(TESTER_NOTES_PATH, NOTE_DATA_DIR)):
+            shutil.rmtree(os.path.join(TESTER_NOTES_PATH, NOTE_DATA_DIR))
+        if os.path.exists(os.path.join(TESTER_NOTES_PATH, HISTORY_FOLDER)):
+            shutil.rmtree(os.path.join(TESTER_NOTES_PATH, HISTORY_FOLDER))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_motome_noteindex
+----------------------------------
+
+Tests for `Motome.Models.NoteIndex`
+"""
+
+import glob
+import os
+import shutil
+import unittest
+
+from Motome.Models.NoteIndex import NoteIndex
+from Motome.Models.NoteModel import NoteModel
+from Motome.Models.Search import SearchModel
+from Motome.Models.Vocabulary import split_words
+from Motome.config import NOTE_EXTENSION, NOTE_DATA_DIR
+
+TESTER_NOTES_PATH = os.path.join(os.getcwd(), 'tests', 'notes_for_testing')
+
+
+class TestNoteIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = NoteIndex()
+        self.index.update_note('meeting.txt', ['meeting', 'notes', 'work'])
+        self.index.update_note('party.txt', ['party', 'notes', 'cake'])
+        self.index.update_note('project.txt', ['project', 'plan', 'work'])
+
+    def test_update_remove(self):
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.word_counts('notes', 'exact'), {'notes': {'meeting.txt': 1, 'party.txt': 1}})
+
+        # changing a note only moves its own postings
+        self.index.update_note('party.txt', ['party', 'balloons', 'balloons'])
+        self.assertEqual(self.index.word_counts('notes', 'exact'), {'notes': {'meeting.txt': 1}})
+        self.assertNotIn('cake', self.index.terms)
+        self.assertEqual(self.index.word_counts('balloons', 'exact'), {'balloons': {'party.txt': 2}})
+        self.assertEqual(self.index.note_details(['party.txt']), {'party.txt': (3, set(), set())})
+
+        self.index.remove_note('meeting.txt')
+        self.assertNotIn('meeting.txt', self.index)
+        self.assertNotIn('notes', self.index.terms)
+        self.assertEqual(self.index.notes_with_word('work', 'exact'), {'project.txt'})
+
+    def test_rename(self):
+        self.index.rename_note('party.txt', 'celebration.txt')
+        self.assertNotIn('party.txt', self.index)
+        self.assertEqual(self.index.notes_with_word('cake', 'exact'), {'celebration.txt'})
+        self.assertEqual(self.index.positions_of('celebration.txt'), {'party': [0], 'notes': [1], 'cake': [2]})
+
+    def test_notes_with_word(self):
+        self.assertEqual(self.index.notes_with_word('work'), {'meeting.txt', 'project.txt'})
+        self.assertEqual(self.index.notes_with_word('not'), {'meeting.txt', 'party.txt'})
+        self.assertEqual(self.index.notes_with_word('missing'), set())
+
+        # match modes
+        self.assertEqual(self.index.notes_with_word('ote', 'prefix'), set())
+        self.assertEqual(self.index.notes_with_word('ote', 'substring'), {'meeting.txt', 'party.txt'})
+        self.assertEqual(self.index.notes_with_word('not', 'exact'), set())
+        self.assertEqual(self.index.notes_with_word('notes', 'exact'), {'meeting.txt', 'party.txt'})
+
+    def test_terms_with_prefix(self):
+        self.assertEqual(self.index.terms_with_prefix('p'), ['party', 'plan', 'project'])
+        self.assertEqual(self.index.terms_with_prefix('pro'), ['project'])
+        self.assertEqual(self.index.terms_with_prefix('zzz'), [])
+
+        # the sorted vocabulary follows new words
+        self.index.update_note('prose.txt', ['prose'])
+        self.assertEqual(self.index.terms_with_prefix('pro'), ['project', 'prose'])
+        self.index.remove_note('project.txt')
+        self.assertEqual(self.index.terms_with_prefix('pro'), ['prose'])
+
+    def test_tags(self):
+        self.index.update_note_tags('meeting.txt', ['work', '#Meetings'])
+        self.index.update_note_tags('party.txt', ['party', 'fun'])
+        self.index.update_note_tags('project.txt', ['work'])
+        self.assertEqual(self.index.tags, ['fun', 'meetings', 'party', 'work'])
+        self.assertEqual(self.index.notes_with_tag('work'), {'meeting.txt', 'project.txt'})
+        self.assertEqual(self.index.notes_with_tag('#meetings'), {'meeting.txt'})
+
+        # tags match exactly
+        self.assertEqual(self.index.notes_with_tag('art'), set())
+        self.assertEqual(self.index.notes_with_tag('wor'), set())
+
+        search = SearchModel()
+        search.query = 'notes #work'
+        self.assertEqual(search.search_index(self.index), {'meeting.txt'})
+        search.query = 'notes -#work'
+        self.assertEqual(search.search_index(self.index), {'party.txt'})
+
+        self.index.update_note_tags('project.txt', [])
+        self.assertEqual(self.index.notes_with_tag('work'), {'meeting.txt'})
+        self.index.rename_note('meeting.txt', 'standup.txt')
+        self.assertEqual(self.index.notes_with_tag('work'), {'standup.txt'})
+        self.index.remove_note('standup.txt')
+        self.assertEqual(self.index.tags, ['fun', 'party'])
+
+    def test_search_index(self):
+        search = SearchModel()
+        search.query = 'notes -cake'
+        self.assertEqual(search.search_index(self.index), {'meeting.txt'})
+        search.query = 'work pla'
+        self.assertEqual(search.search_index(self.index), {'project.txt'})
+
+    def test_search_refinement(self):
+        search = SearchModel()
+        search.query = 'no'
+        self.assertEqual(search.search_index(self.index), {'meeting.txt', 'party.txt'})
+
+        # a longer word and an extra word only filter the earlier results
+        search._results_cache[search.query_key] = {'meeting.txt'}
+        search.query = 'notes work'
+        self.assertEqual(search.search_index(self.index), {'meeting.txt'})
+
+        # backspacing gets the cached results back
+        search.query = 'no'
+        self.assertEqual(search.search_index(self.index), {'meeting.txt'})
+
+        # not a refinement, starts from all the notes
+        search.query = 'party'
+        self.assertEqual(search.search_index(self.index), {'party.txt'})
+
+        # changing the index drops the cache
+        self.index.update_note('plans.txt', ['notes'])
+        search.query = 'no'
+        self.assertEqual(search.search_index(self.index), {'meeting.txt', 'party.txt', 'plans.txt'})
+
+    def test_search_ranked(self):
+        index = NoteIndex()
+        index.update_note('a.txt', {'budget': 1, 'meeting': 1, 'lunch': 8})
+        index.update_note('b.txt', {'budget': 5, 'review': 2})
+        index.update_note('c.txt', {'budget': 1, 'plan': 1})
+        index.update_note('d.txt', {'holiday': 3})
+        index.update_note_title('c.txt', 'Budget Plan')
+
+        search = SearchModel()
+        search.query = 'budget'
+        ranking = search.search_ranked(index)
+        self.assertEqual(len(ranking), 3)
+        self.assertEqual([filename for __, filename in ranking][:2], ['c.txt', 'b.txt'])
+
+        # only the best results are kept
+        self.assertEqual(search.search_ranked(index, limit=1), ranking[:1])
+
+        # tags boost too, and partial words are ranked
+        scores = dict((filename, score) for score, filename in ranking)
+        index.update_note_tags('a.txt', ['budget'])
+        search.query = 'bud'
+        new_scores = dict((filename, score) for score, filename in search.search_ranked(index))
+        self.assertAlmostEqual(new_scores['a.txt'], scores['a.txt'] * search.tag_boost)
+        self.assertAlmostEqual(new_scores['b.txt'], scores['b.txt'])
+
+    def test_phrase_near(self):
+        index = NoteIndex()
+        index.update_note('a.txt', 'the release checklist is ready'.split())
+        index.update_note('b.txt', 'checklist for the release party'.split())
+        index.update_note('c.txt', 'release notes then a long checklist'.split())
+        self.assertEqual(index.word_counts('release', 'exact')['release']['a.txt'], 1)
+        self.assertEqual(index.positions_of('a.txt')['checklist'], [2])
+        self.assertEqual(index.positions_of('c.txt'), {'release': [0], 'notes': [1], 'then': [2], 'a': [3],
+                                                       'long': [4], 'checklist': [5]})
+
+        self.assertEqual(index.notes_with_phrase(('release', 'checklist')), {'a.txt'})
+        self.assertEqual(index.notes_with_phrase(('the', 'release')), {'a.txt', 'b.txt'})
+        self.assertEqual(index.notes_near('release', 'checklist', 1), {'a.txt'})
+        self.assertEqual(index.notes_near('release', 'checklist', 3), {'a.txt', 'b.txt'})
+        self.assertEqual(index.notes_near('rel', 'check', 5), {'a.txt', 'b.txt', 'c.txt'})
+
+        search = SearchModel()
+        search.query = '"release checklist"'
+        self.assertEqual(search.use_phrases, [('release', 'checklist')])
+        self.assertEqual(search.search_index(index), {'a.txt'})
+        search.query = 'release -"release party'
+        self.assertEqual(search.search_index(index), {'a.txt', 'c.txt'})
+
+        # the last word of a phrase still being typed is a partial word
+        self.assertEqual(index.notes_with_phrase(('release', 'che')), set())
+        self.assertEqual(index.notes_with_phrase(('release', 'che'), last_mode='prefix'), {'a.txt'})
+        search.query = '"release che'
+        self.assertEqual(search.open_phrase, (False, ('release', 'che')))
+        self.assertEqual(search.search_index(index), {'a.txt'})
+        self.assertEqual(search.fulltext_query[0], '({title content} : "release che"*)')
+        search.query = '"release che"'
+        self.assertIsNone(search.open_phrase)
+        self.assertEqual(search.search_index(index), set())
+        search.query = '"the rel'
+        self.assertEqual(search.search_index(index), {'a.txt', 'b.txt'})
+        search.query = 'release -"the rel'
+        self.assertEqual(search.search_index(index), {'c.txt'})
+        search.query = 'release NEAR/3 checklist'
+        self.assertEqual(search.use_near, [('release', 'checklist', 3)])
+        self.assertEqual(search.use_words, [])
+        self.assertEqual(search.search_index(index), {'a.txt', 'b.txt'})
+
+        # a partly typed operator is skipped
+        search.query = 'release near/'
+        self.assertEqual(search.use_words, ['release'])
+        self.assertEqual(search.search_index(index), {'a.txt', 'b.txt', 'c.txt'})
+
+    def test_notemodel_updates(self):
+        index = NoteIndex()
+        for filepath in glob.glob(TESTER_NOTES_PATH + '/*' + NOTE_EXTENSION):
+            note = NoteModel(filepath)
+            note.index = index
+            self.assertIsNone(index.positions_of(note.filename))
+            note.content  # reading the note indexes it
+            positions = index.positions_of(note.filename)
+            self.assertEqual(set(positions), set(split_words(note.content)[0]))
+            length = index.note_details([note.filename])[note.filename][0]
+            self.assertEqual(length, sum(len(places) for places in positions.values()))
+
+    def tearDown(self):
+        if os.path.exists(os.path.join(TESTER_NOTES_PATH, NOTE_DATA_DIR)):
+            shutil.rmtree(os.path.join(TESTER_NOTES_PATH, NOTE_DATA_DIR))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_motome_notelistmodel
+----------------------------------
+
+Tests for `Motome.Models.NoteListModel`
+"""
+
+import unittest
+
+from Motome.Models.NoteListModel import NoteListModel, NoteFilterModel
+
+
+class TestNoteListModel(unittest.TestCase):
+
+    def setUp(self):
+        self.model = NoteListModel()
+        self.model.set_notes([('a.txt', 'A', False, 1.0),
+                              ('b.txt', 'B', True, 0.5),
+                              ('c.txt', 'C', False, 3.0),
+                              ('d.txt', 'D', False, 2.0)])
+
+    def test_order(self):
+        # pinned first, then newest first
+        self.assertEqual(self.model.filenames, ['b.txt', 'c.txt', 'd.txt', 'a.txt'])
+        self.assertEqual(self.model.titles, ['B', 'C', 'D', 'A'])
+        self.assertEqual(self.model.row_of('d.txt'), 2)
+        self.assertIsNone(self.model.row_of('missing.txt'))
+
+    def test_add_remove(self):
+        self.model.add_note(('e.txt', 'E', False, 2.5))
+        self.assertEqual(self.model.filenames, ['b.txt', 'c.txt', 'e.txt', 'd.txt', 'a.txt'])
+        self.model.remove_note('c.txt')
+        self.model.remove_note('missing.txt')
+        self.assertEqual(self.model.filenames, ['b.txt', 'e.txt', 'd.txt', 'a.txt'])
+        self.assertEqual(list(self.model.mtimes), [0.5, 2.5, 2.0, 1.0])
+
+    def test_update(self):
+        # saved
+        self.model.update_note('a.txt', ('a.txt', 'A', False, 10.0))
+        self.assertEqual(self.model.filenames, ['b.txt', 'a.txt', 'c.txt', 'd.txt'])
+        # pinned
+        self.model.update_note('d.txt', ('d.txt', 'D', True, 2.0))
+        self.assertEqual(self.model.filenames, ['d.txt', 'b.txt', 'a.txt', 'c.txt'])
+        self.assertEqual(list(self.model.pinned), [1, 1, 0, 0])
+        # renamed
+        self.model.update_note('c.txt', ('e.txt', 'E', False, 3.0))
+        self.assertEqual(self.model.filenames, ['d.txt', 'b.txt', 'a.txt', 'e.txt'])
+        self.assertEqual(self.model.titles, ['D', 'B', 'A', 'E'])
+
+    def test_update_many(self):
+        # retitled in place, and pinned
+        self.model.update_notes([('a.txt', 'A2', False, 1.0), ('c.txt', 'C2', False, 3.0),
+                                 ('d.txt', 'D', True, 2.0)])
+        self.assertEqual(self.model.filenames, ['d.txt', 'b.txt', 'c.txt', 'a.txt'])
+        self.assertEqual(self.model.titles, ['D', 'B', 'C2', 'A2'])
+        self.assertEqual(self.model.row_of('a.txt'), 3)
+
+    def test_row_map_kept(self):
+        # the row map is kept up to date through moves, renames, adds and removes instead of being rebuilt
+        self.model.row_of('a.txt')
+        row_map = self.model._row_map
+        self.model.update_notes([('a.txt', 'A', False, 10.0), ('c.txt', 'C', True, 3.0), ('d.txt', 'D', False, 0.1),
+                                 ('e.txt', 'E', False, 2.5)])
+        self.model.update_note('b.txt', ('f.txt', 'F', True, 0.5))
+        self.model.remove_note('d.txt')
+        self.assertIs(self.model._row_map, row_map)
+        self.assertEqual(self.model.filenames, ['c.txt', 'f.txt', 'a.txt', 'e.txt'])
+        self.assertEqual(row_map, dict((filename, i) for i, filename in enumerate(self.model.filenames)))
+
+        # a big batch is sorted at once, to the same order
+        self.model.move_batch_limit = 1
+        self.model.persistentIndexList = lambda: []  # no views to keep on their rows
+        self.model.update_notes([('a.txt', 'A', False, 0.2), ('e.txt', 'E', True, 2.5), ('g.txt', 'G', False, 1.0)])
+        self.assertEqual(self.model.filenames, ['c.txt', 'e.txt', 'f.txt', 'g.txt', 'a.txt'])
+        self.assertEqual(self.model._row_map,
+                         dict((filename, i) for i, filename in enumerate(self.model.filenames)))
+
+    def test_merge(self):
+        self.model.merge_notes([('e.txt', 'E', True, 9.0), ('a.txt', 'A', False, 4.0)])
+        self.assertEqual(self.model.filenames, ['e.txt', 'b.txt', 'a.txt', 'c.txt', 'd.txt'])
+
+
+class TestNoteFilterModel(unittest.TestCase):
+
+    def setUp(self):
+        self.model = NoteListModel()
+        self.model.set_notes([('a.txt', 'A', False, 4.0),
+                              ('b.txt', 'B', False, 3.0),
+                              ('c.txt', 'C', False, 2.0),
+                              ('d.txt', 'D', False, 1.0)])
+        self.filter_model = NoteFilterModel()
+        self.filter_model.setSourceModel(self.model)
+
+    def shown(self, count):
+        return [self.model.filenames[self.filter_model.source_row(row)] for row in range(count)]
+
+    def apply(self, found, ranks=None):
+        # what set_results does between telling the views about the layout change
+        self.filter_model.found = found
+        self.filter_model.ranks = ranks
+        self.filter_model._update_rows()
+
+    def test_row_map(self):
+        self.assertEqual(self.shown(4), ['a.txt', 'b.txt', 'c.txt', 'd.txt'])
+
+        self.apply({'b.txt', 'd.txt'})
+        self.assertEqual(self.shown(2), ['b.txt', 'd.txt'])
+        self.assertEqual(self.filter_model.shown_row(3), 1)
+        self.assertEqual(self.filter_model.shown_row(0), -1)
+
+        # ranked notes first, the other found notes after them in date order
+        self.apply({'a.txt', 'b.txt', 'c.txt'}, {'c.txt': 0, 'b.txt': 1})
+        self.assertEqual(self.shown(3), ['c.txt', 'b.txt', 'a.txt'])
+        self.assertEqual(self.filter_model.shown_row(2), 0)
+
+        self.apply(None)
+        self.assertEqual(self.filter_model.shown_row(2), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
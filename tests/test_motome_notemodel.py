@@ -43,7 +43,6 @@ class TestNoteModel(unittest.TestCase):
         self.assertEqual(zen_note.timestamp, -1)
         self.assertEqual(zen_note.metadata, dict())
         self.assertEqual(zen_note.history, list())
-        self.assertEqual(zen_note.wordset, '')
         self.assertFalse(zen_note.recorded)
         self.assertFalse(zen_note.pinned)
 
@@ -61,7 +60,6 @@ class TestNoteModel(unittest.TestCase):
         self.assertEqual(zen_note.timestamp, -1)
         self.assertEqual(zen_note.metadata, dict())
         self.assertEqual(zen_note.history, list())
-        self.assertEqual(zen_note.wordset, '')
         self.assertFalse(zen_note.recorded)
         self.assertFalse(zen_note.pinned)
 
@@ -133,6 +131,121 @@ class TestNoteModel(unittest.TestCase):
             filedata = filedata + '{0}:{1}\n'.format(key, value)
         NoteModel.enc_write(filepath, filedata)
 
+    def test_stat_cache(self):
+        filepath = sorted(self.notepaths)[0]
+        mtime = int(os.stat(filepath).st_mtime)
+        os.utime(filepath, (mtime, mtime))
+        note = NoteModel(filepath)
+        note.content
+
+        # reading the note's properties again doesn't stat the file
+        stat_calls = NoteModel.stat_calls
+        self.assertEqual(note.timestamp, mtime)
+        note.pinned
+        note.content
+        self.assertEqual(note.timestamp, mtime)
+        self.assertEqual(NoteModel.stat_calls - stat_calls, 0)
+
+        # a change on disk is seen after invalidating
+        os.utime(filepath, (mtime + 10, mtime + 10))
+        self.assertEqual(note.timestamp, mtime)
+        note.invalidate_stat()
+        self.assertEqual(note.timestamp, mtime + 10)
+        self.assertEqual(NoteModel.stat_calls - stat_calls, 1)
+
+        # or once the cached stat is too old
+        os.utime(filepath, (mtime, mtime))
+        note.stat_ttl = 0
+        self.assertEqual(note.timestamp, mtime)
+
+    def test_metadata_only(self):
+        for filepath in self.notepaths:
+            content, metadata = NoteModel.parse_note_content(NoteModel.enc_read(filepath))
+            self.assertEqual(NoteModel.read_metadata(filepath), metadata)
+
+        # a trailer bigger than the first block read
+        filepath = os.path.join(TESTER_NOTES_PATH, 'zen_meta' + NOTE_EXTENSION)
+        note = NoteModel(filepath)
+        note.content = 'Beautiful is better than ugly.\n'
+        note.metadata = {'title': 'zen meta', 'tags': 'python zen'}
+        note.save_to_file()
+        note = NoteModel(filepath)
+        note.trailer_block_size = 8
+        self.assertEqual(note.title, 'zen meta')
+        self.assertEqual(note.metadata['tags'], 'python zen')
+        self.assertEqual(note._content, '')
+
+        # unsaved metadata changes are kept when the content is read and saved
+        note.pinned = True
+        note.save_to_file()
+        note = NoteModel(filepath)
+        self.assertTrue(note.pinned)
+        self.assertEqual(note.content, 'Beautiful is better than ugly.\n')
+
+    def test_unsaved_notes(self):
+        filepath = os.path.join(TESTER_NOTES_PATH, 'zen_unsaved' + NOTE_EXTENSION)
+        note = NoteModel(filepath)
+        self.assertNotIn(note, NoteModel.unsaved_notes())
+        note.content = 'Flat is better than nested.\n'
+        self.assertIn(note, NoteModel.unsaved_notes())
+        note.save_to_file()
+        self.assertNotIn(note, NoteModel.unsaved_notes())
+
+        # a write that fails leaves it unsaved
+        note.content = 'Errors should never pass silently.\n'
+        self.assertRaises(EnvironmentError, note.save_to_file, os.path.join(TESTER_NOTES_PATH, 'missing', 'zen.txt'))
+        self.assertIn(note, NoteModel.unsaved_notes())
+
+        note.pinned = True
+        self.assertIn(note, NoteModel.unsaved_notes())
+        # the saved session data doesn't carry it
+        self.assertNotIn('_is_saved', note.__getstate__())
+        # notes nothing else keeps aren't saved
+        del note
+        self.assertEqual([n for n in NoteModel.unsaved_notes() if n.filepath == filepath], [])
+
+    def test_unchanged_save(self):
+        filepath = os.path.join(TESTER_NOTES_PATH, 'zen_unchanged' + NOTE_EXTENSION)
+        note = NoteModel(filepath)
+        note.content = 'Sparse is better than dense.\n'
+        note.save_to_file()
+        os.chmod(filepath, 0o640)
+        note.pinned = True
+        note.save_to_file()
+        # written through a temporary file that took the note file's place
+        self.assertEqual(os.listdir(TESTER_NOTES_PATH).count('.zen_unchanged' + NOTE_EXTENSION + '.tmp'), 0)
+        self.assertEqual(os.stat(filepath).st_mode & 0o777, 0o640)
+        written = os.stat(filepath)
+
+        # the same data isn't written again
+        note.pinned = True
+        note.save_to_file()
+        self.assertEqual(os.stat(filepath).st_ino, written.st_ino)
+
+        # unless something else changed the file
+        NoteModel.enc_write(filepath, 'changed elsewhere\n')
+        note.save_to_file()
+        self.assertEqual(NoteModel.parse_note_content(NoteModel.enc_read(filepath))[0],
+                         'Sparse is better than dense.\n')
+
+    def test_write_note_file(self):
+        filepath = os.path.join(TESTER_NOTES_PATH, 'zen_written' + NOTE_EXTENSION)
+        metadata = {'title': 'zen_written'}
+        # the write job only works from its arguments, what it wrote comes back with the result
+        stat, written = NoteModel.write_note_file(filepath, 'Readability counts.\n', metadata)
+        self.assertEqual(written[1:], (stat.st_mtime, stat.st_size, stat.st_ino))
+        same_stat, same_written = NoteModel.write_note_file(filepath, 'Readability counts.\n', metadata, written)
+        self.assertEqual(same_written, written)
+        self.assertEqual(same_stat.st_ino, stat.st_ino)
+
+        # the note takes it once the write is done
+        note = NoteModel(filepath)
+        note.content = 'Readability counts.\n'
+        note._write_done(filepath, None, (stat, written), None)
+        self.assertEqual(note._written, written)
+        note._write_done(filepath + '.bak', None, (stat, None), None)
+        self.assertEqual(note._written, written)
+
     def tearDown(self):
         # Clear out any vestiges of the zen files
         zenpaths = glob.glob(TESTER_NOTES_PATH + '/zen*' + NOTE_EXTENSION)
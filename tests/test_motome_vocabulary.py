@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_motome_vocabulary
+----------------------------------
+
+Tests for `Motome.Models.Vocabulary`
+"""
+
+import unittest
+
+from Motome.Models.Vocabulary import split_words
+
+
+class TestVocabulary(unittest.TestCase):
+
+    def test_split_words(self):
+        distinct, indexes = split_words('The cat and the Hat, the end.')
+        self.assertEqual(sorted(distinct), ['and', 'cat', 'end', 'hat', 'the'])
+        self.assertEqual([distinct[i] for i in indexes], ['the', 'cat', 'and', 'the', 'hat', 'the', 'end'])
+        distinct, indexes = split_words('')
+        self.assertEqual((distinct, list(indexes)), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()